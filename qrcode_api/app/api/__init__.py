@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from qrcode_api.app.api import v1
+from qrcode_api.app.api import v1, health, redirect
 
 
 router = APIRouter(prefix="/api")
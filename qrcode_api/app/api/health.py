@@ -0,0 +1,92 @@
+import os
+import shutil
+
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+
+from qrcode_api.app import schemas
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.core.render import render_coalescer, render_pool
+from qrcode_api.app.db import database
+from qrcode_api.app.middleware.admission import AdmissionRoute
+
+router = APIRouter(route_class=AdmissionRoute)
+
+
+async def check_database() -> schemas.ComponentHealth:
+    reachable = await database.ping_db()
+    return schemas.ComponentHealth(
+        status=schemas.HealthStatus.ok
+        if reachable
+        else schemas.HealthStatus.unavailable,
+        details={
+            "initialized": database.db_initialized.is_set(),
+            "reachable": reachable,
+            "pool": database.pool_stats.as_dict(),
+        },
+    )
+
+
+def check_render_pool() -> schemas.ComponentHealth:
+    return schemas.ComponentHealth(
+        status=schemas.HealthStatus.degraded
+        if render_pool.is_saturated
+        else schemas.HealthStatus.ok,
+        details={**render_pool.stats(), "coalescing": render_coalescer.stats()},
+    )
+
+
+def check_disk() -> schemas.ComponentHealth:
+    try:
+        usage = shutil.disk_usage(settings.STATIC_PATH)
+    except OSError as error:
+        return schemas.ComponentHealth(
+            status=schemas.HealthStatus.unavailable,
+            details={"path": settings.STATIC_PATH, "error": str(error)},
+        )
+
+    free_mb = usage.free // (1024 * 1024)
+    writable = os.access(settings.STATIC_PATH, os.W_OK)
+    healthy = writable and free_mb >= settings.HEALTH_MIN_FREE_DISK_MB
+
+    return schemas.ComponentHealth(
+        status=schemas.HealthStatus.ok if healthy else schemas.HealthStatus.unavailable,
+        details={
+            "path": settings.STATIC_PATH,
+            "free_mb": free_mb,
+            "writable": writable,
+        },
+    )
+
+
+@router.get("/live", response_model=schemas.Health)
+async def liveness() -> schemas.Health:
+    """The process is up and the event loop is responsive."""
+    return schemas.Health(status=schemas.HealthStatus.ok)
+
+
+@router.get(
+    "/ready",
+    response_model=schemas.Health,
+    responses={503: {"model": schemas.Health}},
+)
+async def readiness() -> JSONResponse:
+    """The instance can serve traffic: database, render pool and disk are healthy."""
+    checks = {
+        "database": await check_database(),
+        "render_pool": check_render_pool(),
+        "disk": check_disk(),
+    }
+
+    ready = all(check.status == schemas.HealthStatus.ok for check in checks.values())
+    health = schemas.Health(
+        status=schemas.HealthStatus.ok if ready else schemas.HealthStatus.unavailable,
+        checks=checks,
+    )
+
+    return JSONResponse(
+        content=health.dict(),
+        status_code=status.HTTP_200_OK
+        if ready
+        else status.HTTP_503_SERVICE_UNAVAILABLE,
+    )
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, HTTPException, status
+from fastapi.responses import RedirectResponse
+
+from qrcode_api.app.core.analytics import hit_buffer
+from qrcode_api.app.middleware.admission import AdmissionRoute
+from qrcode_api.app.utils.redirects import resolve_short_code
+
+router = APIRouter(route_class=AdmissionRoute)
+
+
+@router.get(
+    "/{short_code}",
+    response_class=RedirectResponse,
+    status_code=status.HTTP_302_FOUND,
+    responses={404: {"description": "Unknown short code"}},
+)
+async def resolve_dynamic_qrcode(short_code: str) -> RedirectResponse:
+    """Redirect a scanned dynamic QR Code to its current target."""
+    target = await resolve_short_code(short_code)
+
+    if target is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="QRCode with the short code cannot be found",
+        )
+
+    hit_buffer.record(target.qrcode_file, "scan")
+
+    # Targets can change at any time, clients must not cache the redirect
+    return RedirectResponse(
+        target.target_url,
+        status_code=status.HTTP_302_FOUND,
+        headers={"Cache-Control": "no-store"},
+    )
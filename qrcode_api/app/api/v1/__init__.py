@@ -1,6 +1,12 @@
 from fastapi import APIRouter
 
-from qrcode_api.app.api.v1.endpoints import auth, users, qrcodes
+from qrcode_api.app.api.v1.endpoints import (
+    admin,
+    assets,
+    auth,
+    qrcodes,
+    users,
+)
 from qrcode_api.app.core.config import settings
 
 router = APIRouter(prefix=f"/{settings.API_V1_STR}")
@@ -8,3 +14,5 @@ router = APIRouter(prefix=f"/{settings.API_V1_STR}")
 router.include_router(auth.router, prefix="/auth", tags=["Authentication"])
 router.include_router(users.router, prefix="/users", tags=["Users"])
 router.include_router(qrcodes.router, prefix="/qrcode", tags=["QR Codes"])
+router.include_router(assets.router, prefix="/assets", tags=["Assets"])
+router.include_router(admin.router, prefix="/admin", tags=["Admin"])
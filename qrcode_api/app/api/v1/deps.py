@@ -2,13 +2,14 @@ from typing import cast
 
 from beanie import PydanticObjectId
 from pydantic import ValidationError
-from jose import jwt, JWTError
+from jose import JWTError
 from fastapi import Depends, status
 from fastapi.exceptions import HTTPException
 from fastapi.security import APIKeyQuery, OAuth2PasswordBearer
 
 from qrcode_api.app import schemas
 from qrcode_api.app.core.config import settings
+from qrcode_api.app.core.tokens import get_token_codec
 from qrcode_api.app.models import User
 
 
@@ -22,10 +23,8 @@ api_key_query = APIKeyQuery(name="api_key", auto_error=False)
 
 async def authenticate_bearer_token(token: str) -> User | None:
     try:
-        payload = jwt.decode(
-            token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM]
-        )
-        data = schemas.AuthTokenPayload(**payload)
+        claims = get_token_codec().decode(token)
+        data = schemas.AuthTokenPayload(sub=claims.sub)
     except (JWTError, ValidationError):
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
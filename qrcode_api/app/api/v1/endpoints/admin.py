@@ -0,0 +1,46 @@
+from typing import Any
+
+from fastapi import APIRouter, Depends, status
+from fastapi_utils.cbv import cbv
+
+from qrcode_api.app import schemas
+from qrcode_api.app.api.v1.deps import get_current_active_superuser
+from qrcode_api.app.core.admission import admission_controller
+from qrcode_api.app.core.query_monitor import query_monitor
+from qrcode_api.app.core.watchdog import loop_watchdog
+from qrcode_api.app.middleware.admission import AdmissionRoute
+from qrcode_api.app.models.user import User
+
+router = APIRouter(route_class=AdmissionRoute)
+
+
+@cbv(router)
+class AdminViews:
+    superuser: User = Depends(get_current_active_superuser)
+
+    @router.get("/query-stats", response_model=schemas.QueryStats)
+    async def get_query_stats(self) -> dict[str, Any]:
+        """Get the Mongo commands run per route and per collection since the
+        last reset, and the latest slow queries."""
+        return query_monitor.stats()
+
+    @router.delete("/query-stats", status_code=status.HTTP_204_NO_CONTENT)
+    async def reset_query_stats(self) -> None:
+        """Reset the query statistics."""
+        query_monitor.reset()
+
+    @router.get("/loop-stalls", response_model=schemas.LoopStallStats)
+    async def get_loop_stalls(self) -> dict[str, Any]:
+        """Get the event loop stalls per route since the last reset, and the
+        stacks of the latest ones."""
+        return loop_watchdog.stats()
+
+    @router.delete("/loop-stalls", status_code=status.HTTP_204_NO_CONTENT)
+    async def reset_loop_stalls(self) -> None:
+        """Reset the event loop stall statistics."""
+        loop_watchdog.reset()
+
+    @router.get("/admission", response_model=schemas.AdmissionStats)
+    async def get_admission_stats(self) -> dict[str, Any]:
+        """Get the load per route class and the priorities being shed."""
+        return admission_controller.stats()
@@ -0,0 +1,79 @@
+import asyncio
+import os
+
+from beanie import PydanticObjectId
+from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
+from fastapi_utils.cbv import cbv
+
+from qrcode_api.app import schemas
+from qrcode_api.app.api.v1.deps import get_current_active_user
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.core.render import render_pool
+from qrcode_api.app.middleware.admission import AdmissionRoute
+from qrcode_api.app.models.asset import Asset
+from qrcode_api.app.models.user import User
+from qrcode_api.app.utils.images import asset_path, normalize_asset
+
+router = APIRouter(route_class=AdmissionRoute)
+
+
+def asset_not_found() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Asset with the id cannot be found",
+    )
+
+
+@cbv(router)
+class BasicUserViews:
+    user: User = Depends(get_current_active_user)
+
+    @router.post("/", response_model=schemas.Asset, status_code=status.HTTP_201_CREATED)
+    async def upload_asset(self, file: UploadFile = File(...)) -> schemas.Asset:
+        """Upload an image (e.g. a logo) to embed in QR Codes."""
+        data = await file.read(settings.ASSET_MAX_BYTES + 1)
+        if len(data) > settings.ASSET_MAX_BYTES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"Assets are limited to {settings.ASSET_MAX_BYTES} bytes",
+            )
+
+        asset_id = PydanticObjectId()
+        file_name = f"{asset_id}.png"
+
+        try:
+            width, height = await render_pool.run(
+                normalize_asset, data, asset_path(file_name)
+            )
+        except ValueError as error:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=str(error)
+            ) from None
+
+        asset = await Asset(
+            id=asset_id,
+            user_id=self.user.id,
+            file_name=file_name,
+            width=width,
+            height=height,
+        ).insert()
+        return schemas.Asset(**asset.dict())
+
+    @router.get("/", response_model=list[schemas.Asset])
+    async def get_assets(self) -> list[schemas.Asset]:
+        """Get current user's assets."""
+        assets = await Asset.get_by_user(user_id=self.user.id)
+        return [schemas.Asset(**asset.dict()) for asset in assets]
+
+    @router.delete("/{asset_id}", status_code=status.HTTP_204_NO_CONTENT)
+    async def delete_asset(self, asset_id: PydanticObjectId) -> None:
+        asset = await Asset.get_for_user(asset_id=asset_id, user_id=self.user.id)
+        if not asset:
+            raise asset_not_found()
+
+        try:
+            await asyncio.to_thread(os.remove, asset_path(asset.file_name))
+        except FileNotFoundError:
+            pass
+
+        await asset.delete()
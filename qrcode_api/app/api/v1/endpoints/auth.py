@@ -6,10 +6,13 @@ from fastapi.security import OAuth2PasswordRequestForm
 from qrcode_api.app import schemas
 from qrcode_api.app.core.config import settings
 from qrcode_api.app.core.security import create_access_token, create_api_key
+from qrcode_api.app.core.tokens import get_token_codec
 from qrcode_api.app.api.v1.deps import get_current_active_user
+from qrcode_api.app.middleware.admission import AdmissionRoute
 from qrcode_api.app.models import User
 
 router = APIRouter(
+    route_class=AdmissionRoute,
     responses={
         401: {
             "description": "Unauthorized, invalid credentials or access token",
@@ -60,3 +63,17 @@ async def generate_new_api_key(user: User = Depends(get_current_active_user)) ->
     user.api_key = create_api_key()
     await user.save_changes()
     return user
+
+
+@router.get("/jwks.json", description="Public keys used to sign access tokens.")
+async def get_jwks() -> dict:
+    """JWK Set for verifying access tokens outside of the API (e.g. edge proxies)."""
+    codec = get_token_codec()
+
+    if not codec.is_asymmetric:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Access tokens are not signed with an asymmetric key",
+        )
+
+    return codec.public_jwks()
@@ -1,32 +1,291 @@
-import os
+import asyncio
+import functools
+import json
 import logging
+import mimetypes
+import os
 import secrets
-from hashlib import md5
-from typing import TYPE_CHECKING
+from datetime import datetime
+from hashlib import md5, sha256
+from typing import TYPE_CHECKING, Any, AsyncIterator
 
-import segno
-from segno import helpers
-from fastapi import APIRouter, Depends, HTTPException, status
-from fastapi.responses import FileResponse
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    HTTPException,
+    Request,
+    status,
+)
+from fastapi.responses import Response, StreamingResponse
 from fastapi_utils.cbv import cbv
+from pydantic import ValidationError
+from pydantic.color import Color
+from pydantic.fields import SHAPE_LIST
+from pymongo.errors import DuplicateKeyError
 
 from qrcode_api.app import schemas
 from qrcode_api.app.api.v1.deps import (
     get_current_active_user,
     get_current_active_superuser,
 )
+from qrcode_api.app.core.analytics import hit_buffer
 from qrcode_api.app.core.config import settings
+from qrcode_api.app.core.idempotency import Idempotency
+from qrcode_api.app.core.render import render_coalescer, render_pool
+from qrcode_api.app.core.writes import insert_batcher
+from qrcode_api.app.db.routing import secondary_reads
+from qrcode_api.app.middleware.admission import AdmissionRoute
 from qrcode_api.app.models.user import User
-from qrcode_api.app.models.qrcode import QRCode
+from qrcode_api.app.models.qrcode import QRCode, RenderOptions
+from qrcode_api.app.models.dynamic_qrcode import DynamicQRCode
+from qrcode_api.app.models.asset import Asset
 from qrcode_api.app.utils import paginate
+from qrcode_api.app.utils.derivatives import derivative_cache
+from qrcode_api.app.utils.encoding import EncodingPlan, make_qrcode, plan_encoding
+from qrcode_api.app.utils.files import (
+    negotiate_variant,
+    qrcode_file_path,
+    remove_qrcode_file,
+    remove_qrcode_files,
+    write_compressed_variants,
+)
+from qrcode_api.app.utils.images import asset_path, composite_logo, render_image
+from qrcode_api.app.utils.lazy import load
+from qrcode_api.app.utils.mail_merge import (
+    MailMergeError,
+    ManifestOutput,
+    MergeResult,
+    MultipartCSVUpload,
+    OutputSpool,
+    SpoolResponse,
+    ZipOutput,
+    run_mail_merge,
+)
+from qrcode_api.app.utils.matrix import write_matrix
+from qrcode_api.app.utils.print_sheet import SheetCode, stream_print_sheet
+from qrcode_api.app.utils.redirects import delete_redirects, invalidate_short_codes
+from qrcode_api.app.utils.serving import (
+    StaticFileResponse,
+    build_bytes_response,
+    build_file_response,
+    resolve_static_file,
+)
 
 if TYPE_CHECKING:
+    from types import ModuleType
+
     from app.utils.types import PaginationDict
 
-router = APIRouter()
+router = APIRouter(route_class=AdmissionRoute)
 
 logger = logging.getLogger(__name__)
 
+# Short codes are 'token_urlsafe(6)', 8 characters
+SHORT_CODE_BYTES = 6
+SHORT_CODE_ATTEMPTS = 3
+
+# Per format writer options, SVGs are written as a single bare path without
+# the XML declaration and segno's class attributes.
+SAVE_OPTIONS = {
+    schemas.FileFormats.svg: {
+        "xmldecl": False,
+        "svgclass": None,
+        "lineclass": None,
+        "nl": False,
+    },
+    schemas.FileFormats.pdf: {"compresslevel": 9},
+}
+
+# Written straight from the symbol matrix, without raster or vector encoding
+MATRIX_FORMATS = {schemas.FileFormats.matrix, schemas.FileFormats.json}
+
+
+def render_key(data: Any, payload: schemas.IQRCodeCreate) -> str:
+    """Canonical key of a render, equal for requests producing the same file."""
+    canonical = json.dumps([data, payload.json(sort_keys=True)], default=str)
+    return sha256(canonical.encode()).hexdigest()
+
+
+def render_qrcode_file(
+    path: str,
+    options: RenderOptions,
+    file_format: str,
+    logo: Asset | None = None,
+    max_dimension: int | None = None,
+) -> None:
+    """Encode ``options.data`` and write it to ``path``, runs in the render pool.
+
+    Raises ``ValueError`` when the data can't be encoded or the symbol would
+    be larger than ``max_dimension``.
+    """
+    qrcode = make_qrcode(
+        options.data,
+        micro=options.micro,
+        error_level=options.error_level,
+        mode=options.mode,
+        version=options.version,
+    )
+
+    if file_format in MATRIX_FORMATS:
+        write_matrix(path, qrcode, file_format, border=options.border)
+        return
+
+    if max_dimension is not None:
+        width, _ = qrcode.symbol_size(scale=options.scale, border=options.border)
+        if width > max_dimension:
+            raise ValueError(f"The QR Code would be larger than {max_dimension}")
+
+    if logo is not None:
+        image = render_image(
+            qrcode,
+            scale=options.scale,
+            border=options.border,
+            dark=options.dark,
+            light=options.light,
+        )
+        composite_logo(
+            image,
+            asset_id=str(logo.id),
+            path=asset_path(logo.file_name),
+            logo_size=options.logo_size,
+        )
+        image.save(path, format="PNG")
+        return
+
+    qrcode.save(
+        path,
+        kind=file_format,
+        scale=options.scale,
+        border=options.border,
+        dark=options.dark,
+        light=options.light,
+        **SAVE_OPTIONS.get(file_format, {}),
+    )
+
+
+def segno_helpers() -> "ModuleType":
+    """Import segno's payload helpers on first use of a typed endpoint."""
+    load("segno")
+    from segno import helpers
+
+    return helpers
+
+
+def basic_data(payload: schemas.QRCodeBasicCreate) -> Any:
+    return payload.data
+
+
+def location_data(payload: schemas.QRCodeLocationCreate) -> str:
+    return segno_helpers().make_geo_data(lat=payload.latitude, lng=payload.longitude)
+
+
+def wifi_data(payload: schemas.QRCodeWiFiCreate) -> str:
+    return segno_helpers().make_wifi_data(
+        ssid=payload.ssid, password=payload.password, security=payload.security
+    )
+
+
+def vcard_data(payload: schemas.QRCodeContactCardCreate) -> str:
+    return segno_helpers().make_vcard_data(
+        name=payload.name,
+        displayname=payload.displayname,
+        phone=payload.phone_number,
+        email=payload.email,
+        url=payload.url,
+    )
+
+
+def mecard_data(payload: schemas.QRCodeContactCardCreate) -> str:
+    return segno_helpers().make_mecard_data(
+        name=payload.name,
+        phone=payload.phone_number,
+        email=payload.email,
+        url=payload.url,
+    )
+
+
+# Mail merge payload type -> its schema and the data it encodes
+MERGE_PAYLOADS = {
+    schemas.MergePayloadType.basic: (schemas.QRCodeBasicCreate, basic_data),
+    schemas.MergePayloadType.location: (schemas.QRCodeLocationCreate, location_data),
+    schemas.MergePayloadType.wifi: (schemas.QRCodeWiFiCreate, wifi_data),
+    schemas.MergePayloadType.vCard: (schemas.QRCodeContactCardCreate, vcard_data),
+    schemas.MergePayloadType.meCard: (schemas.QRCodeContactCardCreate, mecard_data),
+}
+
+# Separator of the values of list fields (e.g. emails) in mail merge cells
+MERGE_LIST_SEPARATOR = ";"
+
+
+def build_render_options(
+    data: Any, payload: schemas.IQRCodeCreate, plan: EncodingPlan
+) -> RenderOptions:
+    return RenderOptions(
+        data=data,
+        micro=payload.micro,
+        mode=plan.mode,
+        version=plan.version,
+        error_level=plan.error_level,
+        scale=payload.scale,
+        border=payload.border,
+        dark=payload.dark.as_hex(),
+        light=payload.light.as_hex(),
+        logo=payload.logo,
+        logo_size=payload.logo_size,
+    )
+
+
+def validation_message(error: ValidationError) -> str:
+    """'field: message' of each error, on one line."""
+    return "; ".join(
+        f"{'.'.join(map(str, detail['loc']))}: {detail['msg']}"
+        for detail in error.errors()
+    )
+
+
+def render_merge_row(
+    file_name: str,
+    data: Any,
+    payload: schemas.IQRCodeCreate,
+    logo: Asset | None,
+    with_content: bool,
+) -> tuple[RenderOptions, bytes | None]:
+    """Encode and save a mail merge row, runs in the render pool. Returns
+    its render options and, ``with_content``, the file.
+
+    Raises ``ValueError`` when the data can't be encoded.
+    """
+    plan = plan_encoding(
+        data,
+        micro=payload.micro,
+        error_level=payload.error_level,
+        mode=payload.mode,
+        version=payload.version,
+        boost_error=payload.boost_error,
+    )
+    options = build_render_options(data, payload, plan)
+    path = qrcode_file_path(file_name)
+    render_qrcode_file(path, options, payload.file_format.value, logo)
+    write_compressed_variants(path)
+
+    if not with_content:
+        return options, None
+    with open(path, "rb") as file:
+        return options, file.read()
+
+
+async def get_user_or_404(username: str) -> User:
+    user = await User.get_by_username(username=username)
+
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="The user with this username does not exist",
+        )
+
+    return user
+
 
 def qrcode_not_found() -> HTTPException:
     return HTTPException(
@@ -35,6 +294,47 @@ def qrcode_not_found() -> HTTPException:
     )
 
 
+async def inline_sheet_codes(
+    items: list[schemas.PrintSheetItem],
+) -> AsyncIterator[SheetCode]:
+    for item in items:
+        yield SheetCode(
+            label=item.label,
+            data=item.data,
+            micro=item.micro,
+            error_level=item.error_level,
+            dark=item.dark.as_hex(),
+            light=item.light.as_hex(),
+        )
+
+
+async def stored_sheet_codes(
+    qrcodes: AsyncIterator[QRCode],
+) -> AsyncIterator[SheetCode]:
+    """Redraw stored codes from their render options, or embed their PNG when
+    they carry a logo or predate stored render options."""
+    async for qrcode in qrcodes:
+        options = qrcode.render_options
+        if options is not None and options.logo is None:
+            yield SheetCode(
+                label=qrcode.qrcode_file,
+                data=options.data,
+                micro=options.micro,
+                error_level=options.error_level,
+                mode=options.mode,
+                version=options.version,
+                dark=options.dark,
+                light=options.light,
+            )
+        elif qrcode.qrcode_file.endswith(".png"):
+            yield SheetCode(
+                label=qrcode.qrcode_file,
+                image_path=qrcode_file_path(qrcode.qrcode_file),
+            )
+        else:
+            logger.info(f"Skipping {qrcode.qrcode_file}, it can't be laid out")
+
+
 @cbv(router)
 class BasicUserViews:
     user: User = Depends(get_current_active_user)
@@ -46,79 +346,437 @@ class BasicUserViews:
     @router.post(
         "/", response_model=schemas.QRCode, status_code=status.HTTP_201_CREATED
     )
-    async def basic_qrcode(self, payload: schemas.QRCodeBasicCreate) -> QRCode:
-        file_name = f"{self.generate_random_str()}.{payload.file_format}"
-        return await self.__generate_qrcode(
-            file_name=file_name, data=payload.data, payload=payload
+    async def basic_qrcode(
+        self, payload: schemas.QRCodeBasicCreate, idempotency: Idempotency = Depends()
+    ) -> QRCode:
+        file_name = f"{self.generate_random_str()}.{payload.file_format.value}"
+        return await idempotency.run(
+            self.user.id,
+            payload,
+            functools.partial(
+                self.__generate_qrcode,
+                file_name=file_name,
+                data=payload.data,
+                payload=payload,
+            ),
         )
 
     @router.post(
         "/location", response_model=schemas.QRCode, status_code=status.HTTP_201_CREATED
     )
-    async def location_qrcode(self, payload: schemas.QRCodeLocationCreate) -> QRCode:
-        file_name = f"{self.generate_random_str()}.{payload.file_format}"
-        geo_uri = helpers.make_geo_data(lat=payload.latitude, lng=payload.longitude)
-        return await self.__generate_qrcode(
-            file_name=file_name, data=geo_uri, payload=payload
+    async def location_qrcode(
+        self,
+        payload: schemas.QRCodeLocationCreate,
+        idempotency: Idempotency = Depends(),
+    ) -> QRCode:
+        file_name = f"{self.generate_random_str()}.{payload.file_format.value}"
+        geo_uri = location_data(payload)
+        return await idempotency.run(
+            self.user.id,
+            payload,
+            functools.partial(
+                self.__generate_qrcode,
+                file_name=file_name,
+                data=geo_uri,
+                payload=payload,
+            ),
         )
 
     @router.post(
         "/wifi", response_model=schemas.QRCode, status_code=status.HTTP_201_CREATED
     )
-    async def wifi_qrcode(self, payload: schemas.QRCodeWiFiCreate) -> QRCode:
-        file_name = f"{self.generate_random_str()}.{payload.file_format}"
-        wifi_data = helpers.make_wifi_data(
-            ssid=payload.ssid, password=payload.password, security=payload.security
-        )
-        return await self.__generate_qrcode(
-            file_name=file_name, data=wifi_data, payload=payload
+    async def wifi_qrcode(
+        self, payload: schemas.QRCodeWiFiCreate, idempotency: Idempotency = Depends()
+    ) -> QRCode:
+        file_name = f"{self.generate_random_str()}.{payload.file_format.value}"
+        return await idempotency.run(
+            self.user.id,
+            payload,
+            functools.partial(
+                self.__generate_qrcode,
+                file_name=file_name,
+                data=wifi_data(payload),
+                payload=payload,
+            ),
         )
 
     @router.post(
         "/vCard", response_model=schemas.QRCode, status_code=status.HTTP_201_CREATED
     )
-    async def vCard_qrcode(self, payload: schemas.QRCodeContactCardCreate) -> QRCode:
-        file_name = f"{self.generate_random_str()}.{payload.file_format}"
-        vCard_data = helpers.make_vcard_data(
-            name=payload.name,
-            displayname=payload.displayname,
-            phone=payload.phone_number,
-            email=payload.email,
-            url=payload.url,
-        )
-        return await self.__generate_qrcode(
-            file_name=file_name, data=vCard_data, payload=payload
+    async def vCard_qrcode(
+        self,
+        payload: schemas.QRCodeContactCardCreate,
+        idempotency: Idempotency = Depends(),
+    ) -> QRCode:
+        file_name = f"{self.generate_random_str()}.{payload.file_format.value}"
+        vCard_data = vcard_data(payload)
+        return await idempotency.run(
+            self.user.id,
+            payload,
+            functools.partial(
+                self.__generate_qrcode,
+                file_name=file_name,
+                data=vCard_data,
+                payload=payload,
+            ),
         )
 
     @router.post(
         "/meCard", response_model=schemas.QRCode, status_code=status.HTTP_201_CREATED
     )
-    async def meCard_qrcode(self, payload: schemas.QRCodeContactCardCreate) -> QRCode:
-        file_name = f"{self.generate_random_str()}.{payload.file_format}"
-        meCard_data = helpers.make_mecard_data(
-            name=payload.name,
-            phone=payload.phone_number,
-            email=payload.email,
-            url=payload.url,
+    async def meCard_qrcode(
+        self,
+        payload: schemas.QRCodeContactCardCreate,
+        idempotency: Idempotency = Depends(),
+    ) -> QRCode:
+        file_name = f"{self.generate_random_str()}.{payload.file_format.value}"
+        meCard_data = mecard_data(payload)
+        return await idempotency.run(
+            self.user.id,
+            payload,
+            functools.partial(
+                self.__generate_qrcode,
+                file_name=file_name,
+                data=meCard_data,
+                payload=payload,
+            ),
         )
-        return await self.__generate_qrcode(
-            file_name=file_name, data=meCard_data, payload=payload
+
+    @router.post(
+        "/dynamic",
+        response_model=schemas.DynamicQRCode,
+        status_code=status.HTTP_201_CREATED,
+    )
+    async def dynamic_qrcode(
+        self,
+        payload: schemas.QRCodeDynamicCreate,
+        request: Request,
+        idempotency: Idempotency = Depends(),
+    ) -> schemas.DynamicQRCode:
+        """Create a QR Code encoding a short URL whose target can be changed."""
+        return await idempotency.run(
+            self.user.id,
+            payload,
+            functools.partial(self.__create_dynamic_qrcode, payload, request),
         )
 
-    async def __generate_qrcode(self, file_name, data, payload) -> QRCode:
+    async def __create_dynamic_qrcode(
+        self, payload: schemas.QRCodeDynamicCreate, request: Request
+    ) -> schemas.DynamicQRCode:
+        file_name = f"{self.generate_random_str()}.{payload.file_format.value}"
+
+        for _ in range(SHORT_CODE_ATTEMPTS):
+            try:
+                dynamic_qrcode = await insert_batcher.insert(
+                    DynamicQRCode(
+                        short_code=secrets.token_urlsafe(SHORT_CODE_BYTES),
+                        target_url=payload.target_url,
+                        qrcode_file=file_name,
+                    )
+                )
+                break
+            except DuplicateKeyError:
+                continue
+        else:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Could not allocate a short code",
+            )
+
+        base_url = settings.PUBLIC_BASE_URL or str(request.base_url)
+        short_url = f"{base_url.rstrip('/')}/r/{dynamic_qrcode.short_code}"
         try:
-            qrcode = segno.make(data, micro=payload.micro, error=payload.error_level)
-            qrcode.save(
-                f"{settings.STATIC_PATH}/{file_name}",
-                scale=payload.scale,
-                border=payload.border,
-                dark=payload.dark.as_hex(),
-                light=payload.light.as_hex(),
-            )
-            new_qrcode = await QRCode(
+            qrcode = await self.__generate_qrcode(
+                file_name=file_name, data=short_url, payload=payload
+            )
+        except BaseException:
+            # The short code was never handed out, don't leave it dangling
+            await dynamic_qrcode.delete()
+            raise
+
+        return schemas.DynamicQRCode(
+            **qrcode.dict(),
+            short_code=dynamic_qrcode.short_code,
+            short_url=short_url,
+            target_url=dynamic_qrcode.target_url,
+        )
+
+    @router.put("/dynamic/{short_code}", response_model=schemas.QRCode)
+    async def update_dynamic_qrcode(
+        self, short_code: str, payload: schemas.QRCodeDynamicUpdate
+    ) -> schemas.QRCode:
+        """Change the target of a dynamic QR Code without re-rendering it."""
+        dynamic_qrcode = await DynamicQRCode.get_by_short_code(short_code=short_code)
+
+        if not dynamic_qrcode:
+            raise qrcode_not_found()
+
+        qrcode = await QRCode.get_by_file_name(file_name=dynamic_qrcode.qrcode_file)
+        if not qrcode:
+            raise qrcode_not_found()
+        if qrcode.user_id != self.user.id and not self.user.is_superuser:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="The user doesn't have enough privileges",
+            )
+
+        dynamic_qrcode.target_url = payload.target_url
+        dynamic_qrcode.updated_at = datetime.utcnow()
+        await dynamic_qrcode.save_changes()
+        invalidate_short_codes([short_code])
+
+        return schemas.QRCode(**qrcode.dict())
+
+    @router.post(
+        "/print-sheet",
+        response_class=StreamingResponse,
+        responses={200: {"content": {"application/pdf": {}}}},
+    )
+    async def print_sheet(self, payload: schemas.PrintSheetCreate) -> StreamingResponse:
+        """Lay out many QR Codes on print sheets, streamed as a single PDF."""
+        if payload.items is not None:
+            if len(payload.items) > settings.PRINT_SHEET_MAX_CODES:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"At most {settings.PRINT_SHEET_MAX_CODES} codes per sheet",
+                )
+            codes = inline_sheet_codes(payload.items)
+        else:
+            qrcodes = (
+                QRCode.find(
+                    *QRCode.build_filter(
+                        user_id=self.user.id,
+                        file_names=payload.file_names,
+                        created_before=payload.created_before,
+                    )
+                )
+                .sort(+QRCode.created_at)
+                .limit(settings.PRINT_SHEET_MAX_CODES)
+            )
+            # The cursor is opened now, it's only consumed while streaming
+            with secondary_reads():
+                codes = stored_sheet_codes(aiter(qrcodes))
+
+        return StreamingResponse(
+            stream_print_sheet(codes, payload.layout),
+            media_type="application/pdf",
+            headers={"content-disposition": 'attachment; filename="qrcodes.pdf"'},
+        )
+
+    @router.post(
+        "/mail-merge",
+        response_class=StreamingResponse,
+        responses={200: {"content": {"application/zip": {}, "text/csv": {}}}},
+        openapi_extra={
+            "requestBody": {
+                "required": True,
+                "content": {
+                    "multipart/form-data": {
+                        "schema": {
+                            "type": "object",
+                            "required": ["file"],
+                            "properties": {
+                                "options": {
+                                    "type": "string",
+                                    "description": "MailMergeOptions as JSON, "
+                                    "sent before the file",
+                                },
+                                "file": {"type": "string", "format": "binary"},
+                            },
+                        }
+                    }
+                },
+            }
+        },
+    )
+    async def mail_merge(self, request: Request) -> SpoolResponse:
+        """Create a QR Code per row of a CSV file, streamed back as a ZIP
+        archive (or a manifest) while the file is uploaded.
+
+        The first row names the columns, mapped to the fields of the payload
+        type (see 'MailMergeOptions'). Rows failing validation or encoding are
+        reported in the manifest, the others are stored like single codes.
+        """
+        try:
+            upload = MultipartCSVUpload(
+                request.stream(),
+                request.headers.get("content-type", ""),
+                max_record_bytes=settings.MAIL_MERGE_MAX_RECORD_BYTES,
+            )
+            header = await upload.start()
+            options = schemas.MailMergeOptions.parse_raw(
+                upload.fields.get("options", "{}")
+            )
+        except MailMergeError as error:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=str(error)
+            )
+        except ValidationError as error:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Invalid options: {validation_message(error)}",
+            )
+
+        model, make_data = MERGE_PAYLOADS[options.payload_type]
+        fields = [options.columns.get(column, column) for column in header]
+        unknown = {*fields, *options.defaults} - {*model.__fields__, "label", None}
+        if unknown:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Unknown {options.payload_type.value} fields: "
+                f"{', '.join(sorted(unknown))}",
+            )
+
+        list_fields = {
+            name
+            for name, field in model.__fields__.items()
+            if field.shape == SHAPE_LIST
+        }
+        with_content = options.output == schemas.MergeOutput.zip
+        logos: dict[Any, Asset | None] = {}
+
+        async def render_row(row_number: int, row: list[str]) -> MergeResult:
+            values = dict(options.defaults)
+            label = None
+            for field, cell in zip(fields, row):
+                if field is None or cell == "":
+                    continue
+                if field == "label":
+                    label = cell
+                elif field in list_fields:
+                    values[field] = cell.split(MERGE_LIST_SEPARATOR)
+                else:
+                    values[field] = cell
+
+            result = MergeResult(row=row_number, label=label)
+            try:
+                payload = model.parse_obj(values)
+            except ValidationError as error:
+                result.error = validation_message(error)
+                return result
+
+            logo = None
+            if payload.logo is not None:
+                if payload.logo not in logos:
+                    logos[payload.logo] = await Asset.get_for_user(
+                        asset_id=payload.logo, user_id=self.user.id
+                    )
+                logo = logos[payload.logo]
+                if logo is None:
+                    result.error = "Asset with the id cannot be found"
+                    return result
+
+            data = make_data(payload)
+            if data is None:
+                result.error = "There is no data to encode"
+                return result
+
+            file_name = f"{self.generate_random_str()}.{payload.file_format.value}"
+            try:
+                render_options, result.content = await render_pool.run(
+                    render_merge_row,
+                    file_name,
+                    data,
+                    payload,
+                    logo,
+                    with_content,
+                )
+            except ValueError as error:
+                result.error = str(error)
+                return result
+            except Exception:
+                logger.error("QR Code serialization failure", exc_info=True)
+                result.error = "QR Code serialization failure"
+                return result
+
+            result.qrcode_file = file_name
+            result.version = render_options.version
+            result.error_level = render_options.error_level
+            result.document = QRCode(
                 qrcode_file=file_name,
                 user_id=self.user.id,
-            ).insert()
+                render_options=render_options,
+            )
+            return result
+
+        spool = OutputSpool(settings.MAIL_MERGE_SPOOL_PATH)
+        if with_content:
+            output = ZipOutput(spool, settings.MAIL_MERGE_SPOOL_PATH)
+        else:
+            output = ManifestOutput(spool)
+        merge = asyncio.create_task(
+            run_mail_merge(
+                upload.rows(),
+                render_row,
+                QRCode.insert_many,
+                output,
+                concurrency=settings.MAIL_MERGE_CONCURRENCY,
+                batch_size=settings.MAIL_MERGE_BATCH_SIZE,
+                max_rows=settings.MAIL_MERGE_MAX_ROWS,
+            )
+        )
+
+        async def stream() -> AsyncIterator[bytes]:
+            try:
+                async for chunk in spool.chunks():
+                    yield chunk
+            finally:
+                merge.cancel()
+
+        return SpoolResponse(
+            stream(),
+            media_type=output.media_type,
+            headers={
+                "content-disposition": f'attachment; filename="{output.file_name}"'
+            },
+        )
+
+    async def __generate_qrcode(self, file_name, data, payload) -> QRCode:
+        logo = None
+        if payload.logo is not None:
+            logo = await Asset.get_for_user(asset_id=payload.logo, user_id=self.user.id)
+            if not logo:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Asset with the id cannot be found",
+                )
+
+        try:
+            plan = await render_pool.run(
+                plan_encoding,
+                data,
+                micro=payload.micro,
+                error_level=payload.error_level,
+                mode=payload.mode,
+                version=payload.version,
+                boost_error=payload.boost_error,
+            )
+        except ValueError as error:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=str(error)
+            )
+
+        render_options = build_render_options(data, payload, plan)
+
+        try:
+            await render_coalescer.render(
+                render_key(data, payload),
+                qrcode_file_path(file_name),
+                functools.partial(
+                    self.__render_qrcode,
+                    file_name=file_name,
+                    options=render_options,
+                    file_format=payload.file_format.value,
+                    logo=logo,
+                ),
+            )
+            new_qrcode = await insert_batcher.insert(
+                QRCode(
+                    qrcode_file=file_name,
+                    user_id=self.user.id,
+                    render_options=render_options,
+                )
+            )
             return schemas.QRCode(**new_qrcode.dict())
         except Exception as error:
             logger.error("QR Code serialization failure", exc_info=True)
@@ -127,6 +785,13 @@ class BasicUserViews:
                 detail=f"QR Code serialization failure",
             )
 
+    @staticmethod
+    def __render_qrcode(file_name, options, file_format, logo=None) -> None:
+        """Encode and save the QR Code, runs in the render pool."""
+        path = qrcode_file_path(file_name)
+        render_qrcode_file(path, options, file_format, logo)
+        write_compressed_variants(path)
+
 
 @cbv(router)
 class SuperuserViews:
@@ -142,18 +807,252 @@ class SuperuserViews:
 
     @router.delete("/{qrcode_file_name}", status_code=status.HTTP_204_NO_CONTENT)
     async def delete_qrcode(self, qrcode_file_name: str) -> None:
-        qrcode = await QRCode.get_by_file_name(qrcode_file_name)
+        qrcode = await QRCode.get_by_file_name(file_name=qrcode_file_name)
 
         if not qrcode:
             raise qrcode_not_found()
 
-        file_name = f"{settings.STATIC_PATH}/{qrcode.qrcode_file}"
-        if os.path.isfile(file_name):
-            os.remove(file_name)
-
+        remove_qrcode_file(qrcode.qrcode_file)
         await qrcode.delete()
+        await delete_redirects([qrcode.qrcode_file])
 
+    @router.post("/bulk-delete", response_model=schemas.BulkOperationResult)
+    async def bulk_delete_qrcodes(
+        self,
+        criteria: schemas.QRCodeAdminBulkDelete,
+        background_tasks: BackgroundTasks,
+    ) -> dict[str, int]:
+        """Delete every QR Code matching the criteria, files are removed
+        in the background."""
+        user_id = None
+        if criteria.username is not None:
+            user_id = (await get_user_or_404(criteria.username)).id
 
-@router.get("/{qrcode_file_name}", response_class=FileResponse)
-async def fetch_qrcode_file(qrcode_file_name: str):
-    return FileResponse(f"{settings.STATIC_PATH}/{qrcode_file_name}")
+        count = 0
+        async for file_names in QRCode.delete_matching(
+            *QRCode.build_filter(
+                user_id=user_id,
+                file_names=criteria.file_names,
+                created_before=criteria.created_before,
+            )
+        ):
+            await delete_redirects(file_names)
+            background_tasks.add_task(remove_qrcode_files, file_names)
+            count += len(file_names)
+
+        return {"count": count}
+
+    @router.post("/transfer", response_model=schemas.BulkOperationResult)
+    async def transfer_qrcodes(
+        self, transfer: schemas.QRCodeTransfer
+    ) -> dict[str, int]:
+        """Transfer the ownership of QR Codes from one user to another."""
+        from_user = await get_user_or_404(transfer.from_username)
+        to_user = await get_user_or_404(transfer.to_username)
+
+        count = await QRCode.transfer_matching(
+            *QRCode.build_filter(
+                user_id=from_user.id,
+                file_names=transfer.file_names,
+                created_before=transfer.created_before,
+            ),
+            user_id=to_user.id,
+        )
+
+        return {"count": count}
+
+
+@router.api_route(
+    "/{qrcode_file_name}",
+    methods=["GET", "HEAD"],
+    response_class=StaticFileResponse,
+    responses={
+        206: {"description": "Partial content"},
+        304: {"description": "Not modified"},
+        416: {"description": "Range not satisfiable"},
+    },
+)
+async def fetch_qrcode_file(
+    qrcode_file_name: str,
+    request: Request,
+    derivative: schemas.QRCodeDerivative = Depends(),
+) -> Response:
+    path = resolve_static_file(qrcode_file_name)
+    if path is None:
+        raise qrcode_not_found()
+
+    if not derivative.is_empty:
+        return await fetch_derivative(qrcode_file_name, derivative, request)
+
+    served_path, encoding = negotiate_variant(
+        path, request.headers.get("accept-encoding")
+    )
+    try:
+        stat_result = os.stat(served_path)
+    except FileNotFoundError:
+        raise qrcode_not_found() from None
+
+    hit_buffer.record(qrcode_file_name, "fetch")
+
+    return build_file_response(
+        request.headers,
+        served_path,
+        stat_result,
+        media_type=mimetypes.guess_type(path)[0],
+        encoding=encoding,
+        headers={"vary": "Accept-Encoding"},
+    )
+
+
+def render_derivative(
+    path: str, options: RenderOptions, file_format: str, logo: Asset | None
+) -> None:
+    """Render a derivative next to its final path and move it in place, so
+    other workers never serve a partially written file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temporary = f"{path}.{secrets.token_hex(4)}.tmp"
+    try:
+        render_qrcode_file(
+            temporary,
+            options,
+            file_format,
+            logo,
+            max_dimension=settings.DERIVATIVE_MAX_DIMENSION,
+        )
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+
+def check_derivative(
+    derivative: schemas.QRCodeDerivative, options: RenderOptions
+) -> None:
+    """Only the code's own parameters and the configured presets can be
+    derived, each distinct derivative is rendered and cached on request."""
+    allowed = {
+        "scale": {options.scale, *settings.DERIVATIVE_SCALES},
+        "border": {options.border, *settings.DERIVATIVE_BORDERS},
+    }
+    for name, values in allowed.items():
+        value = getattr(derivative, name)
+        if value is not None and value not in values:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"'{name}' must be one of {sorted(values)}",
+            )
+
+    colors = [options.dark, options.light, *settings.DERIVATIVE_COLORS]
+    allowed_colors = {Color(color).as_hex() for color in colors}
+    for name in ("dark", "light"):
+        color = getattr(derivative, name)
+        if color is not None and color.as_hex() not in allowed_colors:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"'{name}' must be one of {sorted(allowed_colors)}",
+            )
+
+
+async def fetch_derivative(
+    qrcode_file_name: str, derivative: schemas.QRCodeDerivative, request: Request
+) -> Response:
+    """Serve a stored QR Code rendered with other parameters.
+
+    Each derivative is rendered once from the stored render options and then
+    served from the derivative cache.
+    """
+    qrcode = await QRCode.get_by_file_name(file_name=qrcode_file_name)
+    if not qrcode:
+        raise qrcode_not_found()
+
+    options = qrcode.render_options
+    if options is None:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="This QR Code was created without render options and can't be derived",
+        )
+    check_derivative(derivative, options)
+
+    stem, extension = os.path.splitext(qrcode_file_name)
+    file_format = derivative.format.value if derivative.format else extension[1:]
+    if options.logo is not None and file_format != schemas.FileFormats.png.value:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="QR Codes with a logo can only be derived as png",
+        )
+
+    updates = derivative.dict(include={"scale", "border"}, exclude_none=True)
+    for color in ("dark", "light"):
+        if getattr(derivative, color) is not None:
+            updates[color] = getattr(derivative, color).as_hex()
+    options = options.copy(update=updates)
+
+    key = sha256(
+        json.dumps(
+            [
+                qrcode_file_name,
+                file_format,
+                options.scale,
+                options.border,
+                options.dark,
+                options.light,
+            ]
+        ).encode()
+    ).hexdigest()
+    name = f"{stem}-{key[:16]}.{file_format}"
+    media_type = mimetypes.guess_type(name)[0]
+
+    hit_buffer.record(qrcode_file_name, "fetch")
+
+    # The name identifies the content, the same validator for both cache tiers
+    etag = f'"{key[:16]}"'
+    content = derivative_cache.get_bytes(name)
+    if content is not None:
+        return build_bytes_response(
+            request.headers, content, etag=etag, media_type=media_type
+        )
+
+    path = await derivative_cache.get_path(name)
+    if path is None:
+        if render_pool.is_saturated:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many renders in progress, retry later",
+                headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER_SECONDS)},
+            )
+
+        logo = None
+        if options.logo is not None:
+            logo = await Asset.get(options.logo)
+            if not logo:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="The logo of this QR Code no longer exists",
+                )
+
+        path = derivative_cache.file_path(name)
+        try:
+            await render_coalescer.render(
+                key,
+                path,
+                functools.partial(render_derivative, path, options, file_format, logo),
+            )
+        except ValueError as error:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=str(error)
+            ) from None
+        await derivative_cache.add(name)
+
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        raise qrcode_not_found() from None
+
+    return build_file_response(
+        request.headers,
+        path,
+        stat_result,
+        media_type=media_type,
+        offload=False,
+        etag=etag,
+    )
@@ -1,7 +1,14 @@
-import os
 from typing import TYPE_CHECKING, Any
 
-from fastapi import APIRouter, Body, Depends, HTTPException, status
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Body,
+    Depends,
+    HTTPException,
+    Query,
+    status,
+)
 from pydantic import EmailStr
 from fastapi_utils.cbv import cbv
 
@@ -10,16 +17,20 @@ from qrcode_api.app.api.v1.deps import (
     get_current_active_user,
     get_current_active_superuser,
 )
-from qrcode_api.app.core.config import settings
 from qrcode_api.app.core.security import get_password_hash
+from qrcode_api.app.db.routing import secondary_reads
+from qrcode_api.app.middleware.admission import AdmissionRoute
 from qrcode_api.app.models.user import User
 from qrcode_api.app.models.qrcode import QRCode
+from qrcode_api.app.models.qrcode_hits import QRCodeHits
 from qrcode_api.app.utils import paginate
+from qrcode_api.app.utils.files import remove_qrcode_file, remove_qrcode_files
+from qrcode_api.app.utils.redirects import delete_redirects
 
 if TYPE_CHECKING:
     from app.utils.types import PaginationDict
 
-router = APIRouter()
+router = APIRouter(route_class=AdmissionRoute)
 
 
 def user_not_found_error() -> HTTPException:
@@ -51,6 +62,25 @@ async def sign_up_user(user_sign_up: schemas.UserSignUp) -> User:
     return await User(**data).insert()
 
 
+async def get_hit_stats(
+    match: dict[str, Any], params: schemas.StatsParams
+) -> dict[str, Any]:
+    """Hit counters from the pre-aggregated buckets."""
+    with secondary_reads():
+        buckets = await QRCodeHits.get_buckets(
+            match={**match, "event": params.event.value},
+            granularity=params.granularity.value,
+            since=params.since,
+            until=params.until,
+        )
+    return {
+        "event": params.event,
+        "granularity": params.granularity,
+        "total": sum(bucket["count"] for bucket in buckets),
+        "buckets": buckets,
+    }
+
+
 @cbv(router)
 class BasicUserViews:
     user: User = Depends(get_current_active_user)
@@ -84,15 +114,17 @@ class BasicUserViews:
         sorting: schemas.SortingParams = Depends(),
     ) -> dict[str, Any]:
         """Get current active user's qrcodes."""
-        data = await QRCode.get_by_user(
-            user_id=self.user.id,
-            paging=paging,
-            sorting=sorting,
-        )
+        with secondary_reads():
+            data = await QRCode.get_by_user(
+                user_id=self.user.id,
+                paging=paging,
+                sorting=sorting,
+            )
+            total = await QRCode.find(QRCode.user_id == self.user.id).count()
         return {
             "page": paging.page,
             "per_page": paging.per_page,
-            "total": await QRCode.find(QRCode.user_id == self.user.id).count(),
+            "total": total,
             "data": data,
         }
 
@@ -112,11 +144,56 @@ class BasicUserViews:
                 detail="The user doesn't have enough privileges",
             )
 
-        file_name = f"{settings.STATIC_PATH}/{qrcode.qrcode_file}"
-        if os.path.isfile(file_name):
-            os.remove(file_name)
-
+        remove_qrcode_file(qrcode.qrcode_file)
         await qrcode.delete()
+        await delete_redirects([qrcode.qrcode_file])
+
+    @router.post("/me/qrcodes/bulk-delete", response_model=schemas.BulkOperationResult)
+    async def bulk_delete_qrcodes(
+        self,
+        criteria: schemas.QRCodeBulkDelete,
+        background_tasks: BackgroundTasks,
+    ) -> dict[str, int]:
+        """Delete current user's qrcodes matching the criteria."""
+        count = 0
+        async for file_names in QRCode.delete_matching(
+            *QRCode.build_filter(
+                user_id=self.user.id,
+                file_names=criteria.file_names,
+                created_before=criteria.created_before,
+            )
+        ):
+            await delete_redirects(file_names)
+            background_tasks.add_task(remove_qrcode_files, file_names)
+            count += len(file_names)
+
+        return {"count": count}
+
+    @router.get("/me/stats", response_model=schemas.HitStats)
+    async def get_current_user_stats(
+        self, params: schemas.StatsParams = Depends()
+    ) -> dict[str, Any]:
+        """Get hit counters over all qrcodes of the current user."""
+        return await get_hit_stats({"user_id": self.user.id}, params)
+
+    @router.get("/me/qrcodes/{qrcode_file_name}/stats", response_model=schemas.HitStats)
+    async def get_qrcode_stats(
+        self, qrcode_file_name: str, params: schemas.StatsParams = Depends()
+    ) -> dict[str, Any]:
+        """Get hit counters of one of the current user's qrcodes."""
+        qrcode = await QRCode.get_by_file_name(file_name=qrcode_file_name)
+        if not qrcode:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="QRCode with the file name cannot be found",
+            )
+        if qrcode.user_id != self.user.id and not self.user.is_superuser:
+            raise HTTPException(
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="The user doesn't have enough privileges",
+            )
+
+        return await get_hit_stats({"qrcode_file": qrcode_file_name}, params)
 
 
 @cbv(router)
@@ -155,15 +232,31 @@ class SuperuserViews:
         user = await User.get_by_username(username=username)
 
         if not user:
-            raise user_not_found_error
+            raise user_not_found_error()
 
         return user
 
+    @router.get("/{username}/stats", response_model=schemas.HitStats)
+    async def get_user_stats(
+        self, username: str, params: schemas.StatsParams = Depends()
+    ) -> dict[str, Any]:
+        """Get hit counters over all qrcodes of a specific user."""
+        user = await User.get_by_username(username=username)
+
+        if not user:
+            raise user_not_found_error()
+
+        return await get_hit_stats({"user_id": user.id}, params)
+
     @router.put("/{username}", response_model=schemas.User)
     async def update_user_by_username(
         self,
         username: str,
         user_in: schemas.UserUpdate,
+        background_tasks: BackgroundTasks,
+        delete_qrcodes: bool = Query(
+            False, description="Delete all qrcodes of a user being deactivated"
+        ),
     ) -> User:
         """Update a specific user by username."""
         user = await User.get_by_username(username=username)
@@ -173,4 +266,12 @@ class SuperuserViews:
 
         update_data = user_in.dict(exclude_unset=True)
         await user.set(update_data)
+
+        if delete_qrcodes and not user.is_active:
+            async for file_names in QRCode.delete_matching(
+                *QRCode.build_filter(user_id=user.id)
+            ):
+                await delete_redirects(file_names)
+                background_tasks.add_task(remove_qrcode_files, file_names)
+
         return user
@@ -0,0 +1,324 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any
+
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.core.render import render_pool
+
+logger = logging.getLogger(__name__)
+
+# Shedding order, lowest priority first; critical classes are never shed
+LOW, NORMAL, CRITICAL = 0, 1, 2
+
+PRIORITY_NAMES = {LOW: "low", NORMAL: "normal", CRITICAL: "critical"}
+
+# Route class -> priority
+CLASS_PRIORITIES = {
+    "fetch": CRITICAL,
+    "auth": CRITICAL,
+    "render": NORMAL,
+    "other": NORMAL,
+    "listing": LOW,
+    "batch": LOW,
+}
+
+# Endpoint (route name) -> route class, others are 'other'
+ROUTE_CLASSES = {
+    "fetch_qrcode_file": "fetch",
+    "resolve_dynamic_qrcode": "fetch",
+    "generate_access_token": "auth",
+    "generate_new_api_key": "auth",
+    "get_jwks": "auth",
+    "basic_qrcode": "render",
+    "location_qrcode": "render",
+    "wifi_qrcode": "render",
+    "vCard_qrcode": "render",
+    "meCard_qrcode": "render",
+    "dynamic_qrcode": "render",
+    "update_dynamic_qrcode": "render",
+    "print_sheet": "batch",
+    "mail_merge": "batch",
+    "bulk_delete_qrcodes": "batch",
+    "transfer_qrcodes": "batch",
+    "get_current_user_qrcodes": "listing",
+    "get_qrcodes": "listing",
+    "get_users": "listing",
+    "get_assets": "listing",
+    "get_current_user_stats": "listing",
+    "get_qrcode_stats": "listing",
+    "get_user_stats": "listing",
+}
+
+# Endpoints also rendering derivatives, requests for one are 'render' requests
+DERIVATIVE_ROUTES = {"fetch_qrcode_file"}
+
+# Routes admitted unconditionally, so probes and operators still get through
+EXEMPT_ROUTES = {
+    "liveness",
+    "readiness",
+    "get_query_stats",
+    "reset_query_stats",
+    "get_loop_stalls",
+    "reset_loop_stalls",
+    "get_admission_stats",
+}
+
+
+class Rejected(Exception):
+    """The request is shed, it should be retried later."""
+
+    def __init__(self, reason: str) -> None:
+        super().__init__(reason)
+        self.reason = reason
+
+
+@dataclass
+class RouteClass:
+    """In-flight requests of a route class, the ones queued for a slot
+    beyond ``max_in_flight`` (0 for unbounded) and their latencies."""
+
+    name: str
+    priority: int
+    max_in_flight: int
+    latency_target: float
+    in_flight: int = 0
+    waiters: deque[asyncio.Future] = field(default_factory=deque)
+    # Completed since the last evaluation
+    window_count: int = 0
+    window_latency: float = 0.0
+    window_delay: float = 0.0
+    # Averages of the last evaluation with completed requests
+    latency: float = 0.0
+    queueing_delay: float = 0.0
+    admitted: int = 0
+    shed: int = 0
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "route_class": self.name,
+            "priority": PRIORITY_NAMES[self.priority],
+            "in_flight": self.in_flight,
+            "queued": len(self.waiters),
+            "max_in_flight": self.max_in_flight,
+            "latency_ms": round(self.latency * 1000, 3),
+            "latency_target_ms": self.latency_target * 1000,
+            "queueing_delay_ms": round(self.queueing_delay * 1000, 3),
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+class AdmissionController:
+    """Sheds low priority work first when the service falls behind.
+
+    Every ``interval`` seconds the controller measures how late the event
+    loop runs it (the queueing delay of everything on the loop) and the
+    average latency (to the response start) and queueing delay of each
+    route class. When the loop delay or a class queueing delay exceed
+    ``loop_delay_target``, a class latency its target, or the render pool is
+    saturated, the service is overloaded: listings and batch renders are
+    shed at once, then renders if it lasts ``adjust_interval``, never
+    fetches and authentication. Shedding is lifted a priority at a time,
+    after ``adjust_interval`` without overload.
+
+    Independently of the level, a class with ``max_in_flight`` requests
+    running queues the next ones up to ``max_queue_delay``; low priority
+    requests are not queued.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        loop_delay_target: float,
+        max_queue_delay: float,
+        adjust_interval: float,
+        latency_targets: dict[str, float],
+        max_in_flight: dict[str, int],
+    ) -> None:
+        self.interval = interval
+        self.loop_delay_target = loop_delay_target
+        self.max_queue_delay = max_queue_delay
+        self.adjust_interval = adjust_interval
+        self.classes = {
+            name: RouteClass(
+                name=name,
+                priority=priority,
+                max_in_flight=max_in_flight.get(name, 0),
+                latency_target=latency_targets.get(name, 1.0),
+            )
+            for name, priority in CLASS_PRIORITIES.items()
+        }
+        # Priorities below it are shed
+        self.shed_below = LOW
+        self.loop_delay = 0.0
+        self.overloaded = False
+        self._changed_at = 0.0
+        self._task: asyncio.Task | None = None
+
+    def classify(self, route_name: str | None) -> RouteClass | None:
+        """Route class of an endpoint, ``None`` for exempt ones."""
+        if route_name in EXEMPT_ROUTES:
+            return None
+        return self.classes[ROUTE_CLASSES.get(route_name, "other")]
+
+    def classify_derivatives(self, route_name: str | None) -> RouteClass | None:
+        """Route class of the derivative requests of an endpoint, ``None``
+        when it serves no derivatives."""
+        if route_name in DERIVATIVE_ROUTES:
+            return self.classes["render"]
+        return None
+
+    async def acquire(self, route_class: RouteClass) -> float:
+        """Wait for a slot of ``route_class``, returns the queueing delay.
+        Raises ``Rejected`` when the request is shed."""
+        if route_class.priority < self.shed_below:
+            route_class.shed += 1
+            raise Rejected("The service is overloaded, retry later")
+
+        limit = route_class.max_in_flight
+        if not limit or route_class.in_flight < limit:
+            route_class.in_flight += 1
+            route_class.admitted += 1
+            return 0.0
+
+        if route_class.priority == LOW:
+            route_class.shed += 1
+            raise Rejected("Too many requests in flight, retry later")
+
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        route_class.waiters.append(waiter)
+        try:
+            # The slot is handed over by 'release', 'in_flight' unchanged
+            await asyncio.wait_for(waiter, self.max_queue_delay)
+        except asyncio.TimeoutError:
+            route_class.shed += 1
+            raise Rejected("Queued for too long, retry later")
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                self.release(route_class)
+            raise
+        finally:
+            if not waiter.done():
+                waiter.cancel()
+            if waiter in route_class.waiters:
+                route_class.waiters.remove(waiter)
+
+        route_class.admitted += 1
+        return time.monotonic() - started
+
+    def release(self, route_class: RouteClass) -> None:
+        while route_class.waiters:
+            waiter = route_class.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        route_class.in_flight -= 1
+
+    def record(self, route_class: RouteClass, latency: float, delay: float) -> None:
+        route_class.window_count += 1
+        route_class.window_latency += latency
+        route_class.window_delay += delay
+
+    def evaluate(self) -> None:
+        """Update the class averages and the shedding level."""
+        overloaded = self.loop_delay > self.loop_delay_target or (
+            render_pool.is_saturated
+        )
+        for route_class in self.classes.values():
+            if route_class.window_count:
+                route_class.latency = (
+                    route_class.window_latency / route_class.window_count
+                )
+                route_class.queueing_delay = (
+                    route_class.window_delay / route_class.window_count
+                )
+                route_class.window_count = 0
+                route_class.window_latency = route_class.window_delay = 0.0
+                # Shed classes complete nothing, only running ones count
+                overloaded = overloaded or (
+                    route_class.latency > route_class.latency_target
+                    or route_class.queueing_delay > self.loop_delay_target
+                )
+
+        now = time.monotonic()
+        if overloaded != self.overloaded:
+            self.overloaded = overloaded
+            self._changed_at = now
+            # Shed at once, admit again once it lasts
+            if not overloaded:
+                return
+        elif now - self._changed_at < self.adjust_interval:
+            return
+
+        shed_below = self.shed_below
+        if overloaded:
+            shed_below = min(shed_below + 1, CRITICAL)
+        else:
+            shed_below = max(shed_below - 1, LOW)
+        if shed_below == self.shed_below:
+            return
+
+        self.shed_below = shed_below
+        self._changed_at = now
+        if overloaded:
+            logger.warning(
+                "Overloaded, shedding priorities below "
+                f"{PRIORITY_NAMES[shed_below]} (loop delay "
+                f"{self.loop_delay * 1000:.0f}ms)"
+            )
+        elif shed_below > LOW:
+            logger.info(
+                "Load decreasing, shedding priorities below "
+                f"{PRIORITY_NAMES[shed_below]}"
+            )
+        else:
+            logger.info("No longer overloaded, not shedding requests")
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            self.loop_delay = max(loop.time() - started - self.interval, 0.0)
+            try:
+                self.evaluate()
+            except Exception:
+                logger.error("Admission control evaluation failure", exc_info=True)
+
+    def start(self) -> None:
+        if settings.ADMISSION_CONTROL_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "overloaded": self.overloaded,
+            "shedding": [
+                PRIORITY_NAMES[priority] for priority in range(LOW, self.shed_below)
+            ],
+            "loop_delay_ms": round(self.loop_delay * 1000, 3),
+            "route_classes": [
+                route_class.stats() for route_class in self.classes.values()
+            ],
+        }
+
+
+admission_controller = AdmissionController(
+    interval=settings.ADMISSION_INTERVAL_MS / 1000,
+    loop_delay_target=settings.ADMISSION_LOOP_DELAY_TARGET_MS / 1000,
+    max_queue_delay=settings.ADMISSION_MAX_QUEUE_MS / 1000,
+    adjust_interval=settings.ADMISSION_ADJUST_SECONDS,
+    latency_targets={
+        name: target / 1000
+        for name, target in settings.ADMISSION_LATENCY_TARGETS_MS.items()
+    },
+    max_in_flight=settings.ADMISSION_MAX_IN_FLIGHT,
+)
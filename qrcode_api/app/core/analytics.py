@@ -0,0 +1,140 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.db.database import db_initialized
+from qrcode_api.app.models import QRCode, QRCodeHits
+
+logger = logging.getLogger(__name__)
+
+# (qrcode file, event, hour bucket)
+HitKey = tuple[str, str, datetime]
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+class HitBuffer:
+    """Aggregates QR Code hits in memory and flushes them in bulk.
+
+    Every hit only increments an in-process counter; counters are written
+    with one unordered 'bulk_write' of '$inc' upserts per flush, either on an
+    interval or once too many distinct keys are pending. After a failed
+    flush, only the interval retries until one succeeds.
+    """
+
+    def __init__(self, flush_interval: float, max_keys: int) -> None:
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self._counters: Counter[HitKey] = Counter()
+        self._flush_lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._flush_task: asyncio.Task | None = None
+        # Early flushes are held off until then after a failure
+        self._retry_at = 0.0
+
+    def record(self, qrcode_file: str, event: str) -> None:
+        if not settings.ANALYTICS_ENABLED:
+            return
+
+        self._counters[(qrcode_file, event, hour_bucket(datetime.utcnow()))] += 1
+
+        if (
+            len(self._counters) >= self.max_keys
+            and (self._flush_task is None or self._flush_task.done())
+            and time.monotonic() >= self._retry_at
+        ):
+            self._flush_task = asyncio.get_running_loop().create_task(self.flush())
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            if not self._counters:
+                return
+
+            counters, self._counters = self._counters, Counter()
+            try:
+                await self._write(counters)
+            except Exception:
+                logger.error("Could not flush QR Code hits", exc_info=True)
+                self._retry_at = time.monotonic() + self.flush_interval
+                # Keep the counts for the next flush unless we fall too far behind
+                if len(self._counters) + len(counters) <= self.max_keys * 10:
+                    self._counters.update(counters)
+            else:
+                self._retry_at = 0.0
+
+    async def _write(self, counters: Counter[HitKey]) -> None:
+        owners = await QRCode.get_owners(
+            file_names=list({qrcode_file for qrcode_file, _, _ in counters})
+        )
+
+        buckets: Counter[tuple[str, str, str, datetime]] = Counter()
+        for (qrcode_file, event, hour), count in counters.items():
+            # Hits on unknown files (e.g. deleted codes) are dropped
+            if qrcode_file not in owners:
+                continue
+            buckets[(qrcode_file, event, "hour", hour)] += count
+            buckets[(qrcode_file, event, "day", day_bucket(hour))] += count
+
+        if not buckets:
+            return
+
+        retention = timedelta(days=settings.ANALYTICS_HOURLY_RETENTION_DAYS)
+        operations = []
+        for (qrcode_file, event, granularity, bucket), count in buckets.items():
+            # The owner is set on every flush, codes change hands (transfers)
+            update = {
+                "$inc": {"hits": count},
+                "$set": {"user_id": owners[qrcode_file]},
+            }
+            if granularity == "hour":
+                update["$setOnInsert"] = {"expires_at": bucket + retention}
+
+            operations.append(
+                UpdateOne(
+                    {
+                        "qrcode_file": qrcode_file,
+                        "event": event,
+                        "granularity": granularity,
+                        "bucket": bucket,
+                    },
+                    update,
+                    upsert=True,
+                )
+            )
+
+        await QRCodeHits.get_motor_collection().bulk_write(operations, ordered=False)
+
+    async def _run(self) -> None:
+        await db_initialized.wait()
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def start(self) -> None:
+        if settings.ANALYTICS_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Stop the periodic flush and write what is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if db_initialized.is_set():
+            await self.flush()
+
+
+hit_buffer = HitBuffer(
+    flush_interval=settings.ANALYTICS_FLUSH_INTERVAL_SECONDS,
+    max_keys=settings.ANALYTICS_FLUSH_MAX_KEYS,
+)
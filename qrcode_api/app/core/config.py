@@ -1,3 +1,5 @@
+from typing import Literal
+
 from pydantic import BaseSettings, MongoDsn
 
 # This adds support for 'mongodb+srv' connection schemas when using e.g. MongoDB Atlas
@@ -23,16 +25,95 @@ class Settings(BaseSettings):
     MONGO_URI: MongoDsn
     MAX_DB_CONN_COUNT: int
     MIN_DB_CONN_COUNT: int
+    DB_SERVER_SELECTION_TIMEOUT_MS: int = 5000
+    DB_CONNECT_BACKOFF_SECONDS: float = 0.5
+    DB_CONNECT_MAX_BACKOFF_SECONDS: float = 30.0
+    # Read preference of staleness tolerant reads (listings, stats, print
+    # sheets), 'primary' keeps them on the primary like every other read.
+    # Secondaries lagging more than the max staleness are skipped (at least
+    # 90 seconds, -1 for no limit).
+    SECONDARY_READ_PREFERENCE: str = "secondaryPreferred"
+    SECONDARY_READ_MAX_STALENESS_SECONDS: int = 90
+    # Group commit of QR Code inserts, one 'insert_many' per window
+    INSERT_BATCHING_ENABLED: bool = False
+    INSERT_BATCH_WINDOW_MS: float = 3.0
+    INSERT_BATCH_MAX_DOCUMENTS: int = 100
+    # Write concern of batched inserts ('majority' or a number of nodes) and
+    # journaling, the client defaults when unset
+    INSERT_BATCH_WRITE_CONCERN: str | None = None
+    INSERT_BATCH_JOURNAL: bool | None = None
 
     # Security Configuration
     SECRET_KEY: str
     EXPIRE_MINUTES: int
     ALGORITHM: str
+    # PEM files for asymmetric algorithms (RS*, ES*, EdDSA). Instances that
+    # only verify tokens can leave the private key unset.
+    JWT_PRIVATE_KEY_FILE: str | None = None
+    JWT_PUBLIC_KEY_FILE: str | None = None
+    JWT_VERIFY_CACHE_SIZE: int = 4096
 
     # Logger Configuration
     LOG_DIR: str
     LOG_CONFIG_FILE: str
 
+    # Request Profiling, on demand for superusers ('X-Profile' header or
+    # 'profile' query parameter) and 1 in PROFILE_SAMPLE_RATE requests
+    # stored under LOG_DIR/profiles (0 disables it)
+    PROFILING_ENABLED: bool = True
+    PROFILE_SAMPLE_RATE: int = 0
+    PROFILE_SAMPLE_INTERVAL_MS: float = 1.0
+    PROFILE_MAX_FILES: int = 100
+
+    # Mongo command monitoring, commands slower than SLOW_QUERY_MS are logged
+    # with their redacted shape, requests running more than QUERY_BUDGET_COUNT
+    # commands or QUERY_BUDGET_MS in total are flagged. QUERY_ROUTE_BUDGETS
+    # overrides the budget per route, e.g.
+    # {"GET /api/v1/users/me/qrcodes": {"count": 3, "ms": 100}}
+    QUERY_MONITORING_ENABLED: bool = True
+    SLOW_QUERY_MS: float = 100.0
+    QUERY_BUDGET_COUNT: int = 10
+    QUERY_BUDGET_MS: float = 250.0
+    QUERY_ROUTE_BUDGETS: dict[str, dict[str, float]] = {}
+
+    # Event loop stall watchdog, checks every LOOP_WATCHDOG_INTERVAL_MS that
+    # the loop ran, and logs the stack of calls blocking it for longer than
+    # LOOP_STALL_THRESHOLD_MS (captured for 1 in LOOP_STALL_STACK_SAMPLE_RATE
+    # stalls, all of them are counted)
+    LOOP_WATCHDOG_ENABLED: bool = True
+    LOOP_WATCHDOG_INTERVAL_MS: float = 20.0
+    LOOP_STALL_THRESHOLD_MS: float = 100.0
+    LOOP_STALL_STACK_SAMPLE_RATE: int = 1
+    LOOP_STALL_STACK_DEPTH: int = 30
+
+    # Admission control, sheds low priority requests (listings, batch
+    # renders, then renders) with a 503 when the event loop runs more than
+    # ADMISSION_LOOP_DELAY_TARGET_MS late, requests wait as long for a slot
+    # of their route class, or its latency to the response start exceeds its
+    # target. Fetches and authentication are never shed. Route classes
+    # beyond ADMISSION_MAX_IN_FLIGHT requests queue for ADMISSION_MAX_QUEUE_MS
+    ADMISSION_CONTROL_ENABLED: bool = True
+    ADMISSION_INTERVAL_MS: float = 250.0
+    ADMISSION_LOOP_DELAY_TARGET_MS: float = 50.0
+    ADMISSION_LATENCY_TARGETS_MS: dict[str, float] = {
+        "fetch": 100.0,
+        "auth": 1000.0,
+        "render": 1000.0,
+        "other": 1000.0,
+        "listing": 500.0,
+        "batch": 10_000.0,
+    }
+    ADMISSION_MAX_IN_FLIGHT: dict[str, int] = {
+        "render": 64,
+        "listing": 32,
+        "batch": 4,
+    }
+    ADMISSION_MAX_QUEUE_MS: float = 1000.0
+    # Time the load must stay above (below) the targets to shed one more
+    # (less) priority
+    ADMISSION_ADJUST_SECONDS: float = 2.0
+    ADMISSION_RETRY_AFTER_SECONDS: int = 5
+
     # Superuser Configuration
     SUPERUSER: str
     SUPERUSER_EMAIL: str
@@ -40,6 +121,80 @@ class Settings(BaseSettings):
 
     # Static File Directory
     STATIC_PATH: str
+    # 'app' sends files from the API, 'x-accel-redirect' (nginx) or
+    # 'x-sendfile' (Apache, lighttpd) let the reverse proxy send them
+    FILE_SERVING_MODE: Literal["app", "x-accel-redirect", "x-sendfile"] = "app"
+    # nginx 'internal' location mapped to STATIC_PATH
+    FILE_OFFLOAD_PREFIX: str = "/internal/qrcodes/"
+    FILE_CACHE_MAX_AGE: int = 31_536_000
+
+    # Uploaded assets (logos), not served publicly. ASSET_MAX_PIXELS bounds
+    # the decoded image, a small compressed file can expand a lot
+    ASSETS_PATH: str = "assets"
+    ASSET_MAX_BYTES: int = 2_000_000
+    ASSET_MAX_PIXELS: int = 16_000_000
+    ASSET_MAX_DIMENSION: int = 1024
+    LOGO_CACHE_SIZE: int = 256
+
+    # Derivatives of stored codes (other scale, format, border or colors)
+    DERIVATIVES_PATH: str = "derivatives"
+    DERIVATIVE_DISK_CACHE_BYTES: int = 1_000_000_000
+    DERIVATIVE_MEMORY_CACHE_BYTES: int = 32_000_000
+    # Larger derivatives are only cached on disk
+    DERIVATIVE_MEMORY_MAX_ITEM_BYTES: int = 256_000
+    # Largest width or height of a derivative in pixels (or SVG/PDF units)
+    DERIVATIVE_MAX_DIMENSION: int = 4096
+    # Anyone who can fetch a code can derive it, so besides the code's own
+    # scale, border and colors only these presets are rendered
+    DERIVATIVE_SCALES: list[int] = [1, 2, 4, 8, 16]
+    DERIVATIVE_BORDERS: list[int] = [0, 1, 2, 4]
+    DERIVATIVE_COLORS: list[str] = ["#000", "#fff", "#0000"]
+
+    # Dynamic QR Codes, base URL encoded in the images (e.g. https://qr.example.com)
+    PUBLIC_BASE_URL: str | None = None
+    REDIRECT_CACHE_SIZE: int = 100_000
+    REDIRECT_CACHE_TTL_SECONDS: float = 60.0
+    REDIRECT_NEGATIVE_CACHE_TTL_SECONDS: float = 5.0
+
+    # Scan Analytics Configuration
+    ANALYTICS_ENABLED: bool = True
+    ANALYTICS_FLUSH_INTERVAL_SECONDS: float = 10.0
+    ANALYTICS_FLUSH_MAX_KEYS: int = 5000
+    ANALYTICS_HOURLY_RETENTION_DAYS: int = 30
+
+    # Idempotency-Key of creation requests, responses are replayed to retries
+    # for IDEMPOTENCY_TTL_SECONDS. Retries wait for a request in progress on
+    # another worker up to IDEMPOTENCY_WAIT_SECONDS, and take over requests
+    # in progress for longer than IDEMPOTENCY_LOCK_SECONDS (crashed worker).
+    IDEMPOTENCY_TTL_SECONDS: int = 3600
+    IDEMPOTENCY_CACHE_SIZE: int = 10_000
+    IDEMPOTENCY_WAIT_SECONDS: float = 10.0
+    IDEMPOTENCY_LOCK_SECONDS: float = 60.0
+
+    # Print Sheets, codes laid out in a single PDF
+    PRINT_SHEET_MAX_CODES: int = 5000
+
+    # Mail merge of CSV uploads, MAIL_MERGE_CONCURRENCY rows are rendered at
+    # a time and stored MAIL_MERGE_BATCH_SIZE at a time. The output is
+    # buffered under MAIL_MERGE_SPOOL_PATH (system temporary directory when
+    # unset) until the client reads it
+    MAIL_MERGE_MAX_ROWS: int = 5_000_000
+    MAIL_MERGE_MAX_RECORD_BYTES: int = 64_000
+    MAIL_MERGE_CONCURRENCY: int = 8
+    MAIL_MERGE_BATCH_SIZE: int = 200
+    MAIL_MERGE_SPOOL_PATH: str | None = None
+
+    # Render Pool Configuration
+    RENDER_POOL_SIZE: int = 4
+    RENDER_POOL_MAX_PENDING: int = 64
+    # Directory shared by all workers (e.g. on the STATIC_PATH volume) to
+    # coalesce identical renders across processes, unset for per worker only
+    RENDER_LOCK_DIR: str | None = None
+    RENDER_COALESCE_WINDOW_SECONDS: float = 5.0
+
+    # Health Check Configuration
+    HEALTH_DB_TIMEOUT_SECONDS: float = 1.0
+    HEALTH_MIN_FREE_DISK_MB: int = 100
 
     class Config:
         # Place your .env file under this path
@@ -0,0 +1,208 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from hashlib import sha256
+from typing import Any, Awaitable, Callable
+
+from beanie import PydanticObjectId
+from beanie.operators import Set
+from fastapi import Header, HTTPException, Request, Response, status
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+from pymongo.errors import DuplicateKeyError
+
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.models import IdempotencyRecord
+from qrcode_api.app.utils.cache import TTLCache
+
+MAX_KEY_LENGTH = 255
+
+# Polling interval while a request is in progress on another worker
+POLL_INTERVAL_SECONDS = 0.05
+
+# (request fingerprint, response)
+StoredResponse = tuple[str, dict[str, Any]]
+
+
+def key_reused_error() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+        detail="The Idempotency-Key was already used for another request",
+    )
+
+
+def in_progress_error() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A request with this Idempotency-Key is still in progress",
+    )
+
+
+class IdempotencyStore:
+    """Responses of creation requests by idempotency key.
+
+    The first request with a key runs, its duplicates in the same process
+    wait for its result and those on other workers poll its record. Responses
+    are kept in the 'idempotency_records' collection, expired by a TTL index,
+    and in an in-process cache. A failed request leaves nothing behind, so
+    it can be retried.
+    """
+
+    def __init__(
+        self, ttl: float, cache_size: int, wait: float, lock_timeout: float
+    ) -> None:
+        self.ttl = ttl
+        self.wait = wait
+        self.lock_timeout = lock_timeout
+        self._cache: TTLCache[str, StoredResponse] = TTLCache(cache_size, ttl)
+        self._in_flight: dict[str, tuple[str, asyncio.Future]] = {}
+
+    async def run(
+        self, key: str, fingerprint: str, func: Callable[[], Awaitable[Any]]
+    ) -> tuple[dict[str, Any], bool]:
+        """Response of the request with ``key``, and whether it's replayed."""
+        while True:
+            stored = self._cache.get(key, None)
+            if stored is not None:
+                return self._replay(stored, fingerprint), True
+
+            in_flight = self._in_flight.get(key)
+            if in_flight is None:
+                break
+            in_flight_fingerprint, future = in_flight
+            if in_flight_fingerprint != fingerprint:
+                raise key_reused_error()
+            try:
+                return await asyncio.shield(future), True
+            except asyncio.CancelledError:
+                # Only retry when the first request was cancelled, not this one
+                if not future.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = (fingerprint, future)
+        try:
+            response, replayed = await self._run_once(key, fingerprint, func)
+        except Exception as error:
+            future.set_exception(error)
+            # Retrieved by the waiters, if any
+            future.exception()
+            raise
+        else:
+            future.set_result(response)
+            return response, replayed
+        finally:
+            future.cancel()
+            self._in_flight.pop(key, None)
+
+    async def _run_once(
+        self, key: str, fingerprint: str, func: Callable[[], Awaitable[Any]]
+    ) -> tuple[dict[str, Any], bool]:
+        """Claim ``key`` with an in progress record and run ``func``, or
+        replay the response of the request that claimed it first."""
+        deadline = time.monotonic() + self.wait
+        while True:
+            try:
+                await IdempotencyRecord(
+                    key=key,
+                    fingerprint=fingerprint,
+                    expires_at=datetime.utcnow() + timedelta(seconds=self.ttl),
+                ).insert()
+                break
+            except DuplicateKeyError:
+                record = await IdempotencyRecord.find_one(IdempotencyRecord.key == key)
+
+            if record is None:
+                # Its request failed or it expired in the meantime
+                continue
+            if record.fingerprint != fingerprint:
+                raise key_reused_error()
+            if record.response is not None:
+                self._cache.set(key, (fingerprint, record.response))
+                return record.response, True
+
+            if record.created_at < datetime.utcnow() - timedelta(
+                seconds=self.lock_timeout
+            ):
+                # Left in progress by a worker that went away, take it over
+                await self._release(key)
+                continue
+            if time.monotonic() >= deadline:
+                raise in_progress_error()
+            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+
+        try:
+            response = jsonable_encoder(await func())
+        except BaseException:
+            await self._release(key)
+            raise
+
+        await IdempotencyRecord.find(IdempotencyRecord.key == key).update(
+            Set({IdempotencyRecord.response: response})
+        )
+        self._cache.set(key, (fingerprint, response))
+        return response, False
+
+    @staticmethod
+    async def _release(key: str) -> None:
+        """Remove the in progress record of ``key``."""
+        await IdempotencyRecord.find(
+            IdempotencyRecord.key == key, IdempotencyRecord.response == None
+        ).delete()
+
+    @staticmethod
+    def _replay(stored: StoredResponse, fingerprint: str) -> dict[str, Any]:
+        stored_fingerprint, response = stored
+        if stored_fingerprint != fingerprint:
+            raise key_reused_error()
+        return response
+
+
+idempotency_store = IdempotencyStore(
+    ttl=settings.IDEMPOTENCY_TTL_SECONDS,
+    cache_size=settings.IDEMPOTENCY_CACHE_SIZE,
+    wait=settings.IDEMPOTENCY_WAIT_SECONDS,
+    lock_timeout=settings.IDEMPOTENCY_LOCK_SECONDS,
+)
+
+
+class Idempotency:
+    """'Idempotency-Key' header of a creation endpoint.
+
+    Retries of a request with the same key get the response of the first
+    one (with an 'Idempotent-Replayed' header) instead of creating again.
+    Keys are scoped per user.
+    """
+
+    def __init__(
+        self,
+        request: Request,
+        response: Response,
+        key: str
+        | None = Header(
+            None, alias="Idempotency-Key", min_length=1, max_length=MAX_KEY_LENGTH
+        ),
+    ) -> None:
+        self.request = request
+        self.response = response
+        self.key = key
+
+    async def run(
+        self,
+        user_id: PydanticObjectId,
+        payload: BaseModel,
+        func: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        if self.key is None:
+            return await func()
+
+        request = f"{self.request.method} {self.request.url.path}"
+        fingerprint = sha256(
+            f"{request} {payload.json(sort_keys=True)}".encode()
+        ).hexdigest()
+        response, replayed = await idempotency_store.run(
+            f"{user_id}:{self.key}", fingerprint, func
+        )
+        if replayed:
+            self.response.headers["Idempotent-Replayed"] = "true"
+        return response
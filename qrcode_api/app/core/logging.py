@@ -1,4 +1,4 @@
-import logging
+import logging.config
 
 import yaml
 from qrcode_api.app.core.config import settings
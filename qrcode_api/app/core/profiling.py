@@ -0,0 +1,204 @@
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Any
+
+# Innermost frame of an idle thread pool worker, waiting for work
+IDLE_WORKER_FUNCTIONS = {"_worker"}
+
+Stack = tuple[str, ...]
+
+
+class Profile:
+    """Time spent per call stack, ``unit`` is the unit of the weights."""
+
+    def __init__(self, name: str, stacks: Counter[Stack], unit: str) -> None:
+        self.name = name
+        self.stacks = stacks
+        self.unit = unit
+
+    def to_collapsed(self) -> str:
+        """Brendan Gregg's collapsed stacks ('flamegraph.pl', speedscope)."""
+        return "".join(
+            f"{';'.join(stack)} {round(weight)}\n"
+            for stack, weight in self.stacks.items()
+            if stack and round(weight) > 0
+        )
+
+    def to_speedscope(self) -> dict[str, Any]:
+        """Sampled profile in the speedscope file format."""
+        frames: dict[str, int] = {}
+        samples = []
+        weights = []
+        for stack, weight in self.stacks.items():
+            if not stack:
+                continue
+            samples.append([frames.setdefault(name, len(frames)) for name in stack])
+            weights.append(weight)
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": self.name,
+            "exporter": "qrcode-api",
+            "activeProfileIndex": 0,
+            "shared": {"frames": [{"name": name} for name in frames]},
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": self.name,
+                    "unit": self.unit,
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+        }
+
+    def render(self, output_format: str) -> tuple[bytes, str]:
+        """Serialized profile and its media type."""
+        if output_format == "collapsed":
+            return self.to_collapsed().encode(), "text/plain; charset=utf-8"
+        return json.dumps(self.to_speedscope()).encode(), "application/json"
+
+
+class FrameLabels:
+    """'function (module/file.py:line)' per code object, computed once."""
+
+    def __init__(self) -> None:
+        self._labels: dict[CodeType, str] = {}
+
+    def label(self, code: CodeType) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename.replace(os.sep, "/").rsplit("/", 2)[-2:]
+            label = f"{code.co_name} ({'/'.join(path)}:{code.co_firstlineno})"
+            # ';' separates frames in collapsed stacks
+            label = label.replace(";", ",")
+            self._labels[code] = label
+        return label
+
+    def stack(self, frame: FrameType | None) -> Stack:
+        labels = []
+        while frame is not None:
+            labels.append(self.label(frame.f_code))
+            frame = frame.f_back
+        return tuple(reversed(labels))
+
+
+class SamplingProfiler:
+    """Samples the stacks of the profiled thread and of the render pool
+    workers every ``interval`` seconds from a background thread.
+
+    Low overhead, the profile covers everything running meanwhile, not only
+    the profiled request.
+    """
+
+    unit = "milliseconds"
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.stacks: Counter[Stack] = Counter()
+        self._labels = FrameLabels()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._target = 0
+
+    def start(self) -> None:
+        self._target = threading.get_ident()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self) -> None:
+        weight = self.interval * 1000
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread in threading.enumerate():
+                frame = frames.get(thread.ident)
+                if frame is None:
+                    continue
+                if thread.ident == self._target:
+                    self.stacks[self._labels.stack(frame)] += weight
+                elif (
+                    thread.name.startswith("render")
+                    and frame.f_code.co_name not in IDLE_WORKER_FUNCTIONS
+                ):
+                    stack = (f"thread {thread.name}", *self._labels.stack(frame))
+                    self.stacks[stack] += weight
+
+
+class TracingProfiler:
+    """Deterministic profiler, accounts the time between every call and
+    return event of the profiled thread to the current stack.
+
+    Exact call stacks but a significant overhead, and render pool threads
+    are not traced.
+    """
+
+    unit = "nanoseconds"
+
+    def __init__(self) -> None:
+        self.stacks: Counter[Stack] = Counter()
+        self._labels = FrameLabels()
+        self._stack: Stack = ()
+        self._last = 0
+
+    def start(self) -> None:
+        self._last = time.perf_counter_ns()
+        sys.setprofile(self._event)
+
+    def stop(self) -> None:
+        sys.setprofile(None)
+        self.stacks[self._stack] += time.perf_counter_ns() - self._last
+
+    def _event(self, frame: FrameType, event: str, arg: Any) -> None:
+        self.stacks[self._stack] += time.perf_counter_ns() - self._last
+
+        if event == "call":
+            self._stack = self._labels.stack(frame)
+        elif event == "return":
+            self._stack = self._labels.stack(frame.f_back)
+        elif event == "c_call":
+            name = getattr(arg, "__qualname__", None) or repr(arg)
+            self._stack = (*self._labels.stack(frame), f"{name} (builtin)")
+        else:
+            self._stack = self._labels.stack(frame)
+
+        # Leave the profiler's own time out of the profile
+        self._last = time.perf_counter_ns()
+
+
+def make_profiler(mode: str, interval: float) -> SamplingProfiler | TracingProfiler:
+    if mode == "deterministic":
+        return TracingProfiler()
+    return SamplingProfiler(interval)
+
+
+def store_profile(profile: Profile, directory: str, max_files: int) -> str:
+    """Write a speedscope profile to ``directory`` and drop the oldest ones
+    beyond ``max_files``. Returns the file name."""
+    os.makedirs(directory, exist_ok=True)
+    file_name = f"{time.strftime('%Y%m%dT%H%M%S')}-{time.time_ns() % 10**9:09d}"
+    file_name = f"{file_name}.speedscope.json"
+    with open(os.path.join(directory, file_name), "w") as file:
+        json.dump(profile.to_speedscope(), file)
+
+    profiles = sorted(
+        name for name in os.listdir(directory) if name.endswith(".speedscope.json")
+    )
+    for name in profiles[: max(len(profiles) - max_files, 0)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+    return file_name
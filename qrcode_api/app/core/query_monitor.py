@@ -0,0 +1,274 @@
+import logging
+import threading
+from collections import deque
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any
+
+from pymongo.monitoring import (
+    CommandFailedEvent,
+    CommandListener,
+    CommandStartedEvent,
+    CommandSucceededEvent,
+)
+from starlette.types import Scope
+
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.utils.routes import route_label
+
+logger = logging.getLogger(__name__)
+
+# Handshakes and session housekeeping, not queries of the application
+IGNORED_COMMANDS = {
+    "hello",
+    "ismaster",
+    "isMaster",
+    "ping",
+    "saslStart",
+    "saslContinue",
+    "endSessions",
+    "buildInfo",
+    "getLastError",
+}
+
+# Where each command keeps its filter, sort and pipeline
+SHAPE_FIELDS = ("filter", "query", "sort", "projection", "pipeline", "q", "u")
+
+SLOW_QUERIES_KEPT = 100
+
+
+def redact(value: Any) -> Any:
+    """Shape of a query: field names and operators, every value as '?'."""
+    if isinstance(value, dict):
+        return {key: redact(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # Statements (updates, deletes, pipelines) keep each of their shapes,
+        # plain value lists ('$in') a single placeholder
+        shapes = [redact(item) for item in value]
+        if all(shape == "?" for shape in shapes):
+            return ["?"] if shapes else []
+        return shapes
+    return "?"
+
+
+def command_shape(command_name: str, command: dict[str, Any]) -> dict[str, Any]:
+    shape = {name: redact(command[name]) for name in SHAPE_FIELDS if name in command}
+    for statements in ("updates", "deletes"):
+        if statements in command:
+            shape[statements] = [
+                {
+                    name: redact(statement[name])
+                    for name in ("q", "u")
+                    if name in statement
+                }
+                for statement in command[statements][:1]
+            ]
+    return shape
+
+
+def command_collection(command_name: str, command: dict[str, Any]) -> str:
+    if command_name == "getMore":
+        return str(command.get("collection", ""))
+    collection = command.get(command_name)
+    return collection if isinstance(collection, str) else ""
+
+
+@dataclass
+class RequestQueries:
+    """Commands run on behalf of one request."""
+
+    scope: Scope
+    count: int = 0
+    duration_ms: float = 0.0
+
+    @property
+    def route(self) -> str:
+        return route_label(self.scope)
+
+
+@dataclass
+class StartedCommand:
+    name: str
+    collection: str
+    shape: dict[str, Any]
+    request: RequestQueries | None
+
+
+@dataclass
+class CommandStats:
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    slow: int = 0
+
+
+@dataclass
+class RouteStats:
+    requests: int = 0
+    queries: int = 0
+    total_ms: float = 0.0
+    max_queries: int = 0
+    max_ms: float = 0.0
+    over_budget: int = 0
+
+
+@dataclass
+class Budget:
+    count: int
+    duration_ms: float
+
+
+_request_queries: ContextVar[RequestQueries | None] = ContextVar(
+    "request_queries", default=None
+)
+
+
+class QueryMonitor(CommandListener):
+    """Records the duration, collection and route of every Mongo command.
+
+    Commands slower than ``slow_ms`` are logged with their redacted shape,
+    requests exceeding the query count or time budget of their route are
+    logged and counted, so N+1 patterns and unindexed queries show up.
+
+    pymongo calls the listener from Motor's executor threads, in a copy of
+    the context of the awaiting request, hence the lock.
+    """
+
+    def __init__(
+        self,
+        slow_ms: float,
+        budget: Budget,
+        route_budgets: dict[str, Budget] | None = None,
+    ) -> None:
+        self.slow_ms = slow_ms
+        self.budget = budget
+        self.route_budgets = route_budgets or {}
+        self._lock = threading.Lock()
+        self._started: dict[tuple[int, Any], StartedCommand] = {}
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.since = datetime.utcnow()
+            self.commands: dict[tuple[str, str], CommandStats] = {}
+            self.routes: dict[str, RouteStats] = {}
+            self.slow_queries: deque[dict[str, Any]] = deque(maxlen=SLOW_QUERIES_KEPT)
+
+    # Request tracking, see 'QueryMonitorMiddleware'
+
+    def start_request(self, scope: Scope) -> RequestQueries:
+        request = RequestQueries(scope)
+        _request_queries.set(request)
+        return request
+
+    def finish_request(self, request: RequestQueries) -> None:
+        route = request.route
+        budget = self.route_budgets.get(route, self.budget)
+        over_budget = (
+            request.count > budget.count or request.duration_ms > budget.duration_ms
+        )
+
+        with self._lock:
+            stats = self.routes.setdefault(route, RouteStats())
+            stats.requests += 1
+            stats.queries += request.count
+            stats.total_ms += request.duration_ms
+            stats.max_queries = max(stats.max_queries, request.count)
+            stats.max_ms = max(stats.max_ms, request.duration_ms)
+            stats.over_budget += over_budget
+
+        if over_budget:
+            logger.warning(
+                f"{route} exceeded its query budget: {request.count} queries "
+                f"in {request.duration_ms:.1f}ms (budget {budget.count} queries, "
+                f"{budget.duration_ms:.0f}ms)"
+            )
+
+    # CommandListener
+
+    def started(self, event: CommandStartedEvent) -> None:
+        if event.command_name in IGNORED_COMMANDS:
+            return
+        command = StartedCommand(
+            name=event.command_name,
+            collection=command_collection(event.command_name, event.command),
+            shape=command_shape(event.command_name, event.command),
+            request=_request_queries.get(),
+        )
+        with self._lock:
+            self._started[(event.request_id, event.connection_id)] = command
+
+    def succeeded(self, event: CommandSucceededEvent) -> None:
+        self._finished(event.request_id, event.connection_id, event.duration_micros)
+
+    def failed(self, event: CommandFailedEvent) -> None:
+        self._finished(event.request_id, event.connection_id, event.duration_micros)
+
+    def _finished(self, request_id: int, connection_id: Any, micros: int) -> None:
+        duration_ms = micros / 1000
+        with self._lock:
+            command = self._started.pop((request_id, connection_id), None)
+            if command is None:
+                return
+
+            stats = self.commands.setdefault(
+                (command.collection, command.name), CommandStats()
+            )
+            stats.count += 1
+            stats.total_ms += duration_ms
+            stats.max_ms = max(stats.max_ms, duration_ms)
+
+            request = command.request
+            if request is not None:
+                request.count += 1
+                request.duration_ms += duration_ms
+
+            slow = duration_ms >= self.slow_ms
+            if slow:
+                stats.slow += 1
+                route = request.route if request is not None else None
+                self.slow_queries.append(
+                    {
+                        "at": datetime.utcnow(),
+                        "route": route,
+                        "collection": command.collection,
+                        "command": command.name,
+                        "shape": command.shape,
+                        "duration_ms": round(duration_ms, 3),
+                    }
+                )
+
+        if slow:
+            logger.warning(
+                f"Slow {command.name} on {command.collection!r} "
+                f"({duration_ms:.1f}ms, {route or 'no request'}): {command.shape}"
+            )
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "since": self.since,
+                "routes": [
+                    {"route": route, **vars(stats)}
+                    for route, stats in sorted(self.routes.items())
+                ],
+                "commands": [
+                    {"collection": collection, "command": name, **vars(stats)}
+                    for (collection, name), stats in sorted(self.commands.items())
+                ],
+                "slow_queries": list(self.slow_queries),
+            }
+
+
+query_monitor = QueryMonitor(
+    slow_ms=settings.SLOW_QUERY_MS,
+    budget=Budget(settings.QUERY_BUDGET_COUNT, settings.QUERY_BUDGET_MS),
+    route_budgets={
+        route: Budget(
+            int(budget.get("count", settings.QUERY_BUDGET_COUNT)),
+            budget.get("ms", settings.QUERY_BUDGET_MS),
+        )
+        for route, budget in settings.QUERY_ROUTE_BUDGETS.items()
+    },
+)
@@ -0,0 +1,173 @@
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, TypeVar
+
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.utils.files import link_qrcode_file
+
+ReturnType = TypeVar("ReturnType")
+
+
+class RenderPool:
+    """Bounded worker pool for CPU bound rendering work (segno, Pillow).
+
+    Keeps rendering off the event loop and tracks how many jobs are running
+    or waiting, so readiness checks can report saturation.
+    """
+
+    def __init__(self, size: int, max_pending: int) -> None:
+        self.size = size
+        self.max_pending = max_pending
+        self.in_flight = 0
+        self._executor: ThreadPoolExecutor | None = None
+
+    @property
+    def executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=self.size, thread_name_prefix="render"
+            )
+        return self._executor
+
+    @property
+    def pending(self) -> int:
+        """Jobs submitted but not yet picked up by a worker."""
+        return max(self.in_flight - self.size, 0)
+
+    @property
+    def saturation(self) -> float:
+        """Ratio of in flight jobs to the pool capacity (workers + queue)."""
+        return self.in_flight / (self.size + self.max_pending)
+
+    @property
+    def is_saturated(self) -> bool:
+        return self.pending >= self.max_pending
+
+    async def run(
+        self, func: Callable[..., ReturnType], *args: Any, **kwargs: Any
+    ) -> ReturnType:
+        """Run ``func`` in the pool and await its result."""
+        loop = asyncio.get_running_loop()
+        self.in_flight += 1
+        try:
+            return await loop.run_in_executor(
+                self.executor, functools.partial(func, *args, **kwargs)
+            )
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "size": self.size,
+            "in_flight": self.in_flight,
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "saturation": round(self.saturation, 3),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+
+class RenderCoalescer:
+    """Single-flight rendering of identical QR Codes.
+
+    Concurrent renders with the same key (a hash of the canonical render
+    parameters) share one in-flight render: the first caller renders into
+    its file and every other caller gets a hard link to it once it is done.
+
+    With a lock directory shared by the workers, renders are also coalesced
+    across processes: a striped lock file serializes renders of a key and
+    records the last rendered file, which other workers reuse for
+    ``window`` seconds instead of rendering it again.
+    """
+
+    lock_stripes = 1024
+
+    def __init__(self, pool: RenderPool, lock_dir: str | None, window: float) -> None:
+        self.pool = pool
+        self.lock_dir = lock_dir
+        self.window = window
+        self.coalesced = 0
+        self._in_flight: dict[str, asyncio.Task[str]] = {}
+
+    async def render(self, key: str, path: str, func: Callable[[], None]) -> None:
+        """Make sure the rendering of ``key`` is stored at ``path``, calling
+        ``func`` (which writes ``path``) only if no identical render is
+        already in flight."""
+        task = self._in_flight.get(key)
+        if task is None:
+            # A task, so a client disconnecting doesn't cancel the others' render
+            task = asyncio.create_task(
+                self.pool.run(self._render_locked, key, path, func)
+            )
+            task.add_done_callback(functools.partial(self._done, key))
+            self._in_flight[key] = task
+        else:
+            self.coalesced += 1
+
+        source = await asyncio.shield(task)
+        if source != path:
+            link_qrcode_file(source, path)
+
+    def _done(self, key: str, task: asyncio.Task[str]) -> None:
+        del self._in_flight[key]
+        if not task.cancelled():
+            # Marks a failure as retrieved even when every waiter went away
+            task.exception()
+
+    def _render_locked(self, key: str, path: str, func: Callable[[], None]) -> str:
+        """Render, or link a file rendered by another worker, returning the
+        path the rendering is stored at."""
+        if self.lock_dir is None:
+            func()
+            return path
+
+        import fcntl
+
+        stripe = int(key[:8], 16) % self.lock_stripes
+        os.makedirs(self.lock_dir, exist_ok=True)
+        with open(os.path.join(self.lock_dir, f"{stripe}.lock"), "a+") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                lock.seek(0)
+                # '<key> <rendered at> <path>' of the last render on the stripe
+                marker = lock.read().split(" ", 2)
+                if (
+                    len(marker) == 3
+                    and marker[0] == key
+                    and time.time() - float(marker[1]) < self.window
+                    and os.path.isfile(marker[2])
+                ):
+                    link_qrcode_file(marker[2], path)
+                    return path
+
+                func()
+
+                lock.seek(0)
+                lock.truncate()
+                lock.write(f"{key} {time.time()} {os.path.abspath(path)}")
+                lock.flush()
+                return path
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def stats(self) -> dict[str, Any]:
+        return {"in_flight": len(self._in_flight), "coalesced": self.coalesced}
+
+
+render_pool = RenderPool(
+    size=settings.RENDER_POOL_SIZE,
+    max_pending=settings.RENDER_POOL_MAX_PENDING,
+)
+
+render_coalescer = RenderCoalescer(
+    render_pool,
+    lock_dir=settings.RENDER_LOCK_DIR,
+    window=settings.RENDER_COALESCE_WINDOW_SECONDS,
+)
@@ -1,24 +1,33 @@
 import secrets
+from calendar import timegm
+from functools import lru_cache
 from hashlib import md5
-from typing import Any, Union
+from typing import TYPE_CHECKING, Any, Union
 from datetime import datetime, timedelta
 
-from jose import jwt
-from passlib.context import CryptContext
-
 from qrcode_api.app.core.config import settings
+from qrcode_api.app.core.tokens import get_token_codec
+
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+
+@lru_cache(maxsize=None)
+def get_pwd_context() -> "CryptContext":
+    """Build the password hashing context on first use instead of at import"""
+    from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a hashed password and a plain password"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return get_pwd_context().verify(plain_password, hashed_password)
 
 
 def get_password_hash(password: str) -> str:
     """Hash a password for storing"""
-    return pwd_context.hash(password)
+    return get_pwd_context().hash(password)
 
 
 def create_access_token(
@@ -29,14 +38,14 @@ def create_access_token(
     if expires_delta:
         expire = datetime.utcnow() + expires_delta
     else:
-        expire = datetime.utcnow() + timedelta(settings.EXPIRE_MINUTES)
+        expire = datetime.utcnow() + timedelta(minutes=settings.EXPIRE_MINUTES)
 
     payload = {
-        "exp": expire,
+        "exp": timegm(expire.utctimetuple()),
         "sub": str(subject),
     }
 
-    return jwt.encode(payload, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    return get_token_codec().encode(payload)
 
 
 def create_api_key() -> str:
@@ -0,0 +1,230 @@
+import json
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, NamedTuple
+
+from jose import jwk
+from jose.exceptions import ExpiredSignatureError, JWSError, JWTError
+from jose.utils import base64url_decode, base64url_encode
+
+from qrcode_api.app.core.config import settings
+
+HMAC_ALGORITHMS = {"HS256", "HS384", "HS512"}
+ASYMMETRIC_ALGORITHMS = {
+    "RS256",
+    "RS384",
+    "RS512",
+    "ES256",
+    "ES384",
+    "ES512",
+    "EdDSA",
+}
+
+
+class TokenClaims(NamedTuple):
+    sub: str | None
+    exp: int
+
+
+class Ed25519Key:
+    """Minimal jose-like key wrapper, python-jose has no EdDSA support."""
+
+    def __init__(self, pem: bytes) -> None:
+        from cryptography.hazmat.primitives.asymmetric.ed25519 import (
+            Ed25519PrivateKey,
+            Ed25519PublicKey,
+        )
+        from cryptography.hazmat.primitives.serialization import (
+            load_pem_private_key,
+            load_pem_public_key,
+        )
+
+        if b"PRIVATE KEY" in pem:
+            self.private_key = load_pem_private_key(pem, password=None)
+            self.public_key = self.private_key.public_key()
+        else:
+            self.private_key = None
+            self.public_key = load_pem_public_key(pem)
+
+        if not isinstance(self.public_key, Ed25519PublicKey) or not (
+            self.private_key is None or isinstance(self.private_key, Ed25519PrivateKey)
+        ):
+            raise JWTError("EdDSA requires an Ed25519 key")
+
+    def sign(self, msg: bytes) -> bytes:
+        if self.private_key is None:
+            raise JWTError("A private key is required to sign tokens")
+        return self.private_key.sign(msg)
+
+    def verify(self, msg: bytes, sig: bytes) -> bool:
+        from cryptography.exceptions import InvalidSignature
+
+        try:
+            self.public_key.verify(sig, msg)
+        except InvalidSignature:
+            return False
+        return True
+
+    def to_dict(self) -> dict[str, str]:
+        from cryptography.hazmat.primitives.serialization import (
+            Encoding,
+            PublicFormat,
+        )
+
+        raw = self.public_key.public_bytes(Encoding.Raw, PublicFormat.Raw)
+        return {
+            "kty": "OKP",
+            "crv": "Ed25519",
+            "alg": "EdDSA",
+            "use": "sig",
+            "x": base64url_encode(raw).decode(),
+        }
+
+
+def _read_key_file(path: str | None, name: str) -> bytes:
+    if not path:
+        raise JWTError(f"{name} must be set for the {settings.ALGORITHM} algorithm")
+    with open(path, "rb") as key_file:
+        return key_file.read()
+
+
+def _construct_key(material: bytes | str, algorithm: str) -> Any:
+    if algorithm == "EdDSA":
+        return Ed25519Key(material)
+    return jwk.construct(material, algorithm)
+
+
+class TokenCodec:
+    """Signs and verifies compact JWS tokens with keys prepared once.
+
+    ``jose.jwt.decode`` re-parses the key material and resolves the algorithm
+    on every call; here both happen at construction. Verified tokens are kept
+    in a small LRU until they expire so repeated requests with the same token
+    skip the signature check entirely.
+    """
+
+    def __init__(
+        self,
+        algorithm: str,
+        signing_key: Any,
+        verification_key: Any,
+        cache_size: int,
+    ) -> None:
+        self.algorithm = algorithm
+        self.signing_key = signing_key
+        self.verification_key = verification_key
+        self.cache_size = cache_size
+        self._header = base64url_encode(
+            json.dumps({"alg": algorithm, "typ": "JWT"}, separators=(",", ":")).encode()
+        )
+        self._cache: OrderedDict[str, TokenClaims] = OrderedDict()
+
+    @classmethod
+    def from_settings(cls) -> "TokenCodec":
+        algorithm = settings.ALGORITHM
+
+        if algorithm in HMAC_ALGORITHMS:
+            signing_key = verification_key = _construct_key(
+                settings.SECRET_KEY, algorithm
+            )
+        elif algorithm in ASYMMETRIC_ALGORITHMS:
+            verification_key = _construct_key(
+                _read_key_file(settings.JWT_PUBLIC_KEY_FILE, "JWT_PUBLIC_KEY_FILE"),
+                algorithm,
+            )
+            # Instances that only verify tokens don't need the private key
+            signing_key = (
+                _construct_key(
+                    _read_key_file(
+                        settings.JWT_PRIVATE_KEY_FILE, "JWT_PRIVATE_KEY_FILE"
+                    ),
+                    algorithm,
+                )
+                if settings.JWT_PRIVATE_KEY_FILE
+                else None
+            )
+        else:
+            raise JWTError(f"Unsupported algorithm: {algorithm}")
+
+        return cls(
+            algorithm=algorithm,
+            signing_key=signing_key,
+            verification_key=verification_key,
+            cache_size=settings.JWT_VERIFY_CACHE_SIZE,
+        )
+
+    @property
+    def is_asymmetric(self) -> bool:
+        return self.algorithm in ASYMMETRIC_ALGORITHMS
+
+    def encode(self, claims: dict[str, Any]) -> str:
+        if self.signing_key is None:
+            raise JWTError("No signing key configured")
+
+        payload = base64url_encode(json.dumps(claims, separators=(",", ":")).encode())
+        signing_input = self._header + b"." + payload
+        signature = base64url_encode(self.signing_key.sign(signing_input))
+        return (signing_input + b"." + signature).decode()
+
+    def decode(self, token: str) -> TokenClaims:
+        """Verify ``token`` and return its claims, raises ``JWTError``."""
+        now = int(time.time())
+
+        claims = self._cache.get(token)
+        if claims is not None:
+            if claims.exp > now:
+                self._cache.move_to_end(token)
+                return claims
+            del self._cache[token]
+            raise ExpiredSignatureError("Signature has expired.")
+
+        claims = self._verify(token)
+        if claims.exp <= now:
+            raise ExpiredSignatureError("Signature has expired.")
+
+        self._cache[token] = claims
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+        return claims
+
+    def _verify(self, token: str) -> TokenClaims:
+        try:
+            signing_input, encoded_signature = token.encode().rsplit(b".", 1)
+            encoded_header, encoded_payload = signing_input.split(b".", 1)
+            header = json.loads(base64url_decode(encoded_header))
+            signature = base64url_decode(encoded_signature)
+        except (ValueError, TypeError):
+            raise JWTError("Invalid token format") from None
+
+        if not isinstance(header, dict) or header.get("alg") != self.algorithm:
+            raise JWSError("The specified alg value is not allowed")
+
+        if not self.verification_key.verify(signing_input, signature):
+            raise JWSError("Signature verification failed.")
+
+        try:
+            payload = json.loads(base64url_decode(encoded_payload))
+            exp = int(payload["exp"])
+        except (ValueError, TypeError, KeyError):
+            raise JWTError("Invalid payload") from None
+
+        sub = payload.get("sub")
+        return TokenClaims(sub=None if sub is None else str(sub), exp=exp)
+
+    def public_jwks(self) -> dict[str, list[dict[str, Any]]]:
+        """Public keys in JWK Set format, for verification at the edge."""
+        if not self.is_asymmetric:
+            return {"keys": []}
+
+        key = self.verification_key.to_dict()
+        key.setdefault("alg", self.algorithm)
+        key.setdefault("use", "sig")
+        return {"keys": [key]}
+
+
+@lru_cache(maxsize=None)
+def get_token_codec() -> TokenCodec:
+    """The process wide token codec, built on first use (or at startup)."""
+    return TokenCodec.from_settings()
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+from types import FrameType
+from typing import Any
+
+from starlette.types import Scope
+
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.utils.routes import route_label
+
+logger = logging.getLogger(__name__)
+
+STALLS_KEPT = 50
+
+
+def format_stack(frame: FrameType | None, limit: int) -> list[str]:
+    """'function (module/file.py:line)' of the innermost ``limit`` frames,
+    outermost first."""
+    lines = []
+    while frame is not None and len(lines) < limit:
+        code = frame.f_code
+        path = "/".join(code.co_filename.replace(os.sep, "/").rsplit("/", 2)[-2:])
+        lines.append(f"{code.co_name} ({path}:{frame.f_lineno})")
+        frame = frame.f_back
+    lines.reverse()
+    return lines
+
+
+@dataclass
+class Stall:
+    """Event loop blocked since ``last_tick`` (monotonic)."""
+
+    last_tick: float
+    at: datetime
+    route: str | None
+    stack: list[str] | None
+
+
+@dataclass
+class StallStats:
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+
+
+class LoopWatchdog:
+    """Detects calls blocking the event loop.
+
+    A callback on the loop ticks every ``interval`` seconds, a background
+    thread checks the ticks at the same interval. When the loop didn't tick
+    for ``threshold`` seconds, the thread captures the stack of the loop
+    thread, i.e. the blocking call, and the route of the request running.
+    The stall is logged and counted once the loop ticks again.
+
+    The stack is captured for 1 in ``stack_sample_rate`` stalls, stalls are
+    counted either way.
+    """
+
+    def __init__(
+        self,
+        threshold: float,
+        interval: float,
+        stack_sample_rate: int,
+        stack_depth: int,
+    ) -> None:
+        self.threshold = threshold
+        self.interval = interval
+        self.stack_sample_rate = stack_sample_rate
+        self.stack_depth = stack_depth
+        # Request handled by each task, see 'StallWatchdogMiddleware'
+        self.requests: dict[asyncio.Task, Scope] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread = 0
+        self._last_tick = 0.0
+        self._tick_handle: asyncio.TimerHandle | None = None
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._detected = 0
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.since = datetime.utcnow()
+            self.total = StallStats()
+            self.routes: dict[str, StallStats] = {}
+            self.stalls: deque[dict[str, Any]] = deque(maxlen=STALLS_KEPT)
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._tick()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._watch, name="loop-watchdog", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._tick_handle is not None:
+            self._tick_handle.cancel()
+            self._tick_handle = None
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _tick(self) -> None:
+        self._last_tick = time.monotonic()
+        self._tick_handle = self._loop.call_later(self.interval, self._tick)
+
+    def _current_route(self) -> str | None:
+        task = asyncio.current_task(self._loop)
+        scope = self.requests.get(task) if task is not None else None
+        return route_label(scope) if scope is not None else None
+
+    def _watch(self) -> None:
+        stall: Stall | None = None
+        while not self._stop.wait(self.interval):
+            last_tick = self._last_tick
+            if stall is not None:
+                if last_tick != stall.last_tick:
+                    # The tick was late by the stall, less its own interval
+                    self._record(stall, last_tick - stall.last_tick - self.interval)
+                    stall = None
+                continue
+
+            if time.monotonic() - last_tick < self.threshold:
+                continue
+
+            self._detected += 1
+            stack = None
+            if self._detected % self.stack_sample_rate == 0:
+                frame = sys._current_frames().get(self._loop_thread)
+                stack = format_stack(frame, self.stack_depth)
+            stall = Stall(
+                last_tick=last_tick,
+                at=datetime.utcnow(),
+                route=self._current_route(),
+                stack=stack,
+            )
+
+    def _record(self, stall: Stall, duration: float) -> None:
+        duration_ms = duration * 1000
+        route = stall.route or "(no request)"
+        with self._lock:
+            for stats in (self.total, self.routes.setdefault(route, StallStats())):
+                stats.count += 1
+                stats.total_ms += duration_ms
+                stats.max_ms = max(stats.max_ms, duration_ms)
+            self.stalls.append(
+                {
+                    "at": stall.at,
+                    "route": stall.route,
+                    "duration_ms": round(duration_ms, 3),
+                    "stack": stall.stack,
+                }
+            )
+
+        stack = "".join(f"\n  {line}" for line in stall.stack or ())
+        logger.warning(f"Event loop blocked for {duration_ms:.0f}ms ({route}){stack}")
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "since": self.since,
+                "threshold_ms": self.threshold * 1000,
+                **vars(self.total),
+                "routes": [
+                    {"route": route, **vars(stats)}
+                    for route, stats in sorted(self.routes.items())
+                ],
+                "stalls": list(self.stalls),
+            }
+
+
+loop_watchdog = LoopWatchdog(
+    threshold=settings.LOOP_STALL_THRESHOLD_MS / 1000,
+    interval=settings.LOOP_WATCHDOG_INTERVAL_MS / 1000,
+    stack_sample_rate=max(settings.LOOP_STALL_STACK_SAMPLE_RATE, 1),
+    stack_depth=settings.LOOP_STALL_STACK_DEPTH,
+)
@@ -0,0 +1,147 @@
+import asyncio
+import contextvars
+import logging
+from typing import TypeVar
+
+from beanie import Document, PydanticObjectId
+from beanie.odm.utils.dump import get_dict
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+
+from qrcode_api.app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+DocType = TypeVar("DocType", bound=Document)
+
+# (document, future resolved with it once written)
+PendingInsert = tuple[Document, asyncio.Future]
+
+DUPLICATE_KEY_ERROR_CODES = {11000, 11001, 12582}
+
+
+def build_write_concern() -> WriteConcern | None:
+    w = settings.INSERT_BATCH_WRITE_CONCERN
+    if w is None and settings.INSERT_BATCH_JOURNAL is None:
+        return None
+    if w is not None and w.isdigit():
+        w = int(w)
+    return WriteConcern(w=w, j=settings.INSERT_BATCH_JOURNAL)
+
+
+class InsertBatcher:
+    """Group commit of document inserts from concurrent requests.
+
+    Inserts are queued per document class for at most ``window`` seconds, or
+    until ``max_documents`` are queued, and written with a single unordered
+    'insert_many'. Every caller gets its own document back, or the error of
+    its own document (e.g. ``DuplicateKeyError``), other documents of the
+    batch are still written.
+
+    Documents go straight to the collection, Beanie event actions are not
+    run for batched inserts.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        max_documents: int,
+        write_concern: WriteConcern | None = None,
+    ) -> None:
+        self.window = window
+        self.max_documents = max_documents
+        self.write_concern = write_concern
+        self._pending: dict[type[Document], list[PendingInsert]] = {}
+        # Window of each pending batch, cancelled when it fills up first
+        self._timers: dict[type[Document], asyncio.TimerHandle] = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    async def insert(self, document: DocType) -> DocType:
+        if not settings.INSERT_BATCHING_ENABLED:
+            return await document.insert()
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        document_type = type(document)
+        batch = self._pending.setdefault(document_type, [])
+        batch.append((document, future))
+
+        if len(batch) >= self.max_documents:
+            self._flush(document_type)
+        elif len(batch) == 1:
+            self._timers[document_type] = loop.call_later(
+                self.window, self._flush, document_type
+            )
+
+        return await future
+
+    def _flush(self, document_type: type[Document]) -> None:
+        timer = self._timers.pop(document_type, None)
+        if timer is not None:
+            timer.cancel()
+
+        batch = self._pending.pop(document_type, None)
+        if not batch:
+            return
+
+        # In a context of its own, not that of the request filling the batch
+        # (its query budget, read preference)
+        task = contextvars.Context().run(
+            asyncio.get_running_loop().create_task, self._write(document_type, batch)
+        )
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _write(
+        self, document_type: type[Document], batch: list[PendingInsert]
+    ) -> None:
+        keep_nulls = document_type.get_settings().keep_nulls
+        documents = []
+        for document, _ in batch:
+            if document.id is None:
+                document.id = PydanticObjectId()
+            documents.append(get_dict(document, to_db=True, keep_nulls=keep_nulls))
+
+        collection = document_type.get_motor_collection()
+        if self.write_concern is not None:
+            collection = collection.with_options(write_concern=self.write_concern)
+
+        errors: dict[int, Exception] = {}
+        try:
+            await collection.insert_many(documents, ordered=False)
+        except BulkWriteError as error:
+            for write_error in error.details.get("writeErrors", []):
+                error_type = (
+                    DuplicateKeyError
+                    if write_error.get("code") in DUPLICATE_KEY_ERROR_CODES
+                    else WriteError
+                )
+                errors[write_error["index"]] = error_type(
+                    write_error.get("errmsg"), write_error.get("code"), write_error
+                )
+        except Exception as error:
+            logger.error("Batched insert failure", exc_info=True)
+            errors = {index: error for index in range(len(batch))}
+
+        for index, (document, future) in enumerate(batch):
+            # The caller may have gone away (e.g. client disconnect)
+            if future.done():
+                continue
+            if index in errors:
+                future.set_exception(errors[index])
+            else:
+                future.set_result(document)
+
+    async def stop(self) -> None:
+        """Write every queued insert, on shutdown."""
+        for document_type in list(self._pending):
+            self._flush(document_type)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+insert_batcher = InsertBatcher(
+    window=settings.INSERT_BATCH_WINDOW_MS / 1000,
+    max_documents=settings.INSERT_BATCH_MAX_DOCUMENTS,
+    write_concern=build_write_concern(),
+)
@@ -1,11 +1,14 @@
-import sys
-import logging
 import asyncio
+import logging
+from typing import Any
 
 from beanie import init_beanie
 from motor.motor_asyncio import AsyncIOMotorClient
+from pymongo.errors import DuplicateKeyError
+from pymongo.monitoring import ConnectionPoolListener
 
 from qrcode_api.app.core.config import settings
+from qrcode_api.app.core.query_monitor import query_monitor
 from qrcode_api.app.core.security import get_password_hash
 from qrcode_api.app.models import User, gather_documents
 
@@ -14,47 +17,180 @@ logger = logging.getLogger(__name__)
 
 db_client: AsyncIOMotorClient = None
 
+# Set once beanie is initialized, the readiness check depends on it
+db_initialized = asyncio.Event()
+
+_connect_task: asyncio.Task | None = None
+_superuser_bootstrapped = False
+
+
+class PoolStats(ConnectionPoolListener):
+    """Keeps track of the connection pool state from pymongo pool events."""
+
+    def __init__(self) -> None:
+        self.open = 0
+        self.in_use = 0
+        self.check_out_failures = 0
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        pass
+
+    def pool_closed(self, event) -> None:
+        self.open = 0
+        self.in_use = 0
+
+    def connection_created(self, event) -> None:
+        self.open += 1
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        self.open = max(self.open - 1, 0)
+
+    def connection_check_out_started(self, event) -> None:
+        pass
+
+    def connection_check_out_failed(self, event) -> None:
+        self.check_out_failures += 1
+
+    def connection_checked_out(self, event) -> None:
+        self.in_use += 1
+
+    def connection_checked_in(self, event) -> None:
+        self.in_use = max(self.in_use - 1, 0)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "max_size": settings.MAX_DB_CONN_COUNT,
+            "open": self.open,
+            "in_use": self.in_use,
+            "check_out_failures": self.check_out_failures,
+        }
+
+
+pool_stats = PoolStats()
+
 
 def get_db() -> AsyncIOMotorClient:
     return db_client[settings.MONGO_DB]
 
 
+async def bootstrap_superuser() -> None:
+    """Create the configured superuser once, safe to race between workers."""
+    global _superuser_bootstrapped
+
+    if _superuser_bootstrapped:
+        return
+
+    if not await User.find_one(User.username == settings.SUPERUSER).exists():
+        try:
+            await User(
+                username=settings.SUPERUSER,
+                email=settings.SUPERUSER_EMAIL,
+                hashed_password=get_password_hash(settings.SUPERUSER_PASSWORD),
+                is_superuser=True,
+            ).insert()
+        except DuplicateKeyError:
+            # Another worker created it in the meantime
+            pass
+
+    _superuser_bootstrapped = True
+
+
 async def connect_and_init_db() -> None:
     global db_client
 
+    event_listeners = [pool_stats]
+    if settings.QUERY_MONITORING_ENABLED:
+        event_listeners.append(query_monitor)
+
     db_client = AsyncIOMotorClient(
         str(settings.MONGO_URI),
         maxPoolSize=settings.MAX_DB_CONN_COUNT,
         minPoolSize=settings.MIN_DB_CONN_COUNT,
+        serverSelectionTimeoutMS=settings.DB_SERVER_SELECTION_TIMEOUT_MS,
         uuidRepresentation="standard",
+        event_listeners=event_listeners,
     )
 
-    try:
-        db_client.admin.command("ping")
+    await db_client.admin.command("ping")
 
-        await init_beanie(
-            database=getattr(db_client, settings.MONGO_DB),
-            document_models=gather_documents(),
-        )
+    await init_beanie(
+        database=getattr(db_client, settings.MONGO_DB),
+        document_models=gather_documents(),
+    )
 
-        logger.info("Connected to MongoDB")
-        logger.info(f"Connection string: {settings.MONGO_URI}/{settings.MONGO_DB}")
+    logger.info("Connected to MongoDB")
+    logger.info(f"Connection string: {settings.MONGO_URI}/{settings.MONGO_DB}")
 
-        if not await User.get_by_username(username=settings.SUPERUSER):
-            await User(
-                username=settings.SUPERUSER,
-                email=settings.SUPERUSER_EMAIL,
-                hashed_password=get_password_hash(settings.SUPERUSER_PASSWORD),
-                is_superuser=True,
-            ).insert()
-    except Exception as exception:
-        logger.error(f"Could not connect to MongoDB", exc_info=True)
-        asyncio.get_event_loop().close()
-        sys.exit()
+    await bootstrap_superuser()
+    db_initialized.set()
+
+
+async def connect_with_retry() -> None:
+    """Connect to MongoDB, retrying with exponential backoff until it succeeds.
+
+    Failures leave the instance alive but not ready instead of exiting, so
+    the orchestrator keeps it out of rotation rather than restarting it.
+    """
+    delay = settings.DB_CONNECT_BACKOFF_SECONDS
+    attempt = 1
+
+    while True:
+        try:
+            await connect_and_init_db()
+            return
+        except Exception:
+            logger.error(
+                f"Could not connect to MongoDB (attempt {attempt}), "
+                f"retrying in {delay:.1f}s",
+                exc_info=True,
+            )
+            if db_client is not None:
+                db_client.close()
+
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, settings.DB_CONNECT_MAX_BACKOFF_SECONDS)
+        attempt += 1
+
+
+def start_db_connect() -> asyncio.Task:
+    """Start connecting to MongoDB in the background."""
+    global _connect_task
+
+    _connect_task = asyncio.create_task(connect_with_retry())
+    return _connect_task
+
+
+async def ping_db() -> bool:
+    if db_client is None or not db_initialized.is_set():
+        return False
+
+    try:
+        await asyncio.wait_for(
+            db_client.admin.command("ping"),
+            timeout=settings.HEALTH_DB_TIMEOUT_SECONDS,
+        )
+    except Exception:
+        logger.warning("MongoDB ping failed", exc_info=True)
+        return False
+
+    return True
 
 
 async def close_db_connect() -> None:
-    global db_client
+    global db_client, _connect_task
+
+    if _connect_task is not None and not _connect_task.done():
+        _connect_task.cancel()
+    _connect_task = None
 
     if db_client is None:
         logger.warning("Connection is None, nothing to close")
@@ -62,4 +198,5 @@ async def close_db_connect() -> None:
 
     db_client.close()
     db_client = None
+    db_initialized.clear()
     logger.info("MongoDB connection closed")
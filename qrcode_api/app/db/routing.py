@@ -0,0 +1,59 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+
+from motor.motor_asyncio import AsyncIOMotorCollection
+from pymongo.read_preferences import (
+    ReadPreference,
+    _ServerMode,
+    make_read_preference,
+    read_pref_mode_from_name,
+)
+
+from qrcode_api.app.core.config import settings
+
+# Read preference of the reads made in the current context, 'None' for the
+# client default (primary)
+_read_preference: ContextVar[_ServerMode | None] = ContextVar(
+    "read_preference", default=None
+)
+
+
+def build_secondary_read_preference() -> _ServerMode | None:
+    mode = read_pref_mode_from_name(settings.SECONDARY_READ_PREFERENCE)
+    if mode == ReadPreference.PRIMARY.mode:
+        return None
+    return make_read_preference(
+        mode, None, max_staleness=settings.SECONDARY_READ_MAX_STALENESS_SECONDS
+    )
+
+
+secondary_read_preference = build_secondary_read_preference()
+
+
+@contextmanager
+def secondary_reads() -> Iterator[None]:
+    """Route the reads of routed documents made in the block with the
+    secondary read preference.
+
+    Only for reads that tolerate stale data (listings, stats). Writes always
+    go to the primary, and so do authentication and read-modify-write reads,
+    which must not be made in such a block.
+    """
+    token = _read_preference.set(secondary_read_preference)
+    try:
+        yield
+    finally:
+        _read_preference.reset(token)
+
+
+class RoutedReads:
+    """Document mixin, applies the read preference of the current context."""
+
+    @classmethod
+    def get_motor_collection(cls) -> AsyncIOMotorCollection:
+        collection = super().get_motor_collection()  # type: ignore[misc]
+        read_preference = _read_preference.get()
+        if read_preference is None:
+            return collection
+        return collection.with_options(read_preference=read_preference)
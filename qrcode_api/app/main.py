@@ -2,12 +2,22 @@ import logging
 from typing import Set
 
 from fastapi import FastAPI, status
-from fastapi.staticfiles import StaticFiles
 
 from qrcode_api.app import api
+from qrcode_api.app.core.admission import admission_controller
+from qrcode_api.app.core.analytics import hit_buffer
 from qrcode_api.app.core.config import settings
 from qrcode_api.app.core.logging import setup_logging
-from qrcode_api.app.db.database import connect_and_init_db, close_db_connect
+from qrcode_api.app.core.render import render_pool
+from qrcode_api.app.core.tokens import get_token_codec
+from qrcode_api.app.core.watchdog import loop_watchdog
+from qrcode_api.app.core.writes import insert_batcher
+from qrcode_api.app.db.database import start_db_connect, close_db_connect
+from qrcode_api.app.middleware import (
+    ProfilingMiddleware,
+    QueryMonitorMiddleware,
+    StallWatchdogMiddleware,
+)
 
 
 tags_metadata = [
@@ -23,6 +33,22 @@ tags_metadata = [
         "name": "QR Codes",
         "description": "QR Code management",
     },
+    {
+        "name": "Assets",
+        "description": "Images (e.g. logos) to embed in QR Codes",
+    },
+    {
+        "name": "Redirects",
+        "description": "Resolve dynamic QR Codes",
+    },
+    {
+        "name": "Admin",
+        "description": "Operational statistics for superusers",
+    },
+    {
+        "name": "Health",
+        "description": "Liveness and readiness probes",
+    },
 ]
 
 # Common response codes
@@ -50,12 +76,24 @@ app = FastAPI(
     },
 )
 
-# Static file mount
-app.mount(settings.STATIC_PATH, StaticFiles(directory="static"), name="static")
-
 # Add the router responsible for all /api/ endpoint requests
 app.include_router(api.router)
 
+# Liveness/readiness probes live outside of the versioned API
+app.include_router(api.health.router, prefix="/health", tags=["Health"])
+
+# Short URLs encoded in dynamic QR Codes, kept short and outside of '/api'
+app.include_router(api.redirect.router, prefix="/r", tags=["Redirects"])
+
+# On demand and sampled request profiling
+app.add_middleware(ProfilingMiddleware)
+
+# Mongo commands and query budgets per route
+app.add_middleware(QueryMonitorMiddleware)
+
+# Routes of the requests blocking the event loop
+app.add_middleware(StallWatchdogMiddleware)
+
 # Set all CORS enabled origins
 if settings.CORS_ORIGINS:
     from fastapi.middleware.cors import CORSMiddleware
@@ -77,11 +115,23 @@ logger = logging.getLogger(__name__)
 @app.on_event("startup")
 async def startup_event():
     logger.info("Application is starting up")
-    await connect_and_init_db()
+    # Prepare the token keys now rather than on the first authenticated request
+    get_token_codec()
+    # Connect in the background, '/health/ready' reports when it's done
+    start_db_connect()
+    hit_buffer.start()
+    admission_controller.start()
+    if settings.LOOP_WATCHDOG_ENABLED:
+        loop_watchdog.start()
 
 
 @app.on_event("shutdown")
 async def shutdown_events():
     logger.info("Clean up before shutting down the server")
+    loop_watchdog.stop()
+    admission_controller.stop()
+    await hit_buffer.stop()
+    await insert_batcher.stop()
     await close_db_connect()
+    render_pool.shutdown()
     logger.info("Application shutting down")
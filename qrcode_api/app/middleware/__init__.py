@@ -0,0 +1,4 @@
+from .profiling import ProfilingMiddleware
+from .queries import QueryMonitorMiddleware
+from .watchdog import StallWatchdogMiddleware
+from .admission import AdmissionRoute
@@ -0,0 +1,91 @@
+import time
+
+from fastapi.routing import APIRoute
+from starlette.datastructures import QueryParams
+from starlette.responses import JSONResponse
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from qrcode_api.app.core.admission import (
+    Rejected,
+    RouteClass,
+    admission_controller,
+)
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.schemas.qrcode import QRCodeDerivative
+
+
+class AdmissionControl:
+    """Admits the requests of a route per its class, see
+    'AdmissionController'; shed requests get a 503 with 'Retry-After'.
+
+    Requests with derivative parameters are admitted as ``derivative_class``
+    when given, they are renders rather than file fetches.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        route_class: RouteClass,
+        derivative_class: RouteClass | None = None,
+    ) -> None:
+        self.app = app
+        self.route_class = route_class
+        self.derivative_class = derivative_class
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if not settings.ADMISSION_CONTROL_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        route_class = self.route_class
+        if self.derivative_class is not None and is_derivative(scope):
+            route_class = self.derivative_class
+        try:
+            delay = await admission_controller.acquire(route_class)
+        except Rejected as rejected:
+            response = JSONResponse(
+                {"detail": rejected.reason},
+                status_code=503,
+                headers={"Retry-After": str(settings.ADMISSION_RETRY_AFTER_SECONDS)},
+            )
+            await response(scope, receive, send)
+            return
+
+        started = time.monotonic()
+        latency = None
+
+        async def send_started(message: Message) -> None:
+            nonlocal latency
+            if message["type"] == "http.response.start":
+                latency = time.monotonic() - started
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_started)
+        finally:
+            admission_controller.release(route_class)
+            if latency is not None:
+                admission_controller.record(route_class, latency, delay)
+
+
+def is_derivative(scope: Scope) -> bool:
+    query = QueryParams(scope.get("query_string", b""))
+    return any(name in query for name in QRCodeDerivative.__fields__)
+
+
+class AdmissionRoute(APIRoute):
+    """Route whose requests go through admission control.
+
+    The route class is looked up once, from the route name, and requests are
+    admitted once routed, so they aren't matched against the routes twice.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        route_class = admission_controller.classify(self.name)
+        if route_class is not None:
+            self.app = AdmissionControl(
+                self.app,
+                route_class,
+                admission_controller.classify_derivatives(self.name),
+            )
@@ -0,0 +1,147 @@
+import asyncio
+import logging
+import os
+
+from fastapi import HTTPException
+from fastapi.security.utils import get_authorization_scheme_param
+from starlette.requests import HTTPConnection
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from qrcode_api.app.api.v1.deps import (
+    get_current_active_superuser,
+    get_current_active_user,
+    get_current_user,
+)
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.core.profiling import Profile, make_profiler, store_profile
+
+logger = logging.getLogger(__name__)
+
+# Accepted 'X-Profile' / 'profile' values and the profiler they select
+PROFILE_MODES = {
+    "1": "sample",
+    "true": "sample",
+    "sample": "sample",
+    "deterministic": "deterministic",
+}
+
+PROFILE_FORMATS = {"speedscope", "collapsed"}
+
+
+async def is_superuser(connection: HTTPConnection) -> bool:
+    """Authenticate the request like the superuser endpoints do."""
+    scheme, token = get_authorization_scheme_param(
+        connection.headers.get("authorization")
+    )
+    try:
+        user = await get_current_user(
+            api_key=connection.query_params.get("api_key"),
+            token=token if scheme.lower() == "bearer" else None,
+        )
+        get_current_active_superuser(get_current_active_user(user))
+    except HTTPException:
+        return False
+    return True
+
+
+class ProfilingMiddleware:
+    """Profiles requests without redeploying.
+
+    A superuser sending 'X-Profile: sample|deterministic' (or the 'profile'
+    query parameter) gets the profile of the request instead of its response,
+    in the speedscope format or as collapsed stacks ('X-Profile-Format' or
+    'profile_format'); the original status is in 'X-Profiled-Status'.
+
+    With PROFILE_SAMPLE_RATE set, 1 in N requests is profiled with the
+    sampling profiler and stored under LOG_DIR/profiles, keeping the latest
+    PROFILE_MAX_FILES profiles. A single request is profiled at a time.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+        self._requests = 0
+        self._active = False
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.PROFILING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        connection = HTTPConnection(scope)
+        requested = connection.headers.get("x-profile") or connection.query_params.get(
+            "profile"
+        )
+        mode = PROFILE_MODES.get((requested or "").lower())
+        if mode is not None and not self._active and await is_superuser(connection):
+            output_format = connection.headers.get(
+                "x-profile-format"
+            ) or connection.query_params.get("profile_format", "speedscope")
+            await self._profile_request(
+                scope, receive, send, mode=mode, output_format=output_format
+            )
+            return
+
+        self._requests += 1
+        rate = settings.PROFILE_SAMPLE_RATE
+        if rate > 0 and self._requests % rate == 0 and not self._active:
+            await self._sample_request(scope, receive, send)
+            return
+
+        await self.app(scope, receive, send)
+
+    async def _run_profiled(
+        self, scope: Scope, receive: Receive, send: Send, mode: str
+    ) -> Profile:
+        profiler = make_profiler(mode, settings.PROFILE_SAMPLE_INTERVAL_MS / 1000)
+        self._active = True
+        profiler.start()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            profiler.stop()
+            self._active = False
+
+        return Profile(
+            f"{scope['method']} {scope['path']}", profiler.stacks, profiler.unit
+        )
+
+    async def _profile_request(
+        self,
+        scope: Scope,
+        receive: Receive,
+        send: Send,
+        *,
+        mode: str,
+        output_format: str,
+    ) -> None:
+        status_code = 500
+
+        async def discard(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+
+        profile = await self._run_profiled(scope, receive, discard, mode)
+        if output_format not in PROFILE_FORMATS:
+            output_format = "speedscope"
+        body, media_type = profile.render(output_format)
+
+        response = Response(
+            body,
+            media_type=media_type,
+            headers={"x-profiled-status": str(status_code)},
+        )
+        await response(scope, receive, send)
+
+    async def _sample_request(self, scope: Scope, receive: Receive, send: Send) -> None:
+        profile = await self._run_profiled(scope, receive, send, "sample")
+        try:
+            await asyncio.to_thread(
+                store_profile,
+                profile,
+                os.path.join(settings.LOG_DIR, "profiles"),
+                settings.PROFILE_MAX_FILES,
+            )
+        except OSError:
+            logger.warning("Could not store a sampled profile", exc_info=True)
@@ -0,0 +1,23 @@
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.core.query_monitor import query_monitor
+
+
+class QueryMonitorMiddleware:
+    """Accounts the Mongo commands run while handling a request to its
+    route, and flags requests exceeding their query budget."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.QUERY_MONITORING_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        request = query_monitor.start_request(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            query_monitor.finish_request(request)
@@ -0,0 +1,26 @@
+import asyncio
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.core.watchdog import loop_watchdog
+
+
+class StallWatchdogMiddleware:
+    """Tells the event loop watchdog which request each task handles, so
+    stalls are attributed to their route."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or not settings.LOOP_WATCHDOG_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        task = asyncio.current_task()
+        loop_watchdog.requests[task] = scope
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            loop_watchdog.requests.pop(task, None)
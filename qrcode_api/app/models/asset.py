@@ -0,0 +1,29 @@
+from datetime import datetime
+from typing import Optional
+
+from beanie import Document, Indexed, PydanticObjectId
+from pydantic.fields import Field
+
+
+class Asset(Document):
+    """An image uploaded by a user, e.g. a logo to embed in QR Codes."""
+
+    user_id: Indexed(PydanticObjectId)
+    file_name: str
+    width: int
+    height: int
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+    @classmethod
+    async def get_for_user(
+        cls, *, asset_id: PydanticObjectId, user_id: PydanticObjectId
+    ) -> Optional["Asset"]:
+        return await cls.find_one(cls.id == asset_id, cls.user_id == user_id)
+
+    @classmethod
+    async def get_by_user(cls, *, user_id: PydanticObjectId) -> list["Asset"]:
+        return await cls.find(cls.user_id == user_id).sort(-cls.created_at).to_list()
+
+    class Settings:
+        name = "assets"
+        use_state_management = True
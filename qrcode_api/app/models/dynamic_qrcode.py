@@ -0,0 +1,48 @@
+from datetime import datetime
+from typing import Optional
+
+from beanie import Document, Indexed
+from beanie.operators import In
+from pydantic import BaseModel
+from pydantic.fields import Field
+
+
+class DynamicQRCodeTarget(BaseModel):
+    """Projection used by the redirect resolver."""
+
+    target_url: str
+    qrcode_file: str
+
+
+class DynamicQRCode(Document):
+    # Ownership is the one of the 'QRCode' document with the same file
+    short_code: Indexed(str, unique=True)
+    target_url: str
+    qrcode_file: Indexed(str)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+
+    @classmethod
+    async def get_by_short_code(cls, *, short_code: str) -> Optional["DynamicQRCode"]:
+        return await cls.find_one(cls.short_code == short_code)
+
+    @classmethod
+    async def get_target(cls, *, short_code: str) -> Optional[DynamicQRCodeTarget]:
+        return await cls.find_one(cls.short_code == short_code).project(
+            DynamicQRCodeTarget
+        )
+
+    @classmethod
+    async def delete_by_files(cls, *, file_names: list[str]) -> list[str]:
+        """Delete the redirects of deleted QR Codes, returns their short codes."""
+        if not file_names:
+            return []
+
+        query = cls.find(In(cls.qrcode_file, file_names))
+        short_codes = [doc.short_code for doc in await query.to_list()]
+        await query.delete()
+        return short_codes
+
+    class Settings:
+        name = "dynamic_qr_codes"
+        use_state_management = True
@@ -0,0 +1,27 @@
+from datetime import datetime
+from typing import Any, Optional
+
+import pymongo
+from beanie import Document
+from pydantic.fields import Field
+from pymongo import IndexModel
+
+
+class IdempotencyRecord(Document):
+    """Response of a creation request, replayed to its retries."""
+
+    # '<user id>:<Idempotency-Key header>'
+    key: str
+    # Hash of the method, path and payload of the request
+    fingerprint: str
+    # Unset while the first request is in progress
+    response: Optional[dict[str, Any]] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    expires_at: datetime
+
+    class Settings:
+        name = "idempotency_records"
+        indexes = [
+            IndexModel([("key", pymongo.ASCENDING)], unique=True),
+            IndexModel([("expires_at", pymongo.ASCENDING)], expireAfterSeconds=0),
+        ]
@@ -1,17 +1,50 @@
 from datetime import datetime
-from typing import Optional, TYPE_CHECKING
+from typing import Any, AsyncIterator, Optional, TYPE_CHECKING
 
-from beanie import Document, PydanticObjectId
+from beanie import Document, Indexed, PydanticObjectId
+from beanie.operators import In, Set
+from pydantic import BaseModel
 from pydantic.fields import Field
 
+from qrcode_api.app.db.routing import RoutedReads
+from qrcode_api.app.models.qrcode_hits import QRCodeHits
+
 if TYPE_CHECKING:
     from qrcode_api.app.schemas import PaginationParams, SortingParams
 
 
-class QRCode(Document):
+class QRCodeFileView(BaseModel):
+    """Projection used by bulk operations, only loads what they need."""
+
+    id: PydanticObjectId = Field(alias="_id")
     qrcode_file: Optional[str] = None
+    user_id: Optional[PydanticObjectId] = None
+
+
+class RenderOptions(BaseModel):
+    """What a QR Code was rendered from, so it can be rendered again."""
+
+    data: Any
+    micro: bool = False
+    # Planned encoding, unset on codes created before it was stored
+    mode: Optional[str] = None
+    version: Optional[str] = None
+    error_level: Optional[str] = None
+    scale: int = 1
+    border: int = 1
+    dark: str = "#000"
+    light: str = "#fff"
+    logo: Optional[PydanticObjectId] = None
+    logo_size: float = 0.2
+
+
+class QRCode(RoutedReads, Document):
+    # Looked up on fetches, derivatives, bulk operations and hit flushes
+    qrcode_file: Optional[Indexed(str, unique=True)] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     user_id: Optional[PydanticObjectId] = None
+    # Unset on codes created before render options were stored
+    render_options: Optional[RenderOptions] = None
 
     @classmethod
     async def get_by_user(
@@ -37,6 +70,101 @@ class QRCode(Document):
     async def get_by_file_name(cls, *, file_name: str) -> Optional["QRCode"]:
         return await cls.find_one(cls.qrcode_file == file_name)
 
+    @classmethod
+    async def get_owners(
+        cls, *, file_names: list[str]
+    ) -> dict[str, Optional[PydanticObjectId]]:
+        """Map each existing file name to its owner, in a single query."""
+        views = (
+            await cls.find(In(cls.qrcode_file, file_names))
+            .project(QRCodeFileView)
+            .to_list()
+        )
+        return {view.qrcode_file: view.user_id for view in views}
+
+    @classmethod
+    def build_filter(
+        cls,
+        *,
+        user_id: Optional[PydanticObjectId] = None,
+        file_names: Optional[list[str]] = None,
+        created_before: Optional[datetime] = None
+    ) -> list[Any]:
+        conditions = []
+        if user_id is not None:
+            conditions.append(cls.user_id == user_id)
+        if file_names is not None:
+            conditions.append(In(cls.qrcode_file, file_names))
+        if created_before is not None:
+            conditions.append(cls.created_at < created_before)
+        return conditions
+
+    @classmethod
+    async def delete_matching(
+        cls, *conditions: Any, batch_size: int = 1000
+    ) -> AsyncIterator[list[str]]:
+        """Delete every matching document with batched 'delete_many' calls.
+
+        Documents are deleted by id, so codes created while this runs are
+        left alone. Yields the file names of each deleted batch, so their
+        redirects and files are cleaned up as it goes.
+        """
+        while True:
+            batch = (
+                await cls.find(*conditions)
+                .project(QRCodeFileView)
+                .limit(batch_size)
+                .to_list()
+            )
+            if not batch:
+                break
+
+            await cls.find(In(cls.id, [doc.id for doc in batch])).delete()
+            yield [doc.qrcode_file for doc in batch if doc.qrcode_file]
+
+            if len(batch) < batch_size:
+                break
+
+    @classmethod
+    async def transfer_matching(
+        cls, *conditions: Any, user_id: PydanticObjectId, batch_size: int = 1000
+    ) -> int:
+        """Move every matching document to 'user_id' with batched
+        'update_many' calls, along with the hit counters of the codes."""
+        count = 0
+        last_id = None
+
+        while True:
+            # Paged by id, moved documents may still match the conditions
+            query = cls.find(*conditions)
+            if last_id is not None:
+                query = query.find(cls.id > last_id)
+            batch = (
+                await query.sort(+cls.id)
+                .project(QRCodeFileView)
+                .limit(batch_size)
+                .to_list()
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+
+            result = await cls.find(In(cls.id, [doc.id for doc in batch])).update(
+                Set({cls.user_id: user_id})
+            )
+            count += result.modified_count
+
+            file_names = [doc.qrcode_file for doc in batch if doc.qrcode_file]
+            if file_names:
+                await QRCodeHits.find(In(QRCodeHits.qrcode_file, file_names)).update(
+                    Set({QRCodeHits.user_id: user_id})
+                )
+
+            if len(batch) < batch_size:
+                break
+
+        return count
+
     class Settings:
         name = "qr_codes"
         use_state_management = True
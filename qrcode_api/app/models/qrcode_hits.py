@@ -0,0 +1,77 @@
+from datetime import datetime
+from typing import Any, Optional
+
+import pymongo
+from beanie import Document, PydanticObjectId
+from pymongo import IndexModel
+
+from qrcode_api.app.db.routing import RoutedReads
+
+
+class QRCodeHits(RoutedReads, Document):
+    """Pre-aggregated hit counter of a QR Code for one time bucket."""
+
+    qrcode_file: str
+    user_id: Optional[PydanticObjectId] = None
+    # 'scan' (dynamic redirect) or 'fetch' (file download)
+    event: str
+    # 'hour' or 'day'
+    granularity: str
+    bucket: datetime
+    hits: int = 0
+    # Only set on hourly buckets, which are removed by a TTL index
+    expires_at: Optional[datetime] = None
+
+    @classmethod
+    async def get_buckets(
+        cls,
+        *,
+        match: dict[str, Any],
+        granularity: str,
+        since: datetime | None = None,
+        until: datetime | None = None,
+    ) -> list[dict[str, Any]]:
+        """Sum the counters matching 'match' per bucket, oldest first."""
+        bucket_range: dict[str, datetime] = {}
+        if since is not None:
+            bucket_range["$gte"] = since
+        if until is not None:
+            bucket_range["$lt"] = until
+
+        query = {**match, "granularity": granularity}
+        if bucket_range:
+            query["bucket"] = bucket_range
+
+        return (
+            await cls.find(query)
+            .aggregate(
+                [
+                    {"$group": {"_id": "$bucket", "count": {"$sum": "$hits"}}},
+                    {"$sort": {"_id": pymongo.ASCENDING}},
+                    {"$project": {"_id": 0, "bucket": "$_id", "count": 1}},
+                ]
+            )
+            .to_list()
+        )
+
+    class Settings:
+        name = "qr_code_hits"
+        indexes = [
+            IndexModel(
+                [
+                    ("qrcode_file", pymongo.ASCENDING),
+                    ("event", pymongo.ASCENDING),
+                    ("granularity", pymongo.ASCENDING),
+                    ("bucket", pymongo.ASCENDING),
+                ],
+                unique=True,
+            ),
+            IndexModel(
+                [
+                    ("user_id", pymongo.ASCENDING),
+                    ("granularity", pymongo.ASCENDING),
+                    ("bucket", pymongo.ASCENDING),
+                ]
+            ),
+            IndexModel([("expires_at", pymongo.ASCENDING)], expireAfterSeconds=0),
+        ]
@@ -6,9 +6,10 @@ from pydantic import EmailStr
 from pydantic.fields import Field
 
 from qrcode_api.app.core.security import create_api_key, verify_password
+from qrcode_api.app.db.routing import RoutedReads
 
 
-class User(Document):
+class User(RoutedReads, Document):
     username: Indexed(str, unique=True)
     email: Indexed(EmailStr, unique=True)
     hashed_password: str
@@ -3,9 +3,38 @@ from .user import User, UserCreate, UserInDB, UserUpdate, UserSignUp
 from .pagination import Paginated, PaginationParams
 from .sorting import SortingParams
 from .qrcode import (
+    BulkOperationResult,
+    DynamicQRCode,
+    ErrorLevel,
+    FileFormats,
+    IQRCodeCreate,
+    Mode,
     QRCode,
+    QRCodeAdminBulkDelete,
     QRCodeBasicCreate,
+    QRCodeBulkDelete,
+    QRCodeFilter,
     QRCodeLocationCreate,
+    QRCodeTransfer,
     QRCodeContactCardCreate,
+    QRCodeDerivative,
+    QRCodeDynamicCreate,
+    QRCodeDynamicUpdate,
     QRCodeWiFiCreate,
 )
+from .health import ComponentHealth, Health, HealthStatus
+from .stats import Granularity, HitBucket, HitEvent, HitStats, StatsParams
+from .asset import Asset
+from .print_sheet import PageSize, PrintSheetCreate, PrintSheetItem, PrintSheetLayout
+from .monitoring import (
+    AdmissionStats,
+    CommandQueryStats,
+    LoopStall,
+    LoopStallStats,
+    QueryStats,
+    RouteClassStats,
+    RouteQueryStats,
+    RouteStallStats,
+    SlowQuery,
+)
+from .mail_merge import MailMergeOptions, MergeOutput, MergePayloadType
@@ -0,0 +1,14 @@
+from datetime import datetime
+
+from beanie import PydanticObjectId
+from pydantic import BaseModel
+
+
+class Asset(BaseModel):
+    id: PydanticObjectId
+    width: int
+    height: int
+    created_at: datetime
+
+    class Config:
+        json_encoders = {PydanticObjectId: str}
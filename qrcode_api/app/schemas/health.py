@@ -0,0 +1,20 @@
+from enum import Enum
+from typing import Any
+
+from pydantic import BaseModel
+
+
+class HealthStatus(str, Enum):
+    ok = "ok"
+    degraded = "degraded"
+    unavailable = "unavailable"
+
+
+class ComponentHealth(BaseModel):
+    status: HealthStatus
+    details: dict[str, Any] = {}
+
+
+class Health(BaseModel):
+    status: HealthStatus
+    checks: dict[str, ComponentHealth] = {}
@@ -0,0 +1,31 @@
+from enum import Enum
+from typing import Any
+
+from pydantic import BaseModel
+
+
+class MergePayloadType(str, Enum):
+    basic = "basic"
+    location = "location"
+    wifi = "wifi"
+    vCard = "vCard"
+    meCard = "meCard"
+
+
+class MergeOutput(str, Enum):
+    # Every rendered file and the manifest
+    zip = "zip"
+    # A CSV line per row: its QR Code file, or why it failed
+    manifest = "manifest"
+
+
+class MailMergeOptions(BaseModel):
+    """Options of a mail merge, the 'options' field of the upload."""
+
+    payload_type: MergePayloadType = MergePayloadType.basic
+    output: MergeOutput = MergeOutput.zip
+    # CSV column -> payload field (None ignores the column), columns named
+    # after a field map to it. A 'label' column names the archived files
+    columns: dict[str, str | None] = {}
+    # Payload fields shared by every row, non-empty cells take precedence
+    defaults: dict[str, Any] = {}
@@ -0,0 +1,86 @@
+from datetime import datetime
+from typing import Any
+
+from pydantic import BaseModel
+
+
+class RouteQueryStats(BaseModel):
+    route: str
+    requests: int
+    queries: int
+    total_ms: float
+    max_queries: int
+    max_ms: float
+    over_budget: int
+
+
+class CommandQueryStats(BaseModel):
+    collection: str
+    command: str
+    count: int
+    total_ms: float
+    max_ms: float
+    slow: int
+
+
+class SlowQuery(BaseModel):
+    at: datetime
+    route: str | None
+    collection: str
+    command: str
+    shape: dict[str, Any]
+    duration_ms: float
+
+
+class QueryStats(BaseModel):
+    since: datetime
+    routes: list[RouteQueryStats]
+    commands: list[CommandQueryStats]
+    slow_queries: list[SlowQuery]
+
+
+class RouteStallStats(BaseModel):
+    route: str
+    count: int
+    total_ms: float
+    max_ms: float
+
+
+class LoopStall(BaseModel):
+    at: datetime
+    route: str | None
+    duration_ms: float
+    # Captured for a sample of the stalls only
+    stack: list[str] | None
+
+
+class LoopStallStats(BaseModel):
+    since: datetime
+    threshold_ms: float
+    count: int
+    total_ms: float
+    max_ms: float
+    routes: list[RouteStallStats]
+    stalls: list[LoopStall]
+
+
+class RouteClassStats(BaseModel):
+    route_class: str
+    priority: str
+    in_flight: int
+    queued: int
+    # 0 for unbounded
+    max_in_flight: int
+    latency_ms: float
+    latency_target_ms: float
+    queueing_delay_ms: float
+    admitted: int
+    shed: int
+
+
+class AdmissionStats(BaseModel):
+    overloaded: bool
+    # Priorities whose requests are rejected
+    shedding: list[str]
+    loop_delay_ms: float
+    route_classes: list[RouteClassStats]
@@ -0,0 +1,98 @@
+from enum import Enum
+from typing import Any
+
+from pydantic import BaseModel, Field, root_validator
+from pydantic.color import Color
+
+from .qrcode import ErrorLevel, QRCodeFilter
+
+MM_TO_PT = 72 / 25.4
+
+
+class PageSize(str, Enum):
+    A3 = "A3"
+    A4 = "A4"
+    A5 = "A5"
+    letter = "letter"
+    legal = "legal"
+
+
+# Width and height in millimeters, portrait
+PAGE_SIZES_MM = {
+    PageSize.A3: (297.0, 420.0),
+    PageSize.A4: (210.0, 297.0),
+    PageSize.A5: (148.0, 210.0),
+    PageSize.letter: (215.9, 279.4),
+    PageSize.legal: (215.9, 355.6),
+}
+
+
+class PrintSheetLayout(BaseModel):
+    page_size: PageSize = PageSize.A4
+    landscape: bool = False
+    columns: int = Field(4, ge=1, le=20)
+    rows: int = Field(5, ge=1, le=30)
+    # Millimeters
+    margin: float = Field(10, ge=0)
+    gutter: float = Field(5, ge=0)
+    # Quiet zone around each code, in modules
+    border: int = Field(2, ge=0, le=10)
+    labels: bool = True
+    font_size: float = Field(7, gt=0, le=24)
+    cut_marks: bool = False
+
+    @property
+    def page_size_pt(self) -> tuple[float, float]:
+        width, height = PAGE_SIZES_MM[self.page_size]
+        if self.landscape:
+            width, height = height, width
+        return width * MM_TO_PT, height * MM_TO_PT
+
+    @property
+    def cell_size_pt(self) -> tuple[float, float]:
+        page_width, page_height = self.page_size_pt
+        margin, gutter = self.margin * MM_TO_PT, self.gutter * MM_TO_PT
+        return (
+            (page_width - 2 * margin - (self.columns - 1) * gutter) / self.columns,
+            (page_height - 2 * margin - (self.rows - 1) * gutter) / self.rows,
+        )
+
+    @property
+    def label_height_pt(self) -> float:
+        return self.font_size * 1.6 if self.labels else 0
+
+    @root_validator(skip_on_failure=True)
+    def grid_fits(cls, values):
+        layout = cls.construct(**values)
+        width, height = layout.cell_size_pt
+        if min(width, height - layout.label_height_pt) <= 0:
+            raise ValueError("The grid doesn't fit on the page")
+        return values
+
+
+class PrintSheetItem(BaseModel):
+    """A code rendered only for the sheet, it isn't stored."""
+
+    data: Any
+    micro: bool = False
+    error_level: ErrorLevel = None
+    dark: Color = Color("black")
+    light: Color = Color("white")
+    label: str | None = None
+
+
+class PrintSheetCreate(QRCodeFilter):
+    """Lay out inline ``items`` or, without them, the current user's codes
+    matching the filter (all of them when no criteria is given)."""
+
+    items: list[PrintSheetItem] | None = None
+    layout: PrintSheetLayout = PrintSheetLayout()
+
+    @root_validator(skip_on_failure=True)
+    def single_source(cls, values):
+        if values.get("items") is not None and (
+            values.get("file_names") is not None
+            or values.get("created_before") is not None
+        ):
+            raise ValueError("Inline items can't be combined with filter criteria")
+        return values
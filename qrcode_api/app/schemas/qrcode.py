@@ -2,16 +2,23 @@ from datetime import datetime
 from enum import Enum
 from typing import Any
 
-import phonenumbers
 from beanie import PydanticObjectId
-from pydantic import BaseModel, EmailStr, HttpUrl, validator
+from pydantic import BaseModel, EmailStr, Field, HttpUrl, root_validator, validator
 from pydantic.color import Color
 
+from qrcode_api.app.utils.lazy import lazy_import
+
+# phonenumbers ships large metadata tables, only load them on first validation
+phonenumbers = lazy_import("phonenumbers")
+
 
 class FileFormats(str, Enum):
     svg = "svg"
     png = "png"
     pdf = "pdf"
+    # Raw module matrix, bit-packed binary or JSON (see 'utils.matrix')
+    matrix = "matrix"
+    json = "json"
 
 
 class ErrorLevel(str, Enum):
@@ -30,14 +37,41 @@ class Mode(str, Enum):
 
 
 class IQRCodeCreate(BaseModel):
-    scale: int = 1
-    border: int = 1
+    # Same bounds as derivatives, the raw matrix format packs border in a byte
+    scale: int = Field(1, ge=1, le=100)
+    border: int = Field(1, ge=0, le=20)
     mode: Mode = None
     micro: bool = False
     dark: Color = Color("black")
     light: Color = Color("white")
     error_level: ErrorLevel = None
+    # Smallest version fitting the data when unset
+    version: int | None = Field(None, ge=1, le=40)
+    # Raise the error level as long as the data still fits the version
+    boost_error: bool = True
     file_format: FileFormats = FileFormats.png
+    # Asset id of a logo to embed at the center of the code
+    logo: PydanticObjectId | None = None
+    # Logo width relative to the symbol width, error level H recovers ~30%
+    logo_size: float = Field(0.2, gt=0, le=0.3)
+
+    @root_validator(skip_on_failure=True)
+    def version_constraints(cls, values):
+        if values.get("version") is not None and values.get("micro"):
+            raise ValueError("Versions 1 to 40 don't apply to Micro QR Codes")
+        return values
+
+    @root_validator(skip_on_failure=True)
+    def logo_constraints(cls, values):
+        if values.get("logo") is None:
+            return values
+        if values.get("file_format") != FileFormats.png:
+            raise ValueError("Logos can only be embedded in png QR Codes")
+        if values.get("micro"):
+            raise ValueError("Logos can't be embedded in Micro QR Codes")
+        # The logo hides modules, use the highest error correction
+        values["error_level"] = ErrorLevel.H
+        return values
 
     class Config:
         json_encoders = {Color: lambda color: color.as_hex()}
@@ -74,10 +108,84 @@ class QRCodeContactCardCreate(IQRCodeCreate):
             raise ValueError("Phone number is not a valid format")
 
 
+class QRCodeDynamicCreate(IQRCodeCreate):
+    target_url: HttpUrl
+
+
+class QRCodeDynamicUpdate(BaseModel):
+    target_url: HttpUrl
+
+
 class QRCode(BaseModel):
     qrcode_file: str
     created_at: datetime
-    user_id: PydanticObjectId
+    # A plain string, 'json_encoders' don't apply once nested (pagination)
+    user_id: str
+    # How the data was encoded, unknown for codes created before it was stored
+    version: str | None = None
+    mode: str | None = None
+    error_level: str | None = None
+
+    @validator("user_id", pre=True)
+    def user_id_as_str(cls, value):
+        return str(value)
+
+    @root_validator(pre=True)
+    def encoding_from_render_options(cls, values):
+        options = values.get("render_options") or {}
+        if isinstance(options, BaseModel):
+            options = options.dict()
+        for field in ("version", "mode", "error_level"):
+            if values.get(field) is None:
+                values[field] = options.get(field)
+        return values
 
     class Config:
         orm_mod = True
+
+
+class QRCodeDerivative(BaseModel):
+    """Render a stored QR Code with other parameters, unset ones are kept."""
+
+    scale: int | None = Field(None, ge=1, le=100)
+    format: FileFormats | None = None
+    border: int | None = Field(None, ge=0, le=20)
+    dark: Color | None = None
+    light: Color | None = None
+
+    @property
+    def is_empty(self) -> bool:
+        return all(value is None for value in self.dict().values())
+
+
+class DynamicQRCode(QRCode):
+    short_code: str
+    short_url: str
+    target_url: str
+
+
+class QRCodeFilter(BaseModel):
+    file_names: list[str] | None = None
+    created_before: datetime | None = None
+
+
+class QRCodeBulkDelete(QRCodeFilter):
+    @root_validator(skip_on_failure=True)
+    def has_criteria(cls, values):
+        if not any(value is not None for value in values.values()):
+            raise ValueError("At least one filter criteria is required")
+        return values
+
+
+class QRCodeAdminBulkDelete(QRCodeBulkDelete):
+    # Restricts the operation to (or targets all codes of) a specific user
+    username: str | None = None
+
+
+class QRCodeTransfer(QRCodeFilter):
+    from_username: str
+    to_username: str
+
+
+class BulkOperationResult(BaseModel):
+    count: int
@@ -0,0 +1,33 @@
+from datetime import datetime
+from enum import Enum
+
+from pydantic import BaseModel
+
+
+class HitEvent(str, Enum):
+    scan = "scan"
+    fetch = "fetch"
+
+
+class Granularity(str, Enum):
+    hour = "hour"
+    day = "day"
+
+
+class StatsParams(BaseModel):
+    event: HitEvent = HitEvent.scan
+    granularity: Granularity = Granularity.day
+    since: datetime | None = None
+    until: datetime | None = None
+
+
+class HitBucket(BaseModel):
+    bucket: datetime
+    count: int
+
+
+class HitStats(BaseModel):
+    event: HitEvent
+    granularity: Granularity
+    total: int
+    buckets: list[HitBucket]
@@ -1 +1,2 @@
+from .lazy import lazy_import
 from .pagination import paginate
@@ -0,0 +1,144 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict
+
+from qrcode_api.app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class DerivativeCache:
+    """Rendered derivatives of stored QR Codes, LRU bounded by bytes.
+
+    Every derivative is kept on disk, the small ones in memory too. The disk
+    index is per process and built from the directory on first use; workers
+    sharing the directory may evict each other's files, a derivative found
+    missing is just rendered again. Scans, reads and evictions run in a
+    thread, not on the event loop.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        disk_bytes: int,
+        memory_bytes: int,
+        memory_max_item_bytes: int,
+    ) -> None:
+        self.path = path
+        self.disk_bytes = disk_bytes
+        self.memory_bytes = memory_bytes
+        self.memory_max_item_bytes = memory_max_item_bytes
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_size = 0
+        self._disk: OrderedDict[str, int] | None = None
+        self._disk_size = 0
+        self._scan_lock = asyncio.Lock()
+
+    def file_path(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def get_bytes(self, name: str) -> bytes | None:
+        content = self._memory.get(name)
+        if content is not None:
+            self._memory.move_to_end(name)
+            if self._disk is not None and name in self._disk:
+                self._disk.move_to_end(name)
+        return content
+
+    async def get_path(self, name: str) -> str | None:
+        """Path of a derivative stored on disk, ``None`` if it must be rendered."""
+        disk_index = await self.disk_index()
+        if name not in disk_index:
+            return None
+
+        path = self.file_path(name)
+        if not os.path.isfile(path):
+            # Evicted by another worker
+            self._disk_size -= disk_index.pop(name)
+            return None
+
+        disk_index.move_to_end(name)
+        return path
+
+    async def add(self, name: str) -> None:
+        """Account for a derivative just rendered to ``file_path(name)``."""
+        disk_index = await self.disk_index()
+        size, content = await asyncio.to_thread(self._read, self.file_path(name))
+
+        if name not in disk_index:
+            disk_index[name] = size
+            self._disk_size += size
+            await self._evict_disk()
+            if name not in disk_index:
+                # Larger than the whole disk budget
+                return
+
+        if content is not None and name not in self._memory:
+            self._memory[name] = content
+            self._memory_size += size
+            while self._memory_size > self.memory_bytes:
+                _, content = self._memory.popitem(last=False)
+                self._memory_size -= len(content)
+
+    async def disk_index(self) -> OrderedDict[str, int]:
+        """Built from the directory on first use, off the event loop."""
+        if self._disk is None:
+            async with self._scan_lock:
+                if self._disk is None:
+                    disk = await asyncio.to_thread(self._scan)
+                    self._disk_size = sum(disk.values())
+                    self._disk = disk
+                    await self._evict_disk()
+        return self._disk
+
+    def _read(self, path: str) -> tuple[int, bytes | None]:
+        """Size of a derivative and its content if small enough for memory."""
+        size = os.path.getsize(path)
+        if size > self.memory_max_item_bytes:
+            return size, None
+        with open(path, "rb") as file:
+            content = file.read()
+        return len(content), content
+
+    def _scan(self) -> OrderedDict[str, int]:
+        """Index the derivatives already on disk, least recently used first."""
+        os.makedirs(self.path, exist_ok=True)
+        entries = []
+        with os.scandir(self.path) as scan:
+            for entry in scan:
+                if entry.is_file() and not entry.name.endswith(".tmp"):
+                    stat_result = entry.stat()
+                    entries.append(
+                        (stat_result.st_atime, entry.name, stat_result.st_size)
+                    )
+
+        entries.sort()
+        return OrderedDict((name, size) for _, name, size in entries)
+
+    async def _evict_disk(self) -> None:
+        evicted = []
+        while self._disk_size > self.disk_bytes and self._disk:
+            name, size = self._disk.popitem(last=False)
+            self._disk_size -= size
+            self._memory_size -= len(self._memory.pop(name, b""))
+            evicted.append(name)
+        if evicted:
+            await asyncio.to_thread(self._remove, evicted)
+
+    def _remove(self, names: list[str]) -> None:
+        for name in names:
+            try:
+                os.remove(self.file_path(name))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                logger.warning(f"Could not evict derivative {name}", exc_info=True)
+
+
+derivative_cache = DerivativeCache(
+    path=settings.DERIVATIVES_PATH,
+    disk_bytes=settings.DERIVATIVE_DISK_CACHE_BYTES,
+    memory_bytes=settings.DERIVATIVE_MEMORY_CACHE_BYTES,
+    memory_max_item_bytes=settings.DERIVATIVE_MEMORY_MAX_ITEM_BYTES,
+)
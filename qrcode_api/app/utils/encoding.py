@@ -0,0 +1,258 @@
+import math
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any
+
+from qrcode_api.app.utils.lazy import lazy_import, load
+
+if TYPE_CHECKING:
+    from segno import QRCode
+
+segno = lazy_import("segno")
+
+# Mode name of codes mixing several segment modes
+MIXED_MODE = "mixed"
+
+# Cost of a character in each mode, in sixths of a bit (numeric packs 3
+# digits in 10 bits, alphanumeric 2 characters in 11 bits)
+NUMERIC_COST = 20
+ALPHANUMERIC_COST = 33
+BYTE_COST = 48
+KANJI_COST = 78
+
+
+@dataclass
+class EncodingPlan:
+    """How data is encoded, the mode name is ``MIXED_MODE`` for several
+    segments. Versions are segno's names ("1" to "40", "M1" to "M4")."""
+
+    mode: str
+    version: str
+    error_level: str | None
+
+
+def is_kanji(char: str) -> bool:
+    try:
+        encoded = char.encode("shift_jis")
+    except UnicodeEncodeError:
+        return False
+    if len(encoded) != 2:
+        return False
+    code = int.from_bytes(encoded, "big")
+    return 0x8140 <= code <= 0x9FFC or 0xE040 <= code <= 0xEBBF
+
+
+def char_costs(char: str) -> dict[int, int]:
+    """Cost of ``char`` in every mode able to encode it."""
+    consts = segno.consts
+    byte_length = 1 if ord(char) < 256 else len(char.encode("utf-8"))
+    costs = {consts.MODE_BYTE: byte_length * BYTE_COST}
+    if "0" <= char <= "9":
+        costs[consts.MODE_NUMERIC] = NUMERIC_COST
+    if char.isascii() and char.encode() in consts.ALPHANUMERIC_CHARS:
+        costs[consts.MODE_ALPHANUMERIC] = ALPHANUMERIC_COST
+    if is_kanji(char):
+        costs[consts.MODE_KANJI] = KANJI_COST
+    return costs
+
+
+def optimal_segments(data: str, version_range: int) -> list[tuple[str, int]]:
+    """Split ``data`` into the ``(text, mode)`` segments with the shortest
+    bit stream for versions of ``version_range`` (their character count
+    indicators differ), by dynamic programming over the characters."""
+    consts = segno.consts
+    modes = (
+        consts.MODE_NUMERIC,
+        consts.MODE_ALPHANUMERIC,
+        consts.MODE_BYTE,
+        consts.MODE_KANJI,
+    )
+    # Mode indicator and character count indicator of a new segment
+    headers = {
+        mode: (4 + consts.CHAR_COUNT_INDICATOR_LENGTH[mode][version_range]) * 6
+        for mode in modes
+    }
+
+    costs = dict(headers)
+    # Per character, the mode it's encoded in given the mode of the next one
+    previous_modes: list[dict[int, int]] = []
+    for char in data:
+        extended = {mode: costs[mode] + cost for mode, cost in char_costs(char).items()}
+        choices = {mode: mode for mode in extended}
+        current = dict(extended)
+        for mode in modes:
+            for source, cost in extended.items():
+                # Segments end on a bit boundary
+                switched = math.ceil(cost / 6) * 6 + headers[mode]
+                if switched < current.get(mode, math.inf):
+                    current[mode] = switched
+                    choices[mode] = source
+        previous_modes.append(choices)
+        costs = current
+
+    mode = min(costs, key=costs.__getitem__)
+    char_modes = []
+    for choices in reversed(previous_modes):
+        mode = choices[mode]
+        char_modes.append(mode)
+    char_modes.reverse()
+
+    segments: list[tuple[str, int]] = []
+    start = 0
+    for index in range(1, len(data) + 1):
+        if index == len(data) or char_modes[index] != char_modes[start]:
+            segments.append((data[start:index], char_modes[start]))
+            start = index
+    return segments
+
+
+def error_levels() -> list[int]:
+    """Error level constants, from the lowest to the highest recovery."""
+    consts = segno.consts
+    return [
+        consts.ERROR_LEVEL_L,
+        consts.ERROR_LEVEL_M,
+        consts.ERROR_LEVEL_Q,
+        consts.ERROR_LEVEL_H,
+    ]
+
+
+def boosted_error_level(version: int, error: int | None, segments: Any) -> int | None:
+    """Highest error level still fitting ``version``.
+
+    Contrary to segno's own boosting, works for several segments too.
+    """
+    levels = error_levels()
+    if error is None or error == levels[-1]:
+        return error
+
+    data_length = segments.bit_length_with_overhead(version, eci=False)
+    for level in levels[levels.index(error) + 1 :]:
+        if segno.consts.SYMBOL_CAPACITY[version].get(level, -1) < data_length:
+            break
+        error = level
+    return error
+
+
+def plan_encoding(
+    data: Any,
+    *,
+    micro: bool = False,
+    error_level: str | None = None,
+    mode: str | None = None,
+    version: int | None = None,
+    boost_error: bool = True,
+) -> EncodingPlan:
+    """Pick the smallest symbol for ``data``.
+
+    An explicit ``mode`` is honored, otherwise string data destined to a
+    regular QR Code is also tried as optimal mixed mode segments. The
+    smallest version wins, then the highest error level. Raises
+    ``ValueError`` when the data doesn't fit.
+    """
+    load("segno")
+    encoder, consts = segno.encoder, segno.consts
+    error = encoder.normalize_errorlevel(error_level, accept_none=True)
+    if micro and error == consts.ERROR_LEVEL_H:
+        raise ValueError(
+            'Error correction level "H" is not available for Micro QR Codes'
+        )
+
+    segments = encoder.prepare_data(data, encoder.normalize_mode(mode), None)
+    # (segments, version range they were segmented for)
+    candidates = [(segments, None)]
+    if mode is None and not micro and isinstance(data, str) and data:
+        if version is not None:
+            ranges = [encoder.version_range(version)]
+        else:
+            ranges = [
+                consts.VERSION_RANGE_01_09,
+                consts.VERSION_RANGE_10_26,
+                consts.VERSION_RANGE_27_40,
+            ]
+        for version_range in ranges:
+            content = optimal_segments(data, version_range)
+            candidates.append(
+                (encoder.prepare_data(content, None, None), version_range)
+            )
+
+    levels = error_levels()
+    best = None
+    for segments, version_range in candidates:
+        try:
+            fitting = encoder.find_version(segments, error, eci=False, micro=micro)
+        except ValueError:
+            continue
+        if version is not None:
+            if fitting > version:
+                continue
+            fitting = version
+        # Rendering segments again for the version must give the same ones
+        if version_range is not None and encoder.version_range(fitting) != (
+            version_range
+        ):
+            continue
+
+        fitting_error = error
+        if fitting_error is None and fitting != consts.VERSION_M1:
+            fitting_error = consts.ERROR_LEVEL_L
+        if boost_error:
+            fitting_error = boosted_error_level(fitting, fitting_error, segments)
+
+        recovery = levels.index(fitting_error) if fitting_error is not None else -1
+        rank = (fitting, -recovery, len(segments))
+        if best is None or rank < best[0]:
+            best = (rank, segments, fitting, fitting_error)
+
+    if best is None:
+        if version is not None:
+            raise ValueError(f"The data doesn't fit into version {version}")
+        raise ValueError("The data doesn't fit into a QR Code")
+
+    _, segments, fitting, fitting_error = best
+    return EncodingPlan(
+        mode=(
+            MIXED_MODE
+            if len(segments) > 1
+            else encoder.get_mode_name(segments.modes[0])
+        ),
+        version=str(encoder.get_version_name(fitting)),
+        error_level=(
+            encoder.get_error_name(fitting_error) if fitting_error is not None else None
+        ),
+    )
+
+
+def make_qrcode(
+    data: Any,
+    *,
+    micro: bool = False,
+    error_level: str | None = None,
+    mode: str | None = None,
+    version: str | None = None,
+) -> "QRCode":
+    """Encode ``data`` as planned by :func:`plan_encoding`.
+
+    Mixed mode data is segmented again for the planned version, which gives
+    the planned segments. Without a version (codes stored before encoding
+    plans) segno picks the version and boosts the error level itself.
+    """
+    load("segno")
+    if version is None:
+        return segno.make(data, micro=micro, error=error_level, mode=mode)
+
+    if mode == MIXED_MODE:
+        version_range = segno.encoder.version_range(int(version))
+        return segno.make(
+            optimal_segments(data, version_range),
+            version=version,
+            error=error_level,
+            boost_error=False,
+        )
+    return segno.make(
+        data,
+        micro=micro,
+        error=error_level,
+        mode=mode,
+        version=version,
+        boost_error=False,
+    )
@@ -0,0 +1,139 @@
+import gzip
+import logging
+import os
+import shutil
+
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.utils.lazy import lazy_import
+
+logger = logging.getLogger(__name__)
+
+# Optional dependency, only used when installed ('poetry install -E brotli')
+try:
+    brotli = lazy_import("brotli")
+except ModuleNotFoundError:
+    brotli = None
+
+# Formats worth pre-compressing, PDF content streams are already deflated
+COMPRESSIBLE_EXTENSIONS = {".svg"}
+
+# Content-Encoding -> file suffix of the pre-compressed variant, by preference
+ENCODING_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def qrcode_file_path(file_name: str) -> str:
+    return f"{settings.STATIC_PATH}/{file_name}"
+
+
+def variant_paths(path: str) -> list[str]:
+    """Paths of every pre-compressed variant a stored file may have."""
+    return [path + suffix for suffix in ENCODING_SUFFIXES.values()]
+
+
+def write_compressed_variants(path: str) -> None:
+    """Write gzip (and brotli if available) copies next to ``path``.
+
+    Done once at creation so serving a compressed response costs no CPU.
+    Variants that don't end up smaller than the original are not kept.
+    """
+    if os.path.splitext(path)[1] not in COMPRESSIBLE_EXTENSIONS:
+        return
+
+    with open(path, "rb") as original:
+        data = original.read()
+
+    variants = {".gz": gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants[".br"] = brotli.compress(data, quality=11)
+
+    for suffix, compressed in variants.items():
+        if len(compressed) < len(data):
+            with open(path + suffix, "wb") as variant:
+                variant.write(compressed)
+
+
+def link_qrcode_file(source: str, path: str) -> None:
+    """Store an already rendered file (and its variants) under ``path``.
+
+    Hard links share the data with ``source``, so removing either file
+    later leaves the other intact. Falls back to a copy when the
+    filesystem doesn't support links.
+    """
+    if os.path.abspath(source) == os.path.abspath(path):
+        return
+
+    for source_path, target_path in zip(
+        [source, *variant_paths(source)], [path, *variant_paths(path)]
+    ):
+        if not os.path.isfile(source_path):
+            continue
+        try:
+            os.link(source_path, target_path)
+        except OSError:
+            shutil.copyfile(source_path, target_path)
+
+
+def parse_accept_encoding(header: str | None) -> dict[str, float]:
+    """Map each accepted content coding to its quality value."""
+    accepted: dict[str, float] = {}
+
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        if not coding:
+            continue
+
+        quality = 1.0
+        name, _, value = params.strip().partition("=")
+        if name.strip() == "q":
+            try:
+                quality = float(value)
+            except ValueError:
+                quality = 0.0
+
+        accepted[coding.strip().lower()] = quality
+
+    return accepted
+
+
+def negotiate_variant(path: str, accept_encoding: str | None) -> tuple[str, str | None]:
+    """Pick the best pre-compressed variant of ``path`` the client accepts.
+
+    Returns the path to serve and its ``Content-Encoding`` (``None`` for
+    the original file).
+    """
+    if os.path.splitext(path)[1] not in COMPRESSIBLE_EXTENSIONS:
+        return path, None
+
+    accepted = parse_accept_encoding(accept_encoding)
+    wildcard = accepted.get("*", 0.0)
+
+    candidates = [
+        (accepted.get(encoding, wildcard), encoding, path + suffix)
+        for encoding, suffix in ENCODING_SUFFIXES.items()
+    ]
+    # Stable sort keeps the server preference (br before gzip) on ties
+    candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+    for quality, encoding, variant in candidates:
+        if quality > 0 and os.path.isfile(variant):
+            return variant, encoding
+
+    return path, None
+
+
+def remove_qrcode_file(file_name: str) -> None:
+    """Remove a stored QR Code and its pre-compressed variants."""
+    path = qrcode_file_path(file_name)
+
+    for candidate in [path, *variant_paths(path)]:
+        if os.path.isfile(candidate):
+            os.remove(candidate)
+
+
+def remove_qrcode_files(file_names: list[str]) -> None:
+    """Remove many stored QR Codes, meant to run as a background task."""
+    for file_name in file_names:
+        try:
+            remove_qrcode_file(file_name)
+        except OSError:
+            logger.warning(f"Could not remove {file_name}", exc_info=True)
@@ -0,0 +1,94 @@
+import io
+import os
+from functools import lru_cache
+from typing import TYPE_CHECKING
+
+from qrcode_api.app.core.config import settings
+
+if TYPE_CHECKING:
+    from PIL.Image import Image
+    from segno import QRCode
+
+
+def asset_path(file_name: str) -> str:
+    return os.path.join(settings.ASSETS_PATH, file_name)
+
+
+def normalize_asset(data: bytes, path: str) -> tuple[int, int]:
+    """Decode an uploaded image, bound its size and store it as RGBA PNG.
+
+    Runs in the render pool. Raises ``ValueError`` for unreadable images and
+    ones larger than ``ASSET_MAX_PIXELS``, checked before decoding.
+    """
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            width, height = image.size
+            if width * height > settings.ASSET_MAX_PIXELS:
+                raise ValueError(
+                    f"Images are limited to {settings.ASSET_MAX_PIXELS} pixels"
+                )
+            image = image.convert("RGBA")
+    except Image.DecompressionBombError as error:
+        raise ValueError(
+            f"Images are limited to {settings.ASSET_MAX_PIXELS} pixels"
+        ) from error
+    except (UnidentifiedImageError, OSError) as error:
+        raise ValueError("The uploaded file is not a supported image") from error
+
+    image.thumbnail((settings.ASSET_MAX_DIMENSION, settings.ASSET_MAX_DIMENSION))
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    image.save(path, format="PNG")
+    return image.size
+
+
+@lru_cache(maxsize=settings.LOGO_CACHE_SIZE)
+def load_logo(asset_id: str, path: str, size: int) -> "Image":
+    """Decoded logo resized to fit a ``size`` pixels square.
+
+    Cached per (asset, size) so a logo is decoded and resized once, not on
+    every render. The returned image is shared and must not be modified.
+    """
+    from PIL import Image
+
+    with Image.open(path) as image:
+        logo = image.convert("RGBA")
+
+    logo.thumbnail((size, size), Image.LANCZOS)
+    return logo
+
+
+def render_image(
+    qrcode: "QRCode", scale: int, border: int, dark: str, light: str
+) -> "Image":
+    """Rasterize a QR Code straight from its matrix with Pillow."""
+    from PIL import Image, ImageOps
+
+    width, height = qrcode.symbol_size(scale=1, border=border)
+    modules = bytes(
+        0 if module else 255
+        for row in qrcode.matrix_iter(scale=1, border=border)
+        for module in row
+    )
+
+    image = Image.frombytes("L", (width, height), modules)
+    if scale != 1:
+        image = image.resize((width * scale, height * scale), Image.NEAREST)
+
+    return ImageOps.colorize(image, black=dark, white=light).convert("RGBA")
+
+
+def composite_logo(
+    image: "Image", asset_id: str, path: str, logo_size: float
+) -> "Image":
+    """Paste the logo at the center of ``image``."""
+    size = max(int(min(image.size) * logo_size), 1)
+    logo = load_logo(asset_id, path, size)
+
+    position = (
+        (image.width - logo.width) // 2,
+        (image.height - logo.height) // 2,
+    )
+    image.alpha_composite(logo, dest=position)
+    return image
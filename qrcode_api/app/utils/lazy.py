@@ -0,0 +1,41 @@
+import sys
+import importlib.util
+import threading
+from types import ModuleType
+
+_load_lock = threading.Lock()
+
+
+def lazy_import(name: str) -> ModuleType:
+    """Import a module whose body only executes on first attribute access.
+
+    Used for heavy dependencies (e.g. phonenumbers, segno) that are only
+    needed by a handful of endpoints, so they don't slow down worker startup.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def load(name: str) -> ModuleType:
+    """The module ``name`` imported by ``lazy_import``, executed now.
+
+    Concurrent first accesses of a lazy module race before Python 3.12 (one
+    thread sees the module partially executed), code running in several
+    threads (e.g. the render pool) loads it through here first.
+    """
+    with _load_lock:
+        module = sys.modules.get(name) or importlib.import_module(name)
+        # Any attribute access executes the module body
+        module.__name__
+    return module
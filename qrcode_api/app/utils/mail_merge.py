@@ -0,0 +1,513 @@
+"""Mail merge of CSV rows into QR Codes, from a streamed upload to a streamed
+ZIP archive or manifest, holding a bounded number of rows at a time."""
+
+import asyncio
+import codecs
+import csv
+import io
+import logging
+import os
+import re
+import tempfile
+import zipfile
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable
+
+from multipart import MultipartParser
+from multipart.multipart import parse_options_header
+from starlette.requests import ClientDisconnect
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+
+from qrcode_api.app.utils.files import remove_qrcode_files
+
+logger = logging.getLogger(__name__)
+
+# Multipart field of the CSV file, the other fields must precede it
+FILE_FIELD = "file"
+MAX_FIELD_BYTES = 64_000
+
+SPOOL_CHUNK_BYTES = 64 * 1024
+
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_COLUMNS = ("row", "label", "qrcode_file", "version", "error_level", "error")
+
+# Already compressed formats are stored as is in archives
+STORED_EXTENSIONS = {".png", ".pdf"}
+
+
+class MailMergeError(Exception):
+    """The upload can't be merged (any further)."""
+
+
+class CSVRecords:
+    """Parses CSV rows out of an encoded byte stream as it arrives.
+
+    Text is split into lines, a record is complete once it holds an even
+    number of quotes (quoted fields may span lines), complete records are
+    fed to a single ``csv.reader``. Only the incomplete record is buffered,
+    up to ``max_record_bytes``.
+    """
+
+    def __init__(self, max_record_bytes: int) -> None:
+        self.max_record_bytes = max_record_bytes
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self._tail = ""
+        self._record: list[str] = []
+        self._record_length = 0
+        self._quotes = 0
+        self._lines: deque[str] = deque()
+        self._reader = csv.reader(self._pending_lines())
+
+    def _pending_lines(self):
+        while True:
+            yield self._lines.popleft()
+
+    def feed(self, data: bytes, final: bool = False) -> list[list[str]]:
+        try:
+            text = self._tail + self._decoder.decode(data, final)
+        except UnicodeDecodeError:
+            raise MailMergeError("The CSV file must be UTF-8 encoded")
+
+        *lines, self._tail = text.split("\n")
+        lines = [f"{line}\n" for line in lines]
+        if final and self._tail:
+            lines.append(self._tail)
+            self._tail = ""
+
+        rows = []
+        for line in lines:
+            self._record.append(line)
+            self._record_length += len(line)
+            self._quotes += line.count('"')
+            if self._quotes % 2:
+                continue
+
+            self._lines.extend(self._record)
+            self._record, self._record_length, self._quotes = [], 0, 0
+            while self._lines:
+                try:
+                    row = next(self._reader)
+                except (csv.Error, IndexError) as error:
+                    raise MailMergeError(
+                        f"Malformed CSV record on line {self._reader.line_num}: "
+                        f"{error}"
+                    )
+                # Blank lines
+                if row:
+                    rows.append(row)
+
+        if self._record_length + len(self._tail) > self.max_record_bytes:
+            raise MailMergeError(
+                f"CSV records are limited to {self.max_record_bytes} characters"
+            )
+        if final and self._record:
+            raise MailMergeError("The CSV file ends in a quoted field")
+        return rows
+
+
+class MultipartCSVUpload:
+    """Incremental reader of a 'multipart/form-data' body: the text fields
+    preceding the CSV file part, then its rows as they are received.
+
+    Parts following the file are ignored.
+    """
+
+    def __init__(
+        self, stream: AsyncIterator[bytes], content_type: str, max_record_bytes: int
+    ) -> None:
+        media_type, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if media_type != b"multipart/form-data" or not boundary:
+            raise MailMergeError("Expected a multipart/form-data body")
+
+        self.fields: dict[str, str] = {}
+        self._stream = stream
+        self._records = CSVRecords(max_record_bytes)
+        self._rows: deque[list[str]] = deque()
+        self._ended = False
+        self._file_started = False
+        self._file_done = False
+        # Part being parsed
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._name = ""
+        self._value = bytearray()
+
+        self._parser = MultipartParser(
+            boundary,
+            {
+                "on_part_begin": self._on_part_begin,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+                "on_end": self._on_end,
+            },
+        )
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+        self._name = ""
+        self._value = bytearray()
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(
+            self._headers.get(b"content-disposition", b"")
+        )
+        self._name = options.get(b"name", b"").decode("latin-1")
+        if self._name == FILE_FIELD and not self._file_started:
+            self._file_started = True
+
+    def _in_file(self) -> bool:
+        return self._name == FILE_FIELD and not self._file_done
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_file():
+            self._rows.extend(self._records.feed(data[start:end]))
+        elif not self._file_started:
+            self._value += data[start:end]
+            if len(self._value) > MAX_FIELD_BYTES:
+                raise MailMergeError(f"The {self._name!r} field is too large")
+
+    def _on_part_end(self) -> None:
+        if self._in_file():
+            self._rows.extend(self._records.feed(b"", final=True))
+            self._file_done = True
+        elif not self._file_started and self._name:
+            self.fields[self._name] = self._value.decode()
+
+    def _on_end(self) -> None:
+        self._ended = True
+
+    async def _read(self) -> bool:
+        """Parse the next chunk of the body, ``False`` once it's all read."""
+        try:
+            chunk = await anext(self._stream)
+        except StopAsyncIteration:
+            self._parser.finalize()
+            if not self._ended:
+                raise MailMergeError("The multipart body is truncated")
+            return False
+        except ClientDisconnect:
+            raise MailMergeError("The client disconnected")
+
+        self._parser.write(chunk)
+        return True
+
+    async def start(self) -> list[str]:
+        """Read the fields and the CSV header, returns the header."""
+        while not self._rows and not self._file_done:
+            if not await self._read():
+                break
+
+        if not self._file_started:
+            raise MailMergeError(f"The {FILE_FIELD!r} part is missing")
+        if not self._rows:
+            raise MailMergeError("The CSV file is empty")
+        return self._rows.popleft()
+
+    async def rows(self) -> AsyncIterator[list[str]]:
+        """CSV rows following the header."""
+        while True:
+            while self._rows:
+                yield self._rows.popleft()
+            if self._file_done or not await self._read():
+                break
+
+        # Let the client finish sending its body
+        while not self._ended and await self._read():
+            pass
+
+
+class OutputSpool:
+    """Output of a merge, written by the merge task and streamed to the
+    client concurrently through a temporary file.
+
+    Most HTTP clients only read the response once their upload is sent;
+    streaming straight to them would stall the merge, so the upload, so the
+    client. Memory stays flat, the output is buffered on disk instead.
+    """
+
+    def __init__(self, directory: str | None) -> None:
+        self._file = tempfile.TemporaryFile(dir=directory, buffering=0)
+        self._buffer = bytearray()
+        self._written = 0
+        self._finished = False
+        self._changed = asyncio.Event()
+
+    def write(self, data: bytes) -> int:
+        """Buffer ``data``, written to the file by ``flush``. No 'tell' nor
+        'seek': ``zipfile`` writes unseekable streams sequentially."""
+        self._buffer += data
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    async def drain(self, force: bool = False) -> None:
+        """Write the buffered output, once large enough unless ``force``."""
+        if not self._buffer or (len(self._buffer) < SPOOL_CHUNK_BYTES and not force):
+            return
+
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        await asyncio.to_thread(self._file.write, data)
+        self._written += len(data)
+        self._changed.set()
+
+    async def finish(self) -> None:
+        await self.drain(force=True)
+        self._finished = True
+        self._changed.set()
+
+    async def chunks(self) -> AsyncIterator[bytes]:
+        """The output, as it's written, until ``finish``."""
+        offset = 0
+        try:
+            while True:
+                if offset < self._written:
+                    chunk = await asyncio.to_thread(
+                        os.pread,
+                        self._file.fileno(),
+                        min(self._written - offset, SPOOL_CHUNK_BYTES),
+                        offset,
+                    )
+                    offset += len(chunk)
+                    yield chunk
+                elif self._finished:
+                    return
+                else:
+                    self._changed.clear()
+                    await self._changed.wait()
+        finally:
+            self._file.close()
+
+
+class SpoolResponse(StreamingResponse):
+    """Streams while the request body is still being read by the merge,
+    which Starlette's ``StreamingResponse`` would consume listening for
+    disconnects."""
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await self.stream_response(send)
+
+
+@dataclass
+class MergeResult:
+    row: int
+    label: str | None = None
+    qrcode_file: str | None = None
+    version: str | None = None
+    error_level: str | None = None
+    error: str | None = None
+    # Rendered file, for archives
+    content: bytes | None = None
+    # Document to store
+    document: Any = None
+
+    def manifest_row(self) -> list[Any]:
+        return [
+            self.row,
+            self.label or "",
+            self.qrcode_file or "",
+            self.version or "",
+            self.error_level or "",
+            self.error or "",
+        ]
+
+
+def csv_line(values: list[Any]) -> bytes:
+    line = io.StringIO()
+    csv.writer(line).writerow(values)
+    return line.getvalue().encode()
+
+
+class ManifestOutput:
+    """A CSV line per row: its code, or why it failed."""
+
+    media_type = "text/csv"
+    file_name = MANIFEST_NAME
+
+    def __init__(self, spool: OutputSpool) -> None:
+        self.spool = spool
+        spool.write(csv_line(list(MANIFEST_COLUMNS)))
+
+    def add(self, result: MergeResult) -> None:
+        self.spool.write(csv_line(result.manifest_row()))
+
+    async def drain(self) -> None:
+        await self.spool.drain()
+
+    async def finish(self, error: str | None) -> None:
+        if error is not None:
+            self.spool.write(csv_line(MergeResult(row=0, error=error).manifest_row()))
+        await self.spool.finish()
+
+
+def archive_name(result: MergeResult) -> str:
+    stem, extension = os.path.splitext(result.qrcode_file)
+    if result.label:
+        stem = re.sub(r"[^\w.-]+", "_", result.label).strip("._")[:100] or stem
+    return f"{result.row:07d}-{stem}{extension}"
+
+
+class ZipOutput:
+    """Every rendered file, then the manifest, in a ZIP archive written
+    sequentially. The manifest is spooled to its own temporary file until
+    the files are written."""
+
+    media_type = "application/zip"
+    file_name = "qrcodes.zip"
+
+    def __init__(self, spool: OutputSpool, spool_directory: str | None) -> None:
+        self.spool = spool
+        self.archive = zipfile.ZipFile(spool, "w", allowZip64=True)
+        self.manifest = tempfile.TemporaryFile(dir=spool_directory)
+        self._manifest_buffer = bytearray(csv_line(list(MANIFEST_COLUMNS)))
+
+    def add(self, result: MergeResult) -> None:
+        if result.content is not None:
+            extension = os.path.splitext(result.qrcode_file)[1]
+            self.archive.writestr(
+                archive_name(result),
+                result.content,
+                compress_type=(
+                    zipfile.ZIP_STORED
+                    if extension in STORED_EXTENSIONS
+                    else zipfile.ZIP_DEFLATED
+                ),
+            )
+        self._manifest_buffer += csv_line(result.manifest_row())
+
+    async def _drain_manifest(self) -> None:
+        data = bytes(self._manifest_buffer)
+        self._manifest_buffer.clear()
+        await asyncio.to_thread(self.manifest.write, data)
+
+    async def drain(self) -> None:
+        await self.spool.drain()
+        if len(self._manifest_buffer) >= SPOOL_CHUNK_BYTES:
+            await self._drain_manifest()
+
+    async def finish(self, error: str | None) -> None:
+        if error is not None:
+            self._manifest_buffer += csv_line(
+                MergeResult(row=0, error=error).manifest_row()
+            )
+        await self._drain_manifest()
+
+        await asyncio.to_thread(self.manifest.seek, 0)
+        with self.archive.open(MANIFEST_NAME, "w", force_zip64=True) as entry:
+            while chunk := await asyncio.to_thread(
+                self.manifest.read, SPOOL_CHUNK_BYTES
+            ):
+                entry.write(chunk)
+                await self.spool.drain()
+        self.manifest.close()
+        self.archive.close()
+        await self.spool.finish()
+
+
+async def run_mail_merge(
+    rows: AsyncIterator[list[str]],
+    render_row: Callable[[int, list[str]], Awaitable[MergeResult]],
+    store: Callable[[list[Any]], Awaitable[None]],
+    output: ManifestOutput | ZipOutput,
+    *,
+    concurrency: int,
+    batch_size: int,
+    max_rows: int,
+) -> None:
+    """Render ``rows`` with up to ``concurrency`` renders in flight, store
+    their documents ``batch_size`` at a time and write the results to
+    ``output`` once stored, in row order."""
+    pending: deque[asyncio.Task[MergeResult]] = deque()
+    batch: list[MergeResult] = []
+
+    async def store_batch(write: bool = True) -> None:
+        documents = [result.document for result in batch if result.document]
+        if documents:
+            try:
+                await store(documents)
+            except Exception:
+                logger.error("Could not store merged QR Codes", exc_info=True)
+                file_names = []
+                for result in batch:
+                    if result.document is not None:
+                        file_names.append(result.qrcode_file)
+                        result.error = "The QR Code could not be stored"
+                        result.qrcode_file = result.content = None
+                # No document refers to the rendered files
+                await asyncio.to_thread(remove_qrcode_files, file_names)
+
+        if write:
+            for result in batch:
+                output.add(result)
+        batch.clear()
+        await output.drain()
+
+    async def complete_oldest() -> None:
+        task = pending.popleft()
+        try:
+            # Shielded, a cancelled render's thread would still write its file
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            pending.appendleft(task)
+            raise
+        batch.append(result)
+        if len(batch) >= batch_size:
+            await store_batch()
+
+    async def abandon() -> None:
+        # Client gone, the output isn't read anymore. Renders are awaited
+        # rather than cancelled and stored, so no file is left behind
+        await asyncio.gather(*pending, return_exceptions=True)
+        batch.extend(
+            task.result()
+            for task in pending
+            if not task.cancelled() and task.exception() is None
+        )
+        await store_batch(write=False)
+
+    error = None
+    try:
+        row_number = 0
+        async for row in rows:
+            row_number += 1
+            if row_number > max_rows:
+                raise MailMergeError(f"At most {max_rows} rows can be merged")
+            pending.append(asyncio.create_task(render_row(row_number, row)))
+            if len(pending) >= concurrency:
+                await complete_oldest()
+    except MailMergeError as merge_error:
+        error = str(merge_error)
+    except Exception:
+        logger.error("Mail merge failure", exc_info=True)
+        error = "Mail merge failure"
+    except BaseException:
+        await abandon()
+        raise
+
+    try:
+        while pending:
+            await complete_oldest()
+    except BaseException:
+        await abandon()
+        raise
+    await store_batch()
+    await output.finish(error)
@@ -0,0 +1,89 @@
+"""Raw module matrix of a symbol, for clients drawing codes themselves.
+
+The binary format (``.matrix``) is, big endian:
+
+- magic, 4 bytes: ``QRM1``
+- version, 1 byte: 1 to 40, 0x81 to 0x84 for Micro QR Codes M1 to M4
+- error level, 1 byte: 0 (M1 has none), 1 L, 2 M, 3 Q, 4 H
+- width and height in modules, 2 bytes each, without the quiet zone
+- quiet zone to keep around the symbol, in modules, 1 byte
+- the rows, top to bottom, 1 bit per module left to right (most significant
+  bit first, 1 for dark), each row padded to a whole byte
+
+The JSON format (``.json``) holds the same fields and the rows base64
+encoded.
+"""
+
+import base64
+import json
+import mimetypes
+import struct
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from segno import QRCode
+
+MAGIC = b"QRM1"
+HEADER = struct.Struct(">4sBBHHB")
+MEDIA_TYPE = "application/vnd.qrcode-api.matrix"
+MICRO_VERSION_FLAG = 0x80
+ERROR_LEVEL_CODES = {None: 0, "L": 1, "M": 2, "Q": 3, "H": 4}
+
+# '0'/'1' characters of module values, to read rows as binary numbers
+_BIT_CHARS = bytes.maketrans(b"\x00\x01", b"01")
+
+mimetypes.add_type(MEDIA_TYPE, ".matrix")
+
+
+def version_code(version: int | str) -> int:
+    if isinstance(version, str):
+        return MICRO_VERSION_FLAG | int(version[1:])
+    return version
+
+
+def pack_rows(matrix: tuple[bytearray, ...]) -> bytes:
+    """Rows bit-packed, each padded to a whole byte."""
+    width = len(matrix[0])
+    row_bytes = (width + 7) // 8
+    padding = row_bytes * 8 - width
+    return b"".join(
+        (int(bytes(row).translate(_BIT_CHARS), 2) << padding).to_bytes(row_bytes, "big")
+        for row in matrix
+    )
+
+
+def matrix_bytes(qrcode: "QRCode", border: int) -> bytes:
+    width, height = qrcode.symbol_size(scale=1, border=0)
+    header = HEADER.pack(
+        MAGIC,
+        version_code(qrcode.version),
+        ERROR_LEVEL_CODES[qrcode.error],
+        width,
+        height,
+        border,
+    )
+    return header + pack_rows(qrcode.matrix)
+
+
+def matrix_json(qrcode: "QRCode", border: int) -> dict[str, Any]:
+    width, height = qrcode.symbol_size(scale=1, border=0)
+    return {
+        "version": str(qrcode.version),
+        "error_level": qrcode.error,
+        "width": width,
+        "height": height,
+        "border": border,
+        "row_bytes": (width + 7) // 8,
+        "rows": base64.b64encode(pack_rows(qrcode.matrix)).decode("ascii"),
+    }
+
+
+def write_matrix(path: str, qrcode: "QRCode", file_format: str, border: int) -> None:
+    if file_format == "json":
+        content = json.dumps(matrix_json(qrcode, border), separators=(",", ":"))
+        with open(path, "w") as file:
+            file.write(content)
+        return
+
+    with open(path, "wb") as file:
+        file.write(matrix_bytes(qrcode, border))
@@ -2,6 +2,7 @@ from typing import TYPE_CHECKING, Type, TypeVar
 
 from beanie import Document
 
+from qrcode_api.app.db.routing import secondary_reads
 from qrcode_api.app.utils.types import PaginationDict
 
 
@@ -16,17 +17,19 @@ async def paginate(
     paging_params: "PaginationParams",
     sorting_params: "SortingParams",
 ) -> PaginationDict:
-    results = (
-        await document.find()
-        .skip(paging_params.skip)
-        .limit(paging_params.limit)
-        .sort((sorting_params.sort, sorting_params.order.direction))
-        .to_list()
-    )
+    with secondary_reads():
+        results = (
+            await document.find()
+            .skip(paging_params.skip)
+            .limit(paging_params.limit)
+            .sort((sorting_params.sort, sorting_params.order.direction))
+            .to_list()
+        )
+        total = await document.count()
 
     return {
         "page": paging_params.page,
         "per_page": paging_params.per_page,
-        "total": await document.count(),
+        "total": total,
         "data": results,
     }
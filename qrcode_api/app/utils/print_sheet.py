@@ -0,0 +1,327 @@
+import logging
+import zlib
+from dataclasses import dataclass
+from typing import Any, AsyncIterator
+
+from pydantic.color import Color
+
+from qrcode_api.app.core.render import render_pool
+from qrcode_api.app.schemas.print_sheet import MM_TO_PT, PrintSheetLayout
+from qrcode_api.app.utils.encoding import make_qrcode
+
+logger = logging.getLogger(__name__)
+
+CUT_MARK_LENGTH = 3 * MM_TO_PT
+
+# Average Helvetica glyph width relative to the font size, to truncate labels
+LABEL_CHAR_WIDTH = 0.55
+
+
+@dataclass
+class SheetCode:
+    """A code to lay out, drawn from its matrix or, with ``image_path``,
+    from a stored PNG (e.g. codes with an embedded logo)."""
+
+    label: str | None = None
+    data: Any = None
+    micro: bool = False
+    error_level: str | None = None
+    mode: str | None = None
+    version: str | None = None
+    dark: str = "#000"
+    light: str = "#fff"
+    image_path: str | None = None
+
+
+def pdf_color(color: str, operator: str) -> str:
+    red, green, blue = Color(color).as_rgb_tuple(alpha=False)
+    return f"{red / 255:.3f} {green / 255:.3f} {blue / 255:.3f} {operator}"
+
+
+def pdf_text(text: str) -> str:
+    """PDF string literal; characters outside WinAnsi become '?'."""
+    text = text.encode("cp1252", "replace").decode("latin-1")
+    text = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+    return f"({text})"
+
+
+def pdf_stream(dictionary: str, data: bytes) -> bytes:
+    data = zlib.compress(data)
+    header = f"<< {dictionary} /Length {len(data)} /Filter /FlateDecode >>"
+    return f"{header}\nstream\n".encode() + data + b"\nendstream"
+
+
+class PrintSheetWriter:
+    """Writes a print sheet PDF incrementally, one page at a time.
+
+    Every object is emitted as soon as its page is laid out, only object
+    offsets and page numbers are kept for the cross-reference table and
+    the page tree, which are written last.
+    """
+
+    catalog = 1
+    pages = 2
+    font = 3
+
+    def __init__(self, layout: PrintSheetLayout) -> None:
+        self.layout = layout
+        self.position = 0
+        self._offsets: dict[int, int] = {}
+        self._last_object = self.font
+        self._page_objects: list[int] = []
+
+    @property
+    def page_count(self) -> int:
+        return len(self._page_objects)
+
+    def _allocate(self) -> int:
+        self._last_object += 1
+        return self._last_object
+
+    def _object(self, number: int, body: bytes) -> bytes:
+        chunk = f"{number} 0 obj\n".encode() + body + b"\nendobj\n"
+        self._offsets[number] = self.position
+        self.position += len(chunk)
+        return chunk
+
+    def start(self) -> bytes:
+        header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self.position = len(header)
+        return b"".join(
+            [
+                header,
+                self._object(self.catalog, b"<< /Type /Catalog /Pages 2 0 R >>"),
+                self._object(
+                    self.font,
+                    b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica"
+                    b" /Encoding /WinAnsiEncoding >>",
+                ),
+            ]
+        )
+
+    def page(self, codes: list[SheetCode]) -> bytes:
+        """Lay out one page of codes, runs in the render pool."""
+        layout = self.layout
+        page_width, page_height = layout.page_size_pt
+        cell_width, cell_height = layout.cell_size_pt
+        margin, gutter = layout.margin * MM_TO_PT, layout.gutter * MM_TO_PT
+        size = min(cell_width, cell_height - layout.label_height_pt)
+
+        operations: list[str] = []
+        images: dict[str, int] = {}
+        chunks: list[bytes] = []
+
+        for index, code in enumerate(codes):
+            row, column = divmod(index, layout.columns)
+            left = margin + column * (cell_width + gutter)
+            top = page_height - margin - row * (cell_height + gutter)
+            x, y = left + (cell_width - size) / 2, top - size
+
+            if code.image_path is not None:
+                image = self._image(code.image_path)
+                if image is None:
+                    continue
+                name = f"Im{len(images)}"
+                images[name] = self._allocate()
+                chunks.append(self._object(images[name], image))
+                operations.append(f"q {size:.3f} 0 0 {size:.3f} {x:.3f} {y:.3f} cm")
+                operations.append(f"/{name} Do Q")
+                quiet_zone = 0.0
+            else:
+                try:
+                    quiet_zone = self._draw_modules(operations, code, x, y, size)
+                except ValueError:
+                    # Data that doesn't fit a (Micro) QR Code, leave the cell empty
+                    logger.warning("Could not encode a print sheet code", exc_info=True)
+                    continue
+
+            if layout.labels and code.label:
+                self._draw_label(operations, code.label, x + quiet_zone, y, size)
+
+            if layout.cut_marks:
+                self._draw_cut_marks(
+                    operations,
+                    left,
+                    top - cell_height,
+                    cell_width,
+                    cell_height,
+                    spaces=(
+                        margin if column == 0 else gutter / 2,
+                        margin if column == layout.columns - 1 else gutter / 2,
+                        margin if row == layout.rows - 1 else gutter / 2,
+                        margin if row == 0 else gutter / 2,
+                    ),
+                )
+
+        contents = self._allocate()
+        chunks.append(
+            self._object(
+                contents, pdf_stream("", "\n".join(operations).encode("latin-1"))
+            )
+        )
+
+        xobjects = " ".join(f"/{name} {number} 0 R" for name, number in images.items())
+        page = self._allocate()
+        chunks.append(
+            self._object(
+                page,
+                (
+                    f"<< /Type /Page /Parent {self.pages} 0 R"
+                    f" /MediaBox [0 0 {page_width:.3f} {page_height:.3f}]"
+                    f" /Resources << /Font << /F1 {self.font} 0 R >>"
+                    f" /XObject << {xobjects} >> >>"
+                    f" /Contents {contents} 0 R >>"
+                ).encode(),
+            )
+        )
+        self._page_objects.append(page)
+        return b"".join(chunks)
+
+    def finish(self) -> bytes:
+        """Page tree, cross-reference table and trailer."""
+        kids = " ".join(f"{number} 0 R" for number in self._page_objects)
+        chunks = [
+            self._object(
+                self.pages,
+                f"<< /Type /Pages /Kids [{kids}] /Count {self.page_count} >>".encode(),
+            )
+        ]
+
+        xref_position = self.position
+        size = self._last_object + 1
+        xref = [f"xref\n0 {size}\n", "0000000000 65535 f \n"]
+        xref.extend(
+            f"{self._offsets[number]:010d} 00000 n \n" for number in range(1, size)
+        )
+        xref.append(
+            f"trailer\n<< /Size {size} /Root {self.catalog} 0 R >>\n"
+            f"startxref\n{xref_position}\n%%EOF\n"
+        )
+        chunks.append("".join(xref).encode())
+        return b"".join(chunks)
+
+    def _draw_modules(
+        self, operations: list[str], code: SheetCode, x: float, y: float, size: float
+    ) -> float:
+        """Draw the code with one rectangle per horizontal run of dark
+        modules, returns the width of the quiet zone."""
+        qrcode = make_qrcode(
+            code.data,
+            micro=code.micro,
+            error_level=code.error_level,
+            mode=code.mode,
+            version=code.version,
+        )
+        border = self.layout.border
+        modules = qrcode.symbol_size(scale=1, border=0)[0]
+        module = size / (modules + 2 * border)
+
+        operations.append(pdf_color(code.light, "rg"))
+        operations.append(f"{x:.3f} {y:.3f} {size:.3f} {size:.3f} re f")
+        operations.append(pdf_color(code.dark, "rg"))
+
+        for row_index, row in enumerate(qrcode.matrix):
+            row_y = y + size - (border + row_index + 1) * module
+            column = 0
+            while column < modules:
+                if not row[column]:
+                    column += 1
+                    continue
+                start = column
+                while column < modules and row[column]:
+                    column += 1
+                operations.append(
+                    f"{x + (border + start) * module:.3f} {row_y:.3f}"
+                    f" {(column - start) * module:.3f} {module:.3f} re"
+                )
+
+        operations.append("f")
+        return border * module
+
+    def _draw_label(
+        self, operations: list[str], label: str, x: float, y: float, size: float
+    ) -> None:
+        font_size = self.layout.font_size
+        max_chars = max(int(size / (font_size * LABEL_CHAR_WIDTH)), 1)
+        if len(label) > max_chars:
+            label = label[: max_chars - 1] + "…"
+
+        operations.append(
+            f"0 g BT /F1 {font_size:.2f} Tf {x:.3f} {y - font_size * 1.2:.3f} Td"
+            f" {pdf_text(label)} Tj ET"
+        )
+
+    @staticmethod
+    def _draw_cut_marks(
+        operations: list[str],
+        x: float,
+        y: float,
+        width: float,
+        height: float,
+        spaces: tuple[float, float, float, float],
+    ) -> None:
+        """Marks in the free space (left, right, bottom, top) around a cell,
+        along the extension of its edges."""
+        left, right, bottom, top = (min(space, CUT_MARK_LENGTH) for space in spaces)
+        lines = []
+        for corner_y in (y, y + height):
+            if left > 0:
+                lines.append((x - left, corner_y, x, corner_y))
+            if right > 0:
+                lines.append((x + width, corner_y, x + width + right, corner_y))
+        for corner_x in (x, x + width):
+            if bottom > 0:
+                lines.append((corner_x, y - bottom, corner_x, y))
+            if top > 0:
+                lines.append((corner_x, y + height, corner_x, y + height + top))
+
+        if not lines:
+            return
+        operations.append("0 G 0.25 w")
+        operations.extend(
+            f"{x1:.3f} {y1:.3f} m {x2:.3f} {y2:.3f} l" for x1, y1, x2, y2 in lines
+        )
+        operations.append("S")
+
+    @staticmethod
+    def _image(path: str) -> bytes | None:
+        """Image XObject of a stored PNG, flattened on white."""
+        from PIL import Image
+
+        try:
+            with Image.open(path) as image:
+                image = image.convert("RGBA")
+        except OSError:
+            logger.warning(f"Could not read {path} for a print sheet", exc_info=True)
+            return None
+
+        background = Image.new("RGBA", image.size, "white")
+        image = Image.alpha_composite(background, image).convert("RGB")
+        return pdf_stream(
+            f"/Type /XObject /Subtype /Image /Width {image.width}"
+            f" /Height {image.height} /ColorSpace /DeviceRGB /BitsPerComponent 8",
+            image.tobytes(),
+        )
+
+
+async def stream_print_sheet(
+    codes: AsyncIterator[SheetCode], layout: PrintSheetLayout
+) -> AsyncIterator[bytes]:
+    """Yield the PDF as pages are laid out, holding one page at a time."""
+    writer = PrintSheetWriter(layout)
+    per_page = layout.columns * layout.rows
+
+    yield writer.start()
+
+    page: list[SheetCode] = []
+    async for code in codes:
+        page.append(code)
+        if len(page) == per_page:
+            yield await render_pool.run(writer.page, page)
+            page = []
+
+    # A PDF needs at least one page, even an empty one
+    if page or not writer.page_count:
+        yield await render_pool.run(writer.page, page)
+
+    yield writer.finish()
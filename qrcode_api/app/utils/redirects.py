@@ -0,0 +1,39 @@
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.models import DynamicQRCode
+from qrcode_api.app.models.dynamic_qrcode import DynamicQRCodeTarget
+from qrcode_api.app.utils.cache import MISSING, TTLCache
+
+# short code -> redirect target, None for unknown codes (negative caching)
+redirect_cache: TTLCache[str, DynamicQRCodeTarget | None] = TTLCache(
+    maxsize=settings.REDIRECT_CACHE_SIZE,
+    ttl=settings.REDIRECT_CACHE_TTL_SECONDS,
+)
+
+
+async def resolve_short_code(short_code: str) -> DynamicQRCodeTarget | None:
+    """Redirect target of a dynamic QR Code, served from cache when possible.
+
+    Updates invalidate the cache of the worker handling them, other workers
+    pick up changes once their entry expires (REDIRECT_CACHE_TTL_SECONDS).
+    """
+    target = redirect_cache.get(short_code)
+    if target is not MISSING:
+        return target
+
+    target = await DynamicQRCode.get_target(short_code=short_code)
+    redirect_cache.set(
+        short_code,
+        target,
+        ttl=None if target else settings.REDIRECT_NEGATIVE_CACHE_TTL_SECONDS,
+    )
+    return target
+
+
+def invalidate_short_codes(short_codes: list[str]) -> None:
+    for short_code in short_codes:
+        redirect_cache.pop(short_code)
+
+
+async def delete_redirects(file_names: list[str]) -> None:
+    """Remove the redirects of deleted QR Codes and drop them from the cache."""
+    invalidate_short_codes(await DynamicQRCode.delete_by_files(file_names=file_names))
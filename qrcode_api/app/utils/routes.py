@@ -0,0 +1,30 @@
+from typing import Any, Callable
+
+from starlette.routing import BaseRoute
+from starlette.types import Scope
+
+# Endpoint -> path template of its route, filled on first use
+_route_paths: dict[Callable[..., Any], str] = {}
+
+
+def route_path(routes: list[BaseRoute], endpoint: Callable[..., Any]) -> str | None:
+    path = _route_paths.get(endpoint)
+    if path is None:
+        for route in routes:
+            if getattr(route, "endpoint", None) is endpoint:
+                path = _route_paths[endpoint] = getattr(route, "path", None)
+                break
+    return path
+
+
+def route_label(scope: Scope) -> str:
+    """'METHOD /path/{template}' of the route handling the request, once
+    routed; templates keep the number of distinct labels bounded."""
+    method = scope.get("method", scope["type"].upper())
+    endpoint = scope.get("endpoint")
+    app = scope.get("app")
+    if endpoint is None or app is None:
+        return f"{method} (unrouted)"
+
+    path = route_path(app.router.routes, endpoint)
+    return f"{method} {path or scope['path']}"
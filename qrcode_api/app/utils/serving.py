@@ -0,0 +1,278 @@
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Mapping
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+from qrcode_api.app.core.config import settings
+
+# Stored files are '<md5 hex>.<format>', anything else is rejected
+FILE_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+\.[A-Za-z0-9]+$")
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+ZEROCOPY_EXTENSION = "http.response.zerocopysend"
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def resolve_static_file(file_name: str) -> str | None:
+    """Absolute path of a stored file, ``None`` for unsafe or unknown names."""
+    if not FILE_NAME_PATTERN.match(file_name):
+        return None
+
+    root = os.path.realpath(settings.STATIC_PATH)
+    path = os.path.realpath(os.path.join(root, file_name))
+    if os.path.commonpath([root, path]) != root:
+        return None
+
+    return path
+
+
+def make_etag(stat_result: os.stat_result, encoding: str | None = None) -> str:
+    tag = f"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"
+    if encoding:
+        tag = f"{tag}-{encoding}"
+    return f'"{tag}"'
+
+
+def is_not_modified(
+    request_headers: Headers, etag: str, stat_result: os.stat_result
+) -> bool:
+    """Evaluate 'If-None-Match' and, without it, 'If-Modified-Since'."""
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags
+
+    if_modified_since = request_headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+        return int(stat_result.st_mtime) <= since
+
+    return False
+
+
+def parse_range(
+    request_headers: Headers, etag: str, size: int
+) -> tuple[int, int] | None:
+    """Single byte range requested as (offset, length), ``None`` for the
+    whole file. Multiple ranges are not supported and fall back to the
+    whole file as RFC 9110 allows."""
+    range_header = request_headers.get("range")
+    if range_header is None:
+        return None
+
+    if_range = request_headers.get("if-range")
+    if if_range is not None and if_range.strip() != etag:
+        return None
+
+    match = RANGE_PATTERN.match(range_header.strip())
+    if not match:
+        return None
+
+    start, end = match.groups()
+    if not start and not end:
+        return None
+
+    if not start:
+        length = min(int(end), size)
+        if length == 0:
+            raise RangeNotSatisfiable()
+        return size - length, length
+
+    offset = int(start)
+    last = min(int(end), size - 1) if end else size - 1
+    if offset >= size or last < offset:
+        raise RangeNotSatisfiable()
+
+    return offset, last - offset + 1
+
+
+class StaticFileResponse(Response):
+    """Sends a byte range of a file.
+
+    Uses the ASGI zero-copy send extension ('os.sendfile' in the server) when
+    the server supports it, otherwise streams the file in chunks read off the
+    event loop.
+    """
+
+    chunk_size = 64 * 1024
+
+    def __init__(
+        self,
+        path: str,
+        *,
+        offset: int,
+        length: int,
+        status_code: int = 200,
+        headers: Mapping[str, str] | None = None,
+        media_type: str | None = None,
+    ) -> None:
+        self.path = path
+        self.offset = offset
+        self.length = length
+        headers = {**(headers or {}), "content-length": str(length)}
+        super().__init__(
+            status_code=status_code, headers=headers, media_type=media_type
+        )
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+
+        if scope["method"] == "HEAD" or self.length == 0:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if ZEROCOPY_EXTENSION in scope.get("extensions", {}):
+            with open(self.path, "rb") as file:
+                await send(
+                    {
+                        "type": ZEROCOPY_EXTENSION,
+                        "file": file,
+                        "offset": self.offset,
+                        "count": self.length,
+                        "more_body": False,
+                    }
+                )
+            return
+
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.offset)
+            remaining = self.length
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send(
+                    {
+                        "type": "http.response.body",
+                        "body": chunk,
+                        "more_body": remaining > 0,
+                    }
+                )
+
+        if remaining > 0:
+            # The file shrank while sending, end the response anyway
+            await send({"type": "http.response.body", "body": b""})
+
+
+def build_file_response(
+    request_headers: Headers,
+    path: str,
+    stat_result: os.stat_result,
+    *,
+    media_type: str | None,
+    encoding: str | None = None,
+    headers: Mapping[str, str] | None = None,
+    offload: bool = True,
+    etag: str | None = None,
+) -> Response:
+    """Response for a stored file with validators, caching and Range support.
+
+    Files outside STATIC_PATH must pass ``offload=False``, the reverse proxy
+    only knows about that directory. ``etag`` replaces the one derived from
+    the file's size and mtime.
+    """
+    etag = etag or make_etag(stat_result, encoding)
+    response_headers = {
+        **(headers or {}),
+        "etag": etag,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        # File names are random and never rewritten, so they are immutable
+        "cache-control": f"public, max-age={settings.FILE_CACHE_MAX_AGE}, immutable",
+        "accept-ranges": "bytes",
+    }
+    if encoding:
+        response_headers["content-encoding"] = encoding
+
+    if offload and settings.FILE_SERVING_MODE != "app":
+        return offload_response(path, media_type, response_headers)
+
+    if is_not_modified(request_headers, etag, stat_result):
+        return Response(status_code=304, headers=response_headers)
+
+    size = stat_result.st_size
+    try:
+        byte_range = parse_range(request_headers, etag, size)
+    except RangeNotSatisfiable:
+        return Response(
+            status_code=416,
+            headers={**response_headers, "content-range": f"bytes */{size}"},
+        )
+
+    if byte_range is None:
+        return StaticFileResponse(
+            path,
+            offset=0,
+            length=size,
+            headers=response_headers,
+            media_type=media_type,
+        )
+
+    offset, length = byte_range
+    response_headers["content-range"] = f"bytes {offset}-{offset + length - 1}/{size}"
+    return StaticFileResponse(
+        path,
+        offset=offset,
+        length=length,
+        status_code=206,
+        headers=response_headers,
+        media_type=media_type,
+    )
+
+
+def build_bytes_response(
+    request_headers: Headers,
+    content: bytes,
+    *,
+    etag: str,
+    media_type: str | None,
+    headers: Mapping[str, str] | None = None,
+) -> Response:
+    """Response for a file held in memory, with the caching headers of
+    stored files but without Range support."""
+    response_headers = {
+        **(headers or {}),
+        "etag": etag,
+        "cache-control": f"public, max-age={settings.FILE_CACHE_MAX_AGE}, immutable",
+    }
+
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        if "*" in tags or etag in tags:
+            return Response(status_code=304, headers=response_headers)
+
+    return Response(content, headers=response_headers, media_type=media_type)
+
+
+def offload_response(
+    path: str, media_type: str | None, headers: Mapping[str, str]
+) -> Response:
+    """Let the reverse proxy send the file (nginx 'X-Accel-Redirect' or
+    Apache/lighttpd 'X-Sendfile'); it also handles Range and conditionals."""
+    headers = dict(headers)
+    if settings.FILE_SERVING_MODE == "x-accel-redirect":
+        prefix = settings.FILE_OFFLOAD_PREFIX.rstrip("/")
+        headers["x-accel-redirect"] = f"{prefix}/{os.path.basename(path)}"
+    else:
+        headers["x-sendfile"] = path
+
+    return Response(headers=headers, media_type=media_type)
@@ -0,0 +1,101 @@
+"""Measure the cold start of the application.
+
+Two numbers are reported:
+
+- ``import``: time to import ``qrcode_api.app.main`` in a fresh interpreter.
+- ``first response``: time from spawning uvicorn until ``--url`` answers with
+  a 2xx status (requires a reachable MongoDB, skipped with ``--import-only``).
+
+Usage: python scripts/bench_startup.py [--runs 5] [--url URL] [--import-only]
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+IMPORT_SNIPPET = (
+    "import time; start = time.perf_counter(); "
+    "import qrcode_api.app.main; "
+    "print(time.perf_counter() - start)"
+)
+
+
+def bench_import(runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-c", IMPORT_SNIPPET],
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        timings.append(float(output.stdout.strip().splitlines()[-1]))
+    return timings
+
+
+def bench_first_response(runs: int, url: str, port: int, timeout: float) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "qrcode_api.app.main:app",
+                "--port",
+                str(port),
+                "--log-level",
+                "warning",
+            ],
+        )
+        try:
+            while time.perf_counter() - start < timeout:
+                try:
+                    with urllib.request.urlopen(url, timeout=1) as response:
+                        if 200 <= response.status < 300:
+                            timings.append(time.perf_counter() - start)
+                            break
+                except (urllib.error.URLError, ConnectionError):
+                    time.sleep(0.01)
+            else:
+                raise TimeoutError(f"{url} did not answer within {timeout}s")
+        finally:
+            server.terminate()
+            server.wait()
+    return timings
+
+
+def report(name: str, timings: list[float]) -> None:
+    print(
+        f"{name:>15}: median {statistics.median(timings) * 1000:8.1f} ms"
+        f" | min {min(timings) * 1000:8.1f} ms"
+        f" | max {max(timings) * 1000:8.1f} ms"
+        f" ({len(timings)} runs)"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--port", type=int, default=8899)
+    parser.add_argument("--url", default=None)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--import-only", action="store_true")
+    args = parser.parse_args()
+
+    report("import", bench_import(args.runs))
+
+    if not args.import_only:
+        url = args.url or f"http://127.0.0.1:{args.port}/api/v1/openapi.json"
+        report(
+            "first response",
+            bench_first_response(args.runs, url, args.port, args.timeout),
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import os
+import tempfile
+
+# Settings are read on import, the required ones get test values first
+_TEST_DIR = tempfile.mkdtemp(prefix="qrcode-api-tests-")
+
+for name, value in {
+    "UVICORN_HOST": "127.0.0.1",
+    "UVICORN_PORT": "8000",
+    "MONGO_DB": "qrcode_api_tests",
+    "MONGO_URI": "mongodb://localhost:27017",
+    "MAX_DB_CONN_COUNT": "10",
+    "MIN_DB_CONN_COUNT": "1",
+    "SECRET_KEY": "test-secret",
+    "EXPIRE_MINUTES": "30",
+    "ALGORITHM": "HS256",
+    "LOG_DIR": os.path.join(_TEST_DIR, "logs"),
+    "LOG_CONFIG_FILE": "logging-dev.yaml",
+    "SUPERUSER": "admin",
+    "SUPERUSER_EMAIL": "admin@example.com",
+    "SUPERUSER_PASSWORD": "admin",
+    "STATIC_PATH": os.path.join(_TEST_DIR, "static"),
+    "DERIVATIVES_PATH": os.path.join(_TEST_DIR, "derivatives"),
+}.items():
+    os.environ.setdefault(f"QR_CODE_API_{name}", value)
+
+os.makedirs(os.environ["QR_CODE_API_STATIC_PATH"], exist_ok=True)
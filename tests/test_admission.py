@@ -0,0 +1,425 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from qrcode_api.app.core import admission
+from qrcode_api.app.core.admission import (
+    CRITICAL,
+    LOW,
+    NORMAL,
+    AdmissionController,
+    Rejected,
+)
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.middleware import admission as admission_middleware
+from qrcode_api.app.middleware.admission import AdmissionControl, AdmissionRoute
+
+
+@pytest.fixture
+def render_pool(monkeypatch):
+    render_pool = SimpleNamespace(is_saturated=False)
+    monkeypatch.setattr(admission, "render_pool", render_pool)
+    return render_pool
+
+
+def make_controller(
+    max_in_flight: dict[str, int] | None = None,
+    max_queue_delay: float = 1,
+    adjust_interval: float = 60,
+) -> AdmissionController:
+    return AdmissionController(
+        interval=0.25,
+        loop_delay_target=0.05,
+        max_queue_delay=max_queue_delay,
+        adjust_interval=adjust_interval,
+        latency_targets={"render": 1.0, "listing": 0.5},
+        max_in_flight=max_in_flight or {},
+    )
+
+
+def test_classify():
+    controller = make_controller()
+
+    assert controller.classify("readiness") is None
+    assert controller.classify("fetch_qrcode_file").name == "fetch"
+    assert controller.classify("get_qrcodes").name == "listing"
+    assert controller.classify("unknown_route").name == "other"
+    assert controller.classify(None).name == "other"
+    assert controller.classify_derivatives("fetch_qrcode_file").name == "render"
+    assert controller.classify_derivatives("get_qrcodes") is None
+
+
+def test_unbounded_class_is_admitted_at_once():
+    controller = make_controller()
+    render = controller.classes["render"]
+
+    async def main():
+        return [await controller.acquire(render) for _ in range(100)]
+
+    assert asyncio.run(main()) == [0.0] * 100
+    assert render.in_flight == render.admitted == 100
+
+    for _ in range(100):
+        controller.release(render)
+    assert render.in_flight == 0
+
+
+def test_queued_request_gets_the_released_slot():
+    controller = make_controller({"render": 1})
+    render = controller.classes["render"]
+
+    async def main():
+        await controller.acquire(render)
+        queued = asyncio.create_task(controller.acquire(render))
+        await asyncio.sleep(0.02)
+        assert len(render.waiters) == 1
+
+        controller.release(render)
+        delay = await queued
+        # Handed over, not released and taken again
+        assert render.in_flight == 1
+        controller.release(render)
+        return delay
+
+    assert asyncio.run(main()) >= 0.02
+    assert render.in_flight == 0
+    assert not render.waiters
+    assert render.admitted == 2
+
+
+def test_queued_requests_are_admitted_in_order():
+    controller = make_controller({"render": 1})
+    render = controller.classes["render"]
+    admitted = []
+
+    async def request(name):
+        await controller.acquire(render)
+        admitted.append(name)
+
+    async def main():
+        await controller.acquire(render)
+        tasks = []
+        for name in "abc":
+            tasks.append(asyncio.create_task(request(name)))
+            await asyncio.sleep(0)
+        for _ in range(3):
+            controller.release(render)
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+
+    asyncio.run(main())
+
+    assert admitted == list("abc")
+
+
+def test_queued_too_long_is_shed():
+    controller = make_controller({"render": 1}, max_queue_delay=0.02)
+    render = controller.classes["render"]
+
+    async def main():
+        await controller.acquire(render)
+        with pytest.raises(Rejected):
+            await controller.acquire(render)
+
+    asyncio.run(main())
+
+    assert render.shed == 1
+    assert render.in_flight == 1
+    assert not render.waiters
+
+
+def test_low_priority_is_not_queued():
+    controller = make_controller({"listing": 1})
+    listing = controller.classes["listing"]
+
+    async def main():
+        await controller.acquire(listing)
+        with pytest.raises(Rejected):
+            await asyncio.wait_for(controller.acquire(listing), 0.01)
+
+    asyncio.run(main())
+
+    assert listing.shed == 1
+    assert not listing.waiters
+
+
+def test_cancelled_waiter_is_skipped():
+    controller = make_controller({"render": 1})
+    render = controller.classes["render"]
+
+    async def main():
+        await controller.acquire(render)
+        cancelled = asyncio.create_task(controller.acquire(render))
+        queued = asyncio.create_task(controller.acquire(render))
+        await asyncio.sleep(0.01)
+        cancelled.cancel()
+        await asyncio.sleep(0)
+
+        controller.release(render)
+        await queued
+        controller.release(render)
+
+    asyncio.run(main())
+
+    assert render.in_flight == 0
+    assert not render.waiters
+
+
+def test_slot_handed_to_a_cancelled_waiter_is_not_leaked():
+    controller = make_controller({"render": 1})
+    render = controller.classes["render"]
+
+    async def main():
+        await controller.acquire(render)
+        queued = asyncio.create_task(controller.acquire(render))
+        await asyncio.sleep(0.01)
+
+        # Cancelled after the slot is handed over, before it resumes
+        controller.release(render)
+        queued.cancel()
+        try:
+            await queued
+        except asyncio.CancelledError:
+            pass
+        else:
+            controller.release(render)
+
+    asyncio.run(main())
+
+    assert render.in_flight == 0
+    assert not render.waiters
+
+
+@pytest.mark.parametrize(
+    "shed_below, admitted",
+    [
+        (LOW, {"listing", "render", "fetch"}),
+        (NORMAL, {"render", "fetch"}),
+        (CRITICAL, {"fetch"}),
+    ],
+)
+def test_shedding_by_priority(shed_below, admitted):
+    controller = make_controller()
+    controller.shed_below = shed_below
+
+    async def try_acquire(name):
+        try:
+            await controller.acquire(controller.classes[name])
+        except Rejected:
+            return False
+        return True
+
+    async def main():
+        return {
+            name for name in ("listing", "render", "fetch") if await try_acquire(name)
+        }
+
+    assert asyncio.run(main()) == admitted
+
+
+def test_overload_sheds_at_once_then_escalates(render_pool):
+    controller = make_controller(adjust_interval=60)
+    controller.loop_delay = 0.1
+
+    controller.evaluate()
+    assert controller.overloaded
+    assert controller.shed_below == NORMAL
+
+    # Not for long enough yet
+    controller.evaluate()
+    assert controller.shed_below == NORMAL
+
+    controller.adjust_interval = 0
+    controller.evaluate()
+    assert controller.shed_below == CRITICAL
+    # Critical classes are never shed
+    controller.evaluate()
+    assert controller.shed_below == CRITICAL
+    assert controller.stats()["shedding"] == ["low", "normal"]
+
+
+def test_recovery_lifts_a_priority_at_a_time(render_pool):
+    controller = make_controller(adjust_interval=0)
+    controller.loop_delay = 0.1
+    controller.evaluate()
+    controller.evaluate()
+    assert controller.shed_below == CRITICAL
+
+    controller.loop_delay = 0.0
+    # Not overloaded any more, but shedding stays until it lasts
+    controller.evaluate()
+    assert not controller.overloaded
+    assert controller.shed_below == CRITICAL
+
+    controller.evaluate()
+    assert controller.shed_below == NORMAL
+    controller.evaluate()
+    assert controller.shed_below == LOW
+    controller.evaluate()
+    assert controller.shed_below == LOW
+
+
+def test_recovery_waits_for_the_adjust_interval(render_pool):
+    controller = make_controller(adjust_interval=60)
+    controller.loop_delay = 0.1
+    controller.evaluate()
+
+    controller.loop_delay = 0.0
+    controller.evaluate()
+    controller.evaluate()
+
+    assert controller.shed_below == NORMAL
+
+
+def test_class_latency_over_target_is_overload(render_pool):
+    controller = make_controller()
+    render = controller.classes["render"]
+    controller.record(render, latency=2.0, delay=0.0)
+    controller.record(render, latency=1.0, delay=0.0)
+
+    controller.evaluate()
+
+    assert render.latency == 1.5
+    assert render.window_count == 0
+    assert controller.overloaded
+
+
+def test_class_queueing_delay_over_target_is_overload(render_pool):
+    controller = make_controller()
+    render = controller.classes["render"]
+    controller.record(render, latency=0.2, delay=0.1)
+
+    controller.evaluate()
+
+    assert render.queueing_delay == 0.1
+    assert controller.overloaded
+
+
+def test_latency_of_idle_class_is_not_overload(render_pool):
+    controller = make_controller()
+    listing = controller.classes["listing"]
+    controller.record(listing, latency=5.0, delay=0.0)
+    controller.evaluate()
+    assert controller.overloaded
+
+    # Shed, so nothing completes: its last average no longer counts
+    controller.evaluate()
+    assert not controller.overloaded
+    assert listing.latency == 5.0
+
+
+def test_saturated_render_pool_is_overload(render_pool):
+    controller = make_controller()
+    render_pool.is_saturated = True
+
+    controller.evaluate()
+
+    assert controller.overloaded
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    controller = make_controller({"render": 1}, max_queue_delay=0.01)
+    monkeypatch.setattr(admission_middleware, "admission_controller", controller)
+    monkeypatch.setattr(settings, "ADMISSION_CONTROL_ENABLED", True)
+    return controller
+
+
+def call(app, query_string=b""):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "query_string": query_string}
+    asyncio.run(app(scope, receive, send))
+    return messages
+
+
+async def ok_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+
+def test_admission_control_records_latency(controller):
+    render = controller.classes["render"]
+
+    messages = call(AdmissionControl(ok_app, render))
+
+    assert messages[0]["status"] == 200
+    assert render.in_flight == 0
+    assert render.window_count == 1
+
+
+def test_admission_control_sheds_with_retry_after(controller):
+    render = controller.classes["render"]
+    controller.shed_below = CRITICAL
+
+    messages = call(AdmissionControl(ok_app, render))
+
+    assert messages[0]["status"] == 503
+    assert (
+        b"retry-after",
+        str(settings.ADMISSION_RETRY_AFTER_SECONDS).encode(),
+    ) in messages[0]["headers"]
+    assert render.shed == 1
+    assert render.window_count == 0
+
+
+def test_admission_control_releases_on_error(controller):
+    render = controller.classes["render"]
+
+    async def failing_app(scope, receive, send):
+        raise RuntimeError("endpoint failed")
+
+    with pytest.raises(RuntimeError):
+        call(AdmissionControl(failing_app, render))
+
+    assert render.in_flight == 0
+    # No response was started, there's no latency to record
+    assert render.window_count == 0
+
+
+def test_admission_control_disabled(controller, monkeypatch):
+    monkeypatch.setattr(settings, "ADMISSION_CONTROL_ENABLED", False)
+    render = controller.classes["render"]
+    controller.shed_below = CRITICAL
+
+    messages = call(AdmissionControl(ok_app, render))
+
+    assert messages[0]["status"] == 200
+    assert render.admitted == 0
+
+
+def test_derivative_requests_are_admitted_as_renders(controller):
+    fetch, render = controller.classes["fetch"], controller.classes["render"]
+    app = AdmissionControl(ok_app, fetch, render)
+    controller.shed_below = CRITICAL
+
+    # Plain fetches are critical, derivatives are shed with renders
+    assert call(app)[0]["status"] == 200
+    assert call(app, b"utm_source=print")[0]["status"] == 200
+    assert call(app, b"scale=8&format=png")[0]["status"] == 503
+    assert call(app, b"dark=%23000")[0]["status"] == 503
+
+    assert (fetch.admitted, fetch.shed) == (2, 0)
+    assert (render.admitted, render.shed) == (0, 2)
+
+
+def test_admission_route_classes_derivatives(controller):
+    async def endpoint():
+        pass
+
+    fetch = AdmissionRoute("/qrcode/{name}", endpoint, name="fetch_qrcode_file")
+    listing = AdmissionRoute("/qrcodes", endpoint, name="get_qrcodes")
+    liveness = AdmissionRoute("/health/live", endpoint, name="liveness")
+
+    assert fetch.app.route_class is controller.classes["fetch"]
+    assert fetch.app.derivative_class is controller.classes["render"]
+    assert listing.app.route_class is controller.classes["listing"]
+    assert listing.app.derivative_class is None
+    assert not isinstance(liveness.app, AdmissionControl)
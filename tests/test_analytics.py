@@ -0,0 +1,109 @@
+import asyncio
+
+import pytest
+
+from qrcode_api.app.core.analytics import HitBuffer
+from qrcode_api.app.core.config import settings
+
+
+@pytest.fixture(autouse=True)
+def analytics(monkeypatch):
+    monkeypatch.setattr(settings, "ANALYTICS_ENABLED", True)
+
+
+class Writes:
+    def __init__(self, fail: bool = False, delay: float = 0) -> None:
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+        self.written = []
+
+    async def __call__(self, counters):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.fail:
+            raise ConnectionError("connection lost")
+        self.written.append(counters)
+
+
+def make_buffer(writes: Writes, flush_interval: float = 60) -> HitBuffer:
+    buffer = HitBuffer(flush_interval=flush_interval, max_keys=2)
+    buffer._write = writes
+    return buffer
+
+
+async def record_hits(buffer: HitBuffer, count: int) -> None:
+    for i in range(count):
+        buffer.record(f"{i}.png", "fetch")
+        await asyncio.sleep(0)
+
+
+def test_full_buffer_flushes():
+    writes = Writes()
+    buffer = make_buffer(writes)
+
+    async def main():
+        await record_hits(buffer, 2)
+        await buffer._flush_task
+
+    asyncio.run(main())
+
+    assert writes.calls == 1
+    assert sum(writes.written[0].values()) == 2
+    assert not buffer._counters
+
+
+def test_single_flush_in_flight():
+    writes = Writes(delay=0.05)
+    buffer = make_buffer(writes)
+
+    async def main():
+        await record_hits(buffer, 2)
+        flush_task = buffer._flush_task
+        await record_hits(buffer, 10)
+        assert buffer._flush_task is flush_task
+        await flush_task
+
+    asyncio.run(main())
+
+    assert writes.calls == 1
+
+
+def test_failed_flush_backs_off():
+    writes = Writes(fail=True)
+    buffer = make_buffer(writes, flush_interval=0.05)
+
+    async def main():
+        await record_hits(buffer, 2)
+        await buffer._flush_task
+        # Every hit would retry against a down database otherwise
+        await record_hits(buffer, 100)
+        assert writes.calls == 1
+
+        await asyncio.sleep(0.06)
+        writes.fail = False
+        await record_hits(buffer, 1)
+        await buffer._flush_task
+
+    asyncio.run(main())
+
+    assert writes.calls == 2
+    # The counts of the failed flush were kept
+    assert sum(writes.written[0].values()) == 103
+    assert buffer._retry_at == 0.0
+
+
+def test_periodic_flush_retries_during_back_off():
+    writes = Writes(fail=True)
+    buffer = make_buffer(writes)
+
+    async def main():
+        await record_hits(buffer, 2)
+        await buffer._flush_task
+        writes.fail = False
+        await buffer.flush()
+
+    asyncio.run(main())
+
+    assert writes.calls == 2
+    assert not buffer._counters
@@ -0,0 +1,309 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError
+
+from qrcode_api.app.core import idempotency
+from qrcode_api.app.core.idempotency import IdempotencyStore
+
+KEY = "user:key"
+
+
+class Field:
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __eq__(self, value):
+        return self.name, value
+
+    __hash__ = object.__hash__
+
+
+class FakeQuery:
+    def __init__(self, records: dict, conditions: tuple) -> None:
+        self.records = records
+        self.conditions = conditions
+
+    def _matching(self):
+        return [
+            record
+            for record in self.records.values()
+            if all(getattr(record, name) == value for name, value in self.conditions)
+        ]
+
+    async def update(self, operator):
+        for record in self._matching():
+            for field, value in operator.query["$set"].items():
+                setattr(record, field.name, value)
+
+    async def delete(self):
+        for record in self._matching():
+            del self.records[record.key]
+
+
+class FakeRecord:
+    """'idempotency_records' with its unique key index, in memory."""
+
+    records: dict[str, "FakeRecord"] = {}
+    key = Field("key")
+    response = Field("response")
+
+    def __init__(self, key, fingerprint, expires_at, response=None, created_at=None):
+        self.key = key
+        self.fingerprint = fingerprint
+        self.expires_at = expires_at
+        self.response = response
+        self.created_at = created_at or datetime.utcnow()
+
+    async def insert(self):
+        if self.key in self.records:
+            raise DuplicateKeyError("E11000 duplicate key", 11000)
+        self.records[self.key] = self
+        return self
+
+    @classmethod
+    async def find_one(cls, condition):
+        _, key = condition
+        return cls.records.get(key)
+
+    @classmethod
+    def find(cls, *conditions):
+        return FakeQuery(cls.records, conditions)
+
+
+@pytest.fixture(autouse=True)
+def records(monkeypatch):
+    monkeypatch.setattr(FakeRecord, "records", {})
+    monkeypatch.setattr(idempotency, "IdempotencyRecord", FakeRecord)
+    return FakeRecord.records
+
+
+def make_store(wait: float = 1, lock_timeout: float = 30) -> IdempotencyStore:
+    return IdempotencyStore(ttl=60, cache_size=10, wait=wait, lock_timeout=lock_timeout)
+
+
+def in_progress_record(fingerprint="fingerprint", age: float = 0) -> FakeRecord:
+    """Claimed by a request on another worker ``age`` seconds ago."""
+    return FakeRecord(
+        KEY,
+        fingerprint,
+        expires_at=datetime.utcnow() + timedelta(seconds=60),
+        created_at=datetime.utcnow() - timedelta(seconds=age),
+    )
+
+
+class Creation:
+    def __init__(self, delay: float = 0, error: Exception | None = None) -> None:
+        self.delay = delay
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        return {"id": self.calls}
+
+
+def test_first_request_runs_and_retries_are_replayed(records):
+    store = make_store()
+    create = Creation()
+
+    async def main():
+        first = await store.run(KEY, "fingerprint", create)
+        second = await store.run(KEY, "fingerprint", create)
+        return first, second
+
+    assert asyncio.run(main()) == (({"id": 1}, False), ({"id": 1}, True))
+    assert create.calls == 1
+    assert records[KEY].response == {"id": 1}
+
+
+def test_stored_response_is_replayed_by_other_workers(records):
+    create = Creation()
+    asyncio.run(make_store().run(KEY, "fingerprint", create))
+
+    # A fresh store has an empty cache, like another worker
+    response = asyncio.run(make_store().run(KEY, "fingerprint", create))
+
+    assert response == ({"id": 1}, True)
+    assert create.calls == 1
+
+
+def test_key_reused_for_another_request():
+    store = make_store()
+    asyncio.run(store.run(KEY, "fingerprint", Creation()))
+
+    with pytest.raises(HTTPException) as cached:
+        asyncio.run(store.run(KEY, "other", Creation()))
+    with pytest.raises(HTTPException) as stored:
+        asyncio.run(make_store().run(KEY, "other", Creation()))
+
+    assert cached.value.status_code == 422
+    assert stored.value.status_code == 422
+
+
+def test_key_reused_while_in_flight():
+    store = make_store()
+
+    async def main():
+        first = asyncio.create_task(store.run(KEY, "fingerprint", Creation(0.05)))
+        await asyncio.sleep(0)
+        with pytest.raises(HTTPException) as error:
+            await store.run(KEY, "other", Creation())
+        await first
+        return error.value
+
+    assert asyncio.run(main()).status_code == 422
+
+
+def test_concurrent_duplicates_wait_for_the_first():
+    store = make_store()
+    create = Creation(delay=0.05)
+
+    async def main():
+        return await asyncio.gather(
+            *[store.run(KEY, "fingerprint", create) for _ in range(3)]
+        )
+
+    results = asyncio.run(main())
+
+    assert create.calls == 1
+    assert results == [({"id": 1}, False), ({"id": 1}, True), ({"id": 1}, True)]
+
+
+def test_failure_releases_the_key(records):
+    store = make_store()
+    failing = Creation(delay=0.05, error=RuntimeError("creation failed"))
+
+    async def main():
+        return await asyncio.gather(
+            store.run(KEY, "fingerprint", failing),
+            store.run(KEY, "fingerprint", failing),
+            return_exceptions=True,
+        )
+
+    results = asyncio.run(main())
+
+    assert failing.calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert records == {}
+
+    # Nothing left behind, the retry runs
+    create = Creation()
+    assert asyncio.run(store.run(KEY, "fingerprint", create)) == ({"id": 1}, False)
+
+
+def test_duplicate_takes_over_a_cancelled_request(records):
+    store = make_store()
+    create = Creation(delay=0.05)
+
+    async def main():
+        first = asyncio.create_task(store.run(KEY, "fingerprint", create))
+        second = asyncio.create_task(store.run(KEY, "fingerprint", create))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == ({"id": 2}, False)
+    assert create.calls == 2
+    assert records[KEY].response == {"id": 2}
+
+
+def test_cancelled_duplicate_leaves_the_first_running():
+    store = make_store()
+    create = Creation(delay=0.05)
+
+    async def main():
+        first = asyncio.create_task(store.run(KEY, "fingerprint", create))
+        second = asyncio.create_task(store.run(KEY, "fingerprint", create))
+        await asyncio.sleep(0.01)
+        second.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await second
+        return await first
+
+    assert asyncio.run(main()) == ({"id": 1}, False)
+    assert create.calls == 1
+
+
+def test_waits_for_a_request_on_another_worker(records):
+    records[KEY] = in_progress_record()
+    create = Creation()
+
+    async def complete_elsewhere():
+        await asyncio.sleep(0.1)
+        records[KEY].response = {"id": "elsewhere"}
+
+    async def main():
+        asyncio.create_task(complete_elsewhere())
+        return await make_store().run(KEY, "fingerprint", create)
+
+    assert asyncio.run(main()) == ({"id": "elsewhere"}, True)
+    assert create.calls == 0
+
+
+def test_request_on_another_worker_still_in_progress(records):
+    records[KEY] = in_progress_record()
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(make_store(wait=0.1).run(KEY, "fingerprint", Creation()))
+
+    assert error.value.status_code == 409
+    # Still claimed by the other worker
+    assert records[KEY].response is None
+
+
+def test_claims_the_key_once_the_other_worker_fails(records):
+    records[KEY] = in_progress_record()
+    create = Creation()
+
+    async def fail_elsewhere():
+        await asyncio.sleep(0.1)
+        del records[KEY]
+
+    async def main():
+        asyncio.create_task(fail_elsewhere())
+        return await make_store().run(KEY, "fingerprint", create)
+
+    assert asyncio.run(main()) == ({"id": 1}, False)
+    assert records[KEY].response == {"id": 1}
+
+
+def test_takes_over_a_stale_in_progress_record(records):
+    stale = in_progress_record(age=60)
+    records[KEY] = stale
+    create = Creation()
+
+    response = asyncio.run(make_store(lock_timeout=30).run(KEY, "fingerprint", create))
+
+    assert response == ({"id": 1}, False)
+    assert records[KEY] is not stale
+    assert records[KEY].response == {"id": 1}
+
+
+def test_stale_record_of_another_request_is_not_taken_over(records):
+    records[KEY] = in_progress_record(fingerprint="other", age=60)
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(make_store(lock_timeout=30).run(KEY, "fingerprint", Creation()))
+
+    assert error.value.status_code == 422
+    assert records[KEY].fingerprint == "other"
+
+
+def test_old_completed_record_is_replayed_not_taken_over(records):
+    record = in_progress_record(age=60)
+    record.response = {"id": "first"}
+    records[KEY] = record
+    create = Creation()
+
+    response = asyncio.run(make_store(lock_timeout=30).run(KEY, "fingerprint", create))
+
+    assert response == ({"id": "first"}, True)
+    assert create.calls == 0
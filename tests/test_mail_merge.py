@@ -0,0 +1,249 @@
+import asyncio
+import csv
+import io
+import os
+import threading
+import uuid
+
+import pytest
+
+from qrcode_api.app.utils.files import qrcode_file_path, variant_paths
+from qrcode_api.app.utils.mail_merge import (
+    CSVRecords,
+    MailMergeError,
+    MergeResult,
+    run_mail_merge,
+)
+
+SAMPLE = (
+    "\ufefflabel,data,note\r\n"
+    "plain,https://example.com,\r\n"
+    '"quoted, comma","say ""hi""",x\r\n'
+    "\r\n"
+    '"multi\nline","over\r\nthree\nlines",y\n'
+    "ünïcødé,日本語,z\n"
+    '"",,"trailing"'
+)
+
+
+def expected_rows(text: str) -> list[list[str]]:
+    return [row for row in csv.reader(io.StringIO(text.lstrip("\ufeff"))) if row]
+
+
+def feed_in_chunks(data: bytes, size: int, max_record_bytes: int = 1000):
+    records = CSVRecords(max_record_bytes)
+    rows = []
+    for start in range(0, len(data), size):
+        rows.extend(records.feed(data[start : start + size]))
+    rows.extend(records.feed(b"", final=True))
+    return rows
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, 10_000])
+def test_rows_do_not_depend_on_chunk_boundaries(size):
+    rows = feed_in_chunks(SAMPLE.encode(), size)
+
+    assert rows == expected_rows(SAMPLE)
+    assert rows[0] == ["label", "data", "note"]
+    assert rows[3] == ["multi\nline", "over\r\nthree\nlines", "y"]
+
+
+def test_rows_are_returned_once_complete():
+    records = CSVRecords(1000)
+
+    assert records.feed(b"a,b\nc,") == [["a", "b"]]
+    assert records.feed(b'"open\n') == []
+    assert records.feed(b'still open",d\n') == [["c", "open\nstill open", "d"]]
+    # The last line has no line break, it's only complete at the end
+    assert records.feed(b"e,f") == []
+    assert records.feed(b"", final=True) == [["e", "f"]]
+
+
+def test_blank_lines_are_skipped():
+    assert feed_in_chunks(b"\n\na\n\r\n\nb\n\n", 3) == [["a"], ["b"]]
+
+
+def test_empty_upload():
+    assert feed_in_chunks(b"", 1) == []
+    assert feed_in_chunks(b"\xef\xbb\xbf", 1) == []
+
+
+def test_record_limit():
+    records = CSVRecords(10)
+    assert records.feed(b"0123456789\n") == [["0123456789"]]
+
+    with pytest.raises(MailMergeError, match="limited to 10 characters"):
+        records.feed(b"01234567890")
+
+
+def test_record_limit_spans_the_lines_of_a_quoted_field():
+    records = CSVRecords(20)
+    records.feed(b'"0123456789\n')
+
+    with pytest.raises(MailMergeError, match="limited to 20 characters"):
+        records.feed(b"0123456789\n")
+
+
+def test_record_limit_applies_per_record():
+    # Many short records in one chunk are fine
+    rows = feed_in_chunks(b"abcd\n" * 100, 500, max_record_bytes=10)
+
+    assert rows == [["abcd"]] * 100
+
+
+def test_unterminated_quoted_field():
+    records = CSVRecords(1000)
+    records.feed(b'a,"b\nc\n')
+
+    with pytest.raises(MailMergeError, match="ends in a quoted field"):
+        records.feed(b"", final=True)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3])
+def test_multibyte_characters_split_across_chunks(size):
+    assert feed_in_chunks("é,日本\n".encode(), size) == [["é", "日本"]]
+
+
+def test_invalid_utf8():
+    records = CSVRecords(1000)
+
+    with pytest.raises(MailMergeError, match="UTF-8"):
+        records.feed("é,ü\n".encode("latin-1"))
+
+
+def test_truncated_utf8_at_the_end():
+    records = CSVRecords(1000)
+    records.feed("a,é".encode()[:-1])
+
+    with pytest.raises(MailMergeError, match="UTF-8"):
+        records.feed(b"", final=True)
+
+
+class FakeOutput:
+    def __init__(self) -> None:
+        self.results: list[MergeResult] = []
+        self.error = None
+
+    def add(self, result: MergeResult) -> None:
+        self.results.append(result)
+
+    async def drain(self) -> None:
+        pass
+
+    async def finish(self, error: str | None) -> None:
+        self.error = error
+
+
+class Merge:
+    """Renders each row into a stored file (and a variant) in a thread."""
+
+    def __init__(self, fail_store: bool = False) -> None:
+        self.fail_store = fail_store
+        self.stored: list[str] = []
+        self.rendering = threading.Event()
+        self.release = threading.Event()
+        self.release.set()
+
+    def render(self, file_name: str) -> None:
+        self.rendering.set()
+        self.release.wait(5)
+        path = qrcode_file_path(file_name)
+        for candidate in [path, *variant_paths(path)]:
+            with open(candidate, "wb") as file:
+                file.write(b"qrcode")
+
+    async def render_row(self, row_number: int, row: list[str]) -> MergeResult:
+        file_name = f"{uuid.uuid4().hex}.png"
+        await asyncio.to_thread(self.render, file_name)
+        return MergeResult(row=row_number, qrcode_file=file_name, document=file_name)
+
+    async def store(self, documents: list[str]) -> None:
+        if self.fail_store:
+            raise ConnectionError("connection lost")
+        self.stored.extend(documents)
+
+    def run(self, rows, output, **options):
+        options = {"concurrency": 4, "batch_size": 2, "max_rows": 100, **options}
+        return run_mail_merge(rows, self.render_row, self.store, output, **options)
+
+
+async def iterate(rows):
+    for row in rows:
+        yield row
+
+
+def stored_paths(file_name: str) -> list[str]:
+    path = qrcode_file_path(file_name)
+    return [path, *variant_paths(path)]
+
+
+def test_merge_stores_every_row():
+    merge = Merge()
+    output = FakeOutput()
+
+    asyncio.run(merge.run(iterate([["a"]] * 5), output))
+
+    assert [result.row for result in output.results] == [1, 2, 3, 4, 5]
+    assert merge.stored == [result.qrcode_file for result in output.results]
+    assert output.error is None
+
+
+def test_failed_store_removes_the_rendered_files():
+    merge = Merge(fail_store=True)
+    output = FakeOutput()
+    file_names = []
+    render_row = merge.render_row
+
+    async def tracked_render_row(row_number, row):
+        result = await render_row(row_number, row)
+        file_names.append(result.qrcode_file)
+        return result
+
+    merge.render_row = tracked_render_row
+    asyncio.run(merge.run(iterate([["a"]] * 3), output))
+
+    assert len(file_names) == 3
+    for file_name in file_names:
+        assert not any(map(os.path.exists, stored_paths(file_name)))
+    for result in output.results:
+        assert result.qrcode_file is None
+        assert result.error == "The QR Code could not be stored"
+
+
+@pytest.mark.parametrize("concurrency", [1, 4])
+@pytest.mark.parametrize("fail_store", [False, True])
+def test_client_gone_leaves_no_file_behind(fail_store, concurrency):
+    merge = Merge(fail_store=fail_store)
+    output = FakeOutput()
+    file_names = []
+    render_row = merge.render_row
+
+    async def tracked_render_row(row_number, row):
+        result = await render_row(row_number, row)
+        file_names.append(result.qrcode_file)
+        return result
+
+    merge.render_row = tracked_render_row
+
+    async def main():
+        merge.release.clear()
+        task = asyncio.create_task(
+            merge.run(iterate([["a"]] * 2), output, concurrency=concurrency)
+        )
+        await asyncio.to_thread(merge.rendering.wait, 5)
+        task.cancel()
+        # The renders finish after the cancellation
+        await asyncio.sleep(0.05)
+        merge.release.set()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(main())
+
+    # Cancelled while reading the rows (1) or completing the renders (4)
+    assert len(file_names) == (1 if concurrency == 1 else 2)
+    assert output.results == []
+    for file_name in file_names:
+        stored = file_name in merge.stored
+        assert stored != fail_store
+        assert all(os.path.exists(path) == stored for path in stored_paths(file_name))
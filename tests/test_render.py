@@ -0,0 +1,257 @@
+import asyncio
+import os
+import threading
+
+import pytest
+
+from qrcode_api.app.core.render import RenderCoalescer, RenderPool
+
+KEY = "0123abcd" + "0" * 56
+# Same stripe as KEY: 0x0123abcd + 1024 * 16
+OTHER_KEY_SAME_STRIPE = "0123ebcd" + "0" * 56
+
+
+@pytest.fixture
+def pool():
+    pool = RenderPool(size=4, max_pending=16)
+    yield pool
+    pool.shutdown()
+
+
+class Renderer:
+    """Writes ``path`` and counts its calls, optionally held until released."""
+
+    def __init__(self, content: bytes = b"qrcode", fail: bool = False) -> None:
+        self.content = content
+        self.fail = fail
+        self.calls = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def __call__(self, path: str):
+        def render() -> None:
+            self.calls += 1
+            self.release.wait(5)
+            if self.fail:
+                raise RuntimeError("render failed")
+            with open(path, "wb") as file:
+                file.write(self.content)
+
+        return render
+
+
+def test_concurrent_renders_are_coalesced(pool, tmp_path):
+    coalescer = RenderCoalescer(pool, lock_dir=None, window=5)
+    renderer = Renderer()
+    paths = [str(tmp_path / f"{i}.png") for i in range(5)]
+
+    async def main():
+        renderer.release.clear()
+        renders = [coalescer.render(KEY, path, renderer(path)) for path in paths]
+        gathered = asyncio.gather(*renders)
+        await asyncio.sleep(0.05)
+        renderer.release.set()
+        await gathered
+
+    asyncio.run(main())
+
+    assert renderer.calls == 1
+    assert coalescer.coalesced == 4
+    assert coalescer.stats()["in_flight"] == 0
+    for path in paths:
+        with open(path, "rb") as file:
+            assert file.read() == b"qrcode"
+    # Hard links to the first caller's file
+    assert len({os.stat(path).st_ino for path in paths}) == 1
+
+
+def test_different_keys_render_separately(pool, tmp_path):
+    coalescer = RenderCoalescer(pool, lock_dir=None, window=5)
+    renderer = Renderer()
+    first, second = str(tmp_path / "first.png"), str(tmp_path / "second.png")
+
+    async def main():
+        await asyncio.gather(
+            coalescer.render(KEY, first, renderer(first)),
+            coalescer.render(OTHER_KEY_SAME_STRIPE, second, renderer(second)),
+        )
+
+    asyncio.run(main())
+
+    assert renderer.calls == 2
+    assert coalescer.coalesced == 0
+
+
+def test_failure_reaches_every_waiter_and_is_retried(pool, tmp_path):
+    coalescer = RenderCoalescer(pool, lock_dir=None, window=5)
+    renderer = Renderer(fail=True)
+    paths = [str(tmp_path / f"{i}.png") for i in range(3)]
+
+    async def main():
+        renderer.release.clear()
+        gathered = asyncio.gather(
+            *[coalescer.render(KEY, path, renderer(path)) for path in paths],
+            return_exceptions=True,
+        )
+        await asyncio.sleep(0.05)
+        renderer.release.set()
+        return await gathered
+
+    results = asyncio.run(main())
+
+    assert renderer.calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert not any(os.path.exists(path) for path in paths)
+
+    # The failed render isn't kept around
+    renderer.fail = False
+    asyncio.run(coalescer.render(KEY, paths[0], renderer(paths[0])))
+    assert renderer.calls == 2
+    assert os.path.isfile(paths[0])
+
+
+def test_cancelled_waiter_does_not_cancel_the_render(pool, tmp_path):
+    coalescer = RenderCoalescer(pool, lock_dir=None, window=5)
+    renderer = Renderer()
+    first, second = str(tmp_path / "first.png"), str(tmp_path / "second.png")
+
+    async def main():
+        renderer.release.clear()
+        leader = asyncio.create_task(coalescer.render(KEY, first, renderer(first)))
+        follower = asyncio.create_task(coalescer.render(KEY, second, renderer(second)))
+        await asyncio.sleep(0.05)
+        leader.cancel()
+        renderer.release.set()
+        await follower
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+
+    asyncio.run(main())
+
+    assert renderer.calls == 1
+    assert os.path.isfile(first)
+    assert os.path.isfile(second)
+
+
+def test_lock_dir_reuses_recent_render(pool, tmp_path):
+    lock_dir = str(tmp_path / "locks")
+    renderer = Renderer()
+    first, second = str(tmp_path / "first.png"), str(tmp_path / "second.png")
+
+    # Separate coalescers stand for separate workers sharing the lock dir
+    asyncio.run(
+        RenderCoalescer(pool, lock_dir, window=60).render(KEY, first, renderer(first))
+    )
+    asyncio.run(
+        RenderCoalescer(pool, lock_dir, window=60).render(KEY, second, renderer(second))
+    )
+
+    assert renderer.calls == 1
+    assert os.stat(first).st_ino == os.stat(second).st_ino
+    stripe = int(KEY[:8], 16) % RenderCoalescer.lock_stripes
+    assert os.listdir(lock_dir) == [f"{stripe}.lock"]
+
+
+def test_lock_dir_renders_again_after_the_window(pool, tmp_path):
+    lock_dir = str(tmp_path / "locks")
+    renderer = Renderer()
+    first, second = str(tmp_path / "first.png"), str(tmp_path / "second.png")
+
+    coalescer = RenderCoalescer(pool, lock_dir, window=0)
+    asyncio.run(coalescer.render(KEY, first, renderer(first)))
+    asyncio.run(coalescer.render(KEY, second, renderer(second)))
+
+    assert renderer.calls == 2
+    assert os.stat(first).st_ino != os.stat(second).st_ino
+
+
+def test_lock_dir_renders_again_when_the_file_is_gone(pool, tmp_path):
+    lock_dir = str(tmp_path / "locks")
+    renderer = Renderer()
+    first, second = str(tmp_path / "first.png"), str(tmp_path / "second.png")
+
+    coalescer = RenderCoalescer(pool, lock_dir, window=60)
+    asyncio.run(coalescer.render(KEY, first, renderer(first)))
+    os.remove(first)
+    asyncio.run(coalescer.render(KEY, second, renderer(second)))
+
+    assert renderer.calls == 2
+    assert os.path.isfile(second)
+
+
+def test_lock_dir_stripe_collision(pool, tmp_path):
+    lock_dir = str(tmp_path / "locks")
+    coalescer = RenderCoalescer(pool, lock_dir, window=60)
+    renderer = Renderer()
+    paths = [str(tmp_path / f"{i}.png") for i in range(3)]
+
+    async def main():
+        await coalescer.render(KEY, paths[0], renderer(paths[0]))
+        # Replaces the stripe's marker, the other key isn't reused
+        await coalescer.render(OTHER_KEY_SAME_STRIPE, paths[1], renderer(paths[1]))
+        await coalescer.render(KEY, paths[2], renderer(paths[2]))
+
+    asyncio.run(main())
+
+    assert len(os.listdir(lock_dir)) == 1
+    assert renderer.calls == 3
+
+
+def test_lock_dir_serializes_renders_of_a_stripe(pool, tmp_path):
+    lock_dir = str(tmp_path / "locks")
+    running = 0
+    overlapped = False
+    lock = threading.Lock()
+
+    def renderer(path):
+        def render():
+            nonlocal running, overlapped
+            with lock:
+                running += 1
+                overlapped = overlapped or running > 1
+            threading.Event().wait(0.05)
+            with open(path, "wb") as file:
+                file.write(b"qrcode")
+            with lock:
+                running -= 1
+
+        return render
+
+    first, second = str(tmp_path / "first.png"), str(tmp_path / "second.png")
+
+    async def main():
+        # Different coalescers, so the in-process single-flight doesn't apply
+        await asyncio.gather(
+            RenderCoalescer(pool, lock_dir, window=0).render(
+                KEY, first, renderer(first)
+            ),
+            RenderCoalescer(pool, lock_dir, window=0).render(
+                OTHER_KEY_SAME_STRIPE, second, renderer(second)
+            ),
+        )
+
+    asyncio.run(main())
+
+    assert not overlapped
+    assert os.path.isfile(first)
+    assert os.path.isfile(second)
+
+
+def test_render_pool_accounting(pool):
+    release = threading.Event()
+
+    async def main():
+        tasks = [
+            asyncio.create_task(pool.run(release.wait, 5)) for _ in range(pool.size + 2)
+        ]
+        await asyncio.sleep(0.05)
+        stats = pool.stats()
+        release.set()
+        await asyncio.gather(*tasks)
+        return stats
+
+    stats = asyncio.run(main())
+
+    assert stats["in_flight"] == pool.size + 2
+    assert stats["pending"] == 2
+    assert pool.in_flight == 0
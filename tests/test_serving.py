@@ -0,0 +1,312 @@
+import asyncio
+import os
+
+import pytest
+from starlette.datastructures import Headers
+
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.utils.serving import (
+    RangeNotSatisfiable,
+    StaticFileResponse,
+    build_bytes_response,
+    build_file_response,
+    is_not_modified,
+    make_etag,
+    parse_range,
+    resolve_static_file,
+)
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def stored_file():
+    path = os.path.join(settings.STATIC_PATH, "0123abcd.png")
+    with open(path, "wb") as file:
+        file.write(CONTENT)
+    yield path, os.stat(path)
+    os.remove(path)
+
+
+@pytest.fixture(autouse=True)
+def app_serving(monkeypatch):
+    monkeypatch.setattr(settings, "FILE_SERVING_MODE", "app")
+
+
+def send_response(response, method="GET", extensions=None):
+    """Status, headers and body the response sends over ASGI."""
+    messages = []
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method, "extensions": extensions or {}}
+    asyncio.run(response(scope, receive, send))
+
+    start, *rest = messages
+    headers = Headers(raw=start["headers"])
+    return start["status"], headers, b"".join(m.get("body", b"") for m in rest)
+
+
+@pytest.mark.parametrize(
+    "header, expected",
+    [
+        ("bytes=0-9", (0, 10)),
+        ("bytes=10-", (10, 90)),
+        ("bytes=-10", (90, 10)),
+        # Past the end is clipped to the size
+        ("bytes=95-200", (95, 5)),
+        ("bytes=-500", (0, 100)),
+        ("bytes=99-99", (99, 1)),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(Headers({"range": header}), '"tag"', 100) == expected
+
+
+@pytest.mark.parametrize(
+    "header",
+    ["bytes=0-1,5-6", "bytes=-", "items=0-1", "bytes=a-b", "bytes 0-1"],
+)
+def test_parse_range_falls_back_to_whole_file(header):
+    assert parse_range(Headers({"range": header}), '"tag"', 100) is None
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=150-160", "bytes=-0"])
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(Headers({"range": header}), '"tag"', 100)
+
+
+def test_parse_range_inverted_range_not_satisfiable():
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(Headers({"range": "bytes=9-3"}), '"tag"', 100)
+
+
+def test_parse_range_empty_file_not_satisfiable():
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(Headers({"range": "bytes=0-"}), '"tag"', 0)
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(Headers({"range": "bytes=-5"}), '"tag"', 0)
+
+
+def test_parse_range_if_range():
+    headers = {"range": "bytes=0-9", "if-range": '"tag"'}
+    assert parse_range(Headers(headers), '"tag"', 100) == (0, 10)
+
+    headers["if-range"] = '"stale"'
+    assert parse_range(Headers(headers), '"tag"', 100) is None
+
+    # A date never matches, strong ETags are the only validator compared
+    headers["if-range"] = "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert parse_range(Headers(headers), '"tag"', 100) is None
+
+
+def test_is_not_modified_if_none_match(stored_file):
+    _, stat_result = stored_file
+    etag = make_etag(stat_result)
+
+    assert is_not_modified(Headers({"if-none-match": etag}), etag, stat_result)
+    assert is_not_modified(Headers({"if-none-match": f"W/{etag}"}), etag, stat_result)
+    assert is_not_modified(
+        Headers({"if-none-match": f'"other", {etag}'}), etag, stat_result
+    )
+    assert is_not_modified(Headers({"if-none-match": "*"}), etag, stat_result)
+    assert not is_not_modified(Headers({"if-none-match": '"other"'}), etag, stat_result)
+    assert not is_not_modified(Headers(), etag, stat_result)
+
+
+def test_is_not_modified_if_modified_since(stored_file):
+    _, stat_result = stored_file
+    etag = make_etag(stat_result)
+
+    assert is_not_modified(
+        Headers({"if-modified-since": "Fri, 01 Jan 2100 00:00:00 GMT"}),
+        etag,
+        stat_result,
+    )
+    assert not is_not_modified(
+        Headers({"if-modified-since": "Thu, 01 Jan 1970 00:00:00 GMT"}),
+        etag,
+        stat_result,
+    )
+    assert not is_not_modified(
+        Headers({"if-modified-since": "not a date"}), etag, stat_result
+    )
+    # If-None-Match takes precedence
+    assert not is_not_modified(
+        Headers(
+            {
+                "if-none-match": '"other"',
+                "if-modified-since": "Fri, 01 Jan 2100 00:00:00 GMT",
+            }
+        ),
+        etag,
+        stat_result,
+    )
+
+
+def test_make_etag_depends_on_encoding(stored_file):
+    _, stat_result = stored_file
+    assert make_etag(stat_result) != make_etag(stat_result, "br")
+
+
+@pytest.mark.parametrize(
+    "file_name", ["../etc/passwd", "..", "a/b.png", "noextension", ".png", ""]
+)
+def test_resolve_static_file_rejects_unsafe_names(file_name):
+    assert resolve_static_file(file_name) is None
+
+
+def test_resolve_static_file(stored_file):
+    path, _ = stored_file
+    assert resolve_static_file("0123abcd.png") == os.path.realpath(path)
+
+
+def test_build_file_response_whole_file(stored_file):
+    path, stat_result = stored_file
+    response = build_file_response(Headers(), path, stat_result, media_type="image/png")
+
+    status, headers, body = send_response(response)
+    assert status == 200
+    assert body == CONTENT
+    assert headers["content-length"] == str(len(CONTENT))
+    assert headers["etag"] == make_etag(stat_result)
+    assert headers["accept-ranges"] == "bytes"
+    assert "content-range" not in headers
+
+
+def test_build_file_response_range(stored_file):
+    path, stat_result = stored_file
+    response = build_file_response(
+        Headers({"range": "bytes=100-199"}), path, stat_result, media_type=None
+    )
+
+    status, headers, body = send_response(response)
+    assert status == 206
+    assert body == CONTENT[100:200]
+    assert headers["content-length"] == "100"
+    assert headers["content-range"] == f"bytes 100-199/{len(CONTENT)}"
+
+
+def test_build_file_response_streams_in_chunks(stored_file, monkeypatch):
+    path, stat_result = stored_file
+    monkeypatch.setattr(StaticFileResponse, "chunk_size", 7)
+    response = build_file_response(
+        Headers({"range": "bytes=-50"}), path, stat_result, media_type=None
+    )
+
+    status, _, body = send_response(response)
+    assert status == 206
+    assert body == CONTENT[-50:]
+
+
+def test_build_file_response_head(stored_file):
+    path, stat_result = stored_file
+    response = build_file_response(Headers(), path, stat_result, media_type=None)
+
+    status, headers, body = send_response(response, method="HEAD")
+    assert status == 200
+    assert body == b""
+    assert headers["content-length"] == str(len(CONTENT))
+
+
+def test_build_file_response_zerocopy(stored_file):
+    path, stat_result = stored_file
+    response = build_file_response(
+        Headers({"range": "bytes=10-19"}), path, stat_result, media_type=None
+    )
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {
+        "type": "http",
+        "method": "GET",
+        "extensions": {"http.response.zerocopysend": {}},
+    }
+    asyncio.run(response(scope, None, send))
+
+    assert messages[1]["type"] == "http.response.zerocopysend"
+    assert (messages[1]["offset"], messages[1]["count"]) == (10, 10)
+
+
+def test_build_file_response_not_modified(stored_file):
+    path, stat_result = stored_file
+    etag = make_etag(stat_result)
+    response = build_file_response(
+        Headers({"if-none-match": etag, "range": "bytes=0-9"}),
+        path,
+        stat_result,
+        media_type=None,
+    )
+
+    assert response.status_code == 304
+    assert response.body == b""
+    assert response.headers["etag"] == etag
+
+
+def test_build_file_response_range_not_satisfiable(stored_file):
+    path, stat_result = stored_file
+    response = build_file_response(
+        Headers({"range": f"bytes={len(CONTENT)}-"}),
+        path,
+        stat_result,
+        media_type=None,
+    )
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+def test_build_file_response_stale_if_range_sends_whole_file(stored_file):
+    path, stat_result = stored_file
+    response = build_file_response(
+        Headers({"range": "bytes=0-9", "if-range": '"stale"'}),
+        path,
+        stat_result,
+        media_type=None,
+    )
+
+    status, _, body = send_response(response)
+    assert status == 200
+    assert body == CONTENT
+
+
+def test_build_file_response_offloaded(stored_file, monkeypatch):
+    path, stat_result = stored_file
+    monkeypatch.setattr(settings, "FILE_SERVING_MODE", "x-accel-redirect")
+    monkeypatch.setattr(settings, "FILE_OFFLOAD_PREFIX", "/protected/")
+
+    response = build_file_response(
+        Headers({"range": "bytes=0-9"}), path, stat_result, media_type=None
+    )
+    assert response.status_code == 200
+    assert response.headers["x-accel-redirect"] == "/protected/0123abcd.png"
+
+    response = build_file_response(
+        Headers(), path, stat_result, media_type=None, offload=False
+    )
+    assert "x-accel-redirect" not in response.headers
+
+
+def test_build_bytes_response():
+    response = build_bytes_response(
+        Headers(), b"content", etag='"tag"', media_type="image/png"
+    )
+    assert response.status_code == 200
+    assert response.body == b"content"
+
+    for if_none_match in ('"tag"', 'W/"tag"', '"other", "tag"', "*"):
+        response = build_bytes_response(
+            Headers({"if-none-match": if_none_match}),
+            b"content",
+            etag='"tag"',
+            media_type="image/png",
+        )
+        assert response.status_code == 304
+        assert response.body == b""
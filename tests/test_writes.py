@@ -0,0 +1,264 @@
+import asyncio
+from contextvars import ContextVar
+from types import SimpleNamespace
+
+import pytest
+from pymongo import WriteConcern
+from pymongo.errors import BulkWriteError, DuplicateKeyError, WriteError
+
+from qrcode_api.app.core import writes
+from qrcode_api.app.core.config import settings
+from qrcode_api.app.core.writes import InsertBatcher, build_write_concern
+
+request_name: ContextVar[str | None] = ContextVar("request_name", default=None)
+
+
+class FakeCollection:
+    def __init__(self) -> None:
+        self.calls: list[list[dict]] = []
+        self.write_concern: WriteConcern | None = None
+        self.error: Exception | None = None
+        self.write_errors: list[dict] = []
+        # (loop time, request context) of each write
+        self.writes: list[tuple[float, str | None]] = []
+
+    def with_options(self, write_concern):
+        self.write_concern = write_concern
+        return self
+
+    async def insert_many(self, documents, ordered=True):
+        assert ordered is False
+        self.calls.append(documents)
+        self.writes.append((asyncio.get_running_loop().time(), request_name.get()))
+        if self.error is not None:
+            raise self.error
+        if self.write_errors:
+            raise BulkWriteError({"writeErrors": self.write_errors})
+
+
+class FakeDocument:
+    """Stands in for a Beanie document bound to a collection."""
+
+    collection = FakeCollection()
+
+    def __init__(self, name: str) -> None:
+        self.id = None
+        self.name = name
+        self.inserted = False
+
+    @classmethod
+    def get_settings(cls):
+        return SimpleNamespace(keep_nulls=True)
+
+    @classmethod
+    def get_motor_collection(cls):
+        return cls.collection
+
+    async def insert(self):
+        self.inserted = True
+        return self
+
+
+class OtherDocument(FakeDocument):
+    collection = FakeCollection()
+
+
+@pytest.fixture(autouse=True)
+def batching(monkeypatch):
+    monkeypatch.setattr(settings, "INSERT_BATCHING_ENABLED", True)
+    monkeypatch.setattr(
+        writes,
+        "get_dict",
+        lambda document, to_db, keep_nulls: {"_id": document.id, "name": document.name},
+    )
+    FakeDocument.collection = FakeCollection()
+    OtherDocument.collection = FakeCollection()
+
+
+def insert_all(batcher, *documents):
+    async def main():
+        return await asyncio.gather(
+            *[batcher.insert(document) for document in documents],
+            return_exceptions=True,
+        )
+
+    return asyncio.run(main())
+
+
+def test_inserts_within_the_window_share_one_write():
+    batcher = InsertBatcher(window=0.01, max_documents=100)
+    documents = [FakeDocument(str(i)) for i in range(5)]
+
+    results = insert_all(batcher, *documents)
+
+    assert results == documents
+    assert len(FakeDocument.collection.calls) == 1
+    assert [row["name"] for row in FakeDocument.collection.calls[0]] == list("01234")
+    # Ids are assigned before the write, so each caller knows its own
+    assert all(document.id is not None for document in documents)
+    assert len({document.id for document in documents}) == 5
+
+
+def test_max_documents_flushes_early():
+    batcher = InsertBatcher(window=10, max_documents=2)
+    documents = [FakeDocument(str(i)) for i in range(4)]
+
+    async def main():
+        # Would wait 10 seconds if the size limit didn't flush
+        return await asyncio.wait_for(
+            asyncio.gather(*[batcher.insert(document) for document in documents]), 1
+        )
+
+    assert asyncio.run(main()) == documents
+    assert [len(call) for call in FakeDocument.collection.calls] == [2, 2]
+
+
+def test_early_flush_cancels_the_window():
+    batcher = InsertBatcher(window=0.1, max_documents=2)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            batcher.insert(FakeDocument("a")), batcher.insert(FakeDocument("b"))
+        )
+        await asyncio.sleep(0.06)
+        started = loop.time()
+        await batcher.insert(FakeDocument("c"))
+        return started
+
+    started = asyncio.run(main())
+
+    # The next batch gets a full window, not the rest of the flushed one's
+    written_at, _ = FakeDocument.collection.writes[1]
+    assert written_at - started >= 0.09
+
+
+def test_write_runs_outside_the_request_context():
+    batcher = InsertBatcher(window=0.01, max_documents=100)
+
+    async def insert(name):
+        request_name.set(name)
+        return await batcher.insert(FakeDocument(name))
+
+    async def main():
+        await asyncio.gather(insert("first"), insert("second"))
+
+    asyncio.run(main())
+
+    assert [context for _, context in FakeDocument.collection.writes] == [None]
+
+
+def test_batches_are_per_document_class():
+    batcher = InsertBatcher(window=0.01, max_documents=100)
+
+    results = insert_all(batcher, FakeDocument("a"), OtherDocument("b"))
+
+    assert [result.name for result in results] == ["a", "b"]
+    assert len(FakeDocument.collection.calls) == 1
+    assert len(OtherDocument.collection.calls) == 1
+
+
+def test_write_errors_are_mapped_to_their_documents():
+    batcher = InsertBatcher(window=0.01, max_documents=100)
+    FakeDocument.collection.write_errors = [
+        {"index": 1, "code": 11000, "errmsg": "E11000 duplicate key"},
+        {"index": 3, "code": 121, "errmsg": "Document failed validation"},
+    ]
+    documents = [FakeDocument(str(i)) for i in range(4)]
+
+    results = insert_all(batcher, *documents)
+
+    assert results[0] is documents[0]
+    assert results[2] is documents[2]
+    assert isinstance(results[1], DuplicateKeyError)
+    assert results[1].code == 11000
+    assert isinstance(results[3], WriteError)
+    assert not isinstance(results[3], DuplicateKeyError)
+    assert results[3].details["errmsg"] == "Document failed validation"
+
+
+@pytest.mark.parametrize("code", sorted(writes.DUPLICATE_KEY_ERROR_CODES))
+def test_every_duplicate_key_code_is_a_duplicate_key_error(code):
+    batcher = InsertBatcher(window=0.01, max_documents=100)
+    FakeDocument.collection.write_errors = [{"index": 0, "code": code}]
+
+    (result,) = insert_all(batcher, FakeDocument("a"))
+
+    assert isinstance(result, DuplicateKeyError)
+
+
+def test_other_failures_reach_every_caller():
+    batcher = InsertBatcher(window=0.01, max_documents=100)
+    error = ConnectionError("connection lost")
+    FakeDocument.collection.error = error
+
+    results = insert_all(batcher, FakeDocument("a"), FakeDocument("b"))
+
+    assert results == [error, error]
+
+
+def test_cancelled_caller_does_not_break_the_batch():
+    batcher = InsertBatcher(window=0.05, max_documents=100)
+    documents = [FakeDocument("a"), FakeDocument("b")]
+
+    async def main():
+        gone = asyncio.create_task(batcher.insert(documents[0]))
+        kept = asyncio.create_task(batcher.insert(documents[1]))
+        await asyncio.sleep(0)
+        gone.cancel()
+        return await kept
+
+    assert asyncio.run(main()) is documents[1]
+    # The cancelled caller's document is still written
+    assert len(FakeDocument.collection.calls[0]) == 2
+
+
+def test_write_concern_is_applied():
+    write_concern = WriteConcern(w="majority", j=True)
+    batcher = InsertBatcher(window=0.01, max_documents=100, write_concern=write_concern)
+
+    insert_all(batcher, FakeDocument("a"))
+
+    assert FakeDocument.collection.write_concern is write_concern
+
+
+def test_stop_writes_queued_inserts():
+    batcher = InsertBatcher(window=10, max_documents=100)
+    document = FakeDocument("a")
+
+    async def main():
+        task = asyncio.create_task(batcher.insert(document))
+        await asyncio.sleep(0)
+        await batcher.stop()
+        return await asyncio.wait_for(task, 1)
+
+    assert asyncio.run(main()) is document
+    assert len(FakeDocument.collection.calls) == 1
+
+
+def test_disabled_batching_inserts_directly(monkeypatch):
+    monkeypatch.setattr(settings, "INSERT_BATCHING_ENABLED", False)
+    batcher = InsertBatcher(window=0.01, max_documents=100)
+    document = FakeDocument("a")
+
+    (result,) = insert_all(batcher, document)
+
+    assert result is document
+    assert document.inserted
+    assert FakeDocument.collection.calls == []
+
+
+@pytest.mark.parametrize(
+    "w, journal, expected",
+    [
+        (None, None, None),
+        ("majority", None, WriteConcern(w="majority")),
+        ("2", True, WriteConcern(w=2, j=True)),
+        (None, False, WriteConcern(j=False)),
+    ],
+)
+def test_build_write_concern(monkeypatch, w, journal, expected):
+    monkeypatch.setattr(settings, "INSERT_BATCH_WRITE_CONCERN", w)
+    monkeypatch.setattr(settings, "INSERT_BATCH_JOURNAL", journal)
+
+    assert build_write_concern() == expected